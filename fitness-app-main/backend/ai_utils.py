@@ -1,34 +1,188 @@
 # ai_utils.py
+import hashlib
+import logging
 import os
+import re
+from typing import AsyncIterator, Optional
+
+import httpx
+from cachetools import TTLCache
 from dotenv import load_dotenv
-from openai import OpenAI
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+from metrics_utils import time_llm
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "gpt-5")  # or "gpt-4o-mini" if gpt-5 not yet deployed
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", 30))
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", 20))
+
+FALLBACK_REPLY = "⚠️ AI assistant unavailable right now."
+
+
+class ChatStreamInterrupted(Exception):
+    """The upstream stream failed after part of the reply was already yielded"""
+
+# Replies to generic questions are cached by normalized prompt. A threshold > 0
+# also serves near-duplicates: prompts whose word sets overlap at least that
+# much (Jaccard similarity) with a cached one.
+AI_CACHE_TTL = int(os.getenv("AI_CACHE_TTL", 6 * 3600))
+AI_CACHE_SIZE = int(os.getenv("AI_CACHE_SIZE", 2000))
+AI_CACHE_FUZZY_THRESHOLD = float(os.getenv("AI_CACHE_FUZZY_THRESHOLD", 0))
+
+# Initialize client (one pooled async client per process). OPENAI_BASE_URL can
+# point it at any OpenAI-compatible server, e.g. a local fake for testing.
+client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    base_url=os.getenv("OPENAI_BASE_URL") or None,
+    timeout=OPENAI_TIMEOUT,
+    max_retries=1,
+    http_client=DefaultAsyncHttpxClient(
+        limits=httpx.Limits(
+            max_connections=OPENAI_MAX_CONNECTIONS,
+            max_keepalive_connections=OPENAI_MAX_CONNECTIONS
+        )
+    )
+)
+
+
+async def close_client():
+    """Close the pooled OpenAI connections"""
+    await client.close()
+
+
+# key -> (system_message, prompt words, reply)
+_response_cache = TTLCache(maxsize=AI_CACHE_SIZE, ttl=AI_CACHE_TTL)
+_response_cache_stats = {"hits": 0, "fuzzy_hits": 0, "misses": 0}
+
+_NON_WORD = re.compile(r"[^a-z0-9\s]+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace"""
+    return " ".join(_NON_WORD.sub(" ", text.lower()).split())
+
+
+def _cache_key(system_message: str, normalized: str) -> str:
+    return hashlib.sha1(f"{system_message}\x00{normalized}".encode()).hexdigest()
+
+
+def _cache_lookup(system_message: str, normalized: str) -> Optional[str]:
+    entry = _response_cache.get(_cache_key(system_message, normalized))
+    if entry:
+        _response_cache_stats["hits"] += 1
+        return entry[2]
+
+    if AI_CACHE_FUZZY_THRESHOLD > 0:
+        words = frozenset(normalized.split())
+        best_score, best_reply = 0.0, None
+        for cached_system, cached_words, reply in list(_response_cache.values()):
+            if cached_system != system_message or not words:
+                continue
+            score = len(words & cached_words) / len(words | cached_words)
+            if score > best_score:
+                best_score, best_reply = score, reply
+        if best_reply is not None and best_score >= AI_CACHE_FUZZY_THRESHOLD:
+            _response_cache_stats["fuzzy_hits"] += 1
+            return best_reply
+
+    _response_cache_stats["misses"] += 1
+    return None
+
+
+def _cache_store(system_message: str, normalized: str, reply: str) -> None:
+    if reply and reply != FALLBACK_REPLY:
+        _response_cache[_cache_key(system_message, normalized)] = (
+            system_message, frozenset(normalized.split()), reply
+        )
+
+
+def get_response_cache_stats() -> dict:
+    """Hit-rate metrics for the AI response cache"""
+    hits = _response_cache_stats["hits"] + _response_cache_stats["fuzzy_hits"]
+    total = hits + _response_cache_stats["misses"]
+    return {
+        **_response_cache_stats,
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+        "size": len(_response_cache),
+        "max_size": AI_CACHE_SIZE,
+        "ttl_seconds": AI_CACHE_TTL,
+        "fuzzy_threshold": AI_CACHE_FUZZY_THRESHOLD
+    }
 
-# Initialize client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
 class GPTChat:
     def __init__(self, system_message="You are FitDesert AI, a professional fitness assistant."):
         self.system_message = system_message
 
-    async def send_message(self, user_message: str):
+    def _request(self, user_message: str, timeout: Optional[float]) -> dict:
+        return dict(
+            model=OPENAI_MODEL,
+            messages=[
+                {"role": "system", "content": self.system_message},
+                {"role": "user", "content": user_message}
+            ],
+            temperature=0.8,
+            max_tokens=400,
+            timeout=timeout or OPENAI_TIMEOUT
+        )
+
+    async def send_message(self, user_message: str, timeout: Optional[float] = None, use_cache: bool = True):
         """
         Send a message to GPT-5 (or GPT-4 if not available yet).
+        Pass use_cache=False for prompts that carry personal context.
         """
+        normalized = normalize_prompt(user_message)
+        if use_cache:
+            cached = _cache_lookup(self.system_message, normalized)
+            if cached:
+                return cached
+
+        try:
+            with time_llm("complete"):
+                response = await client.chat.completions.create(**self._request(user_message, timeout))
+            reply = response.choices[0].message.content.strip()
+            if use_cache:
+                _cache_store(self.system_message, normalized, reply)
+            return reply
+
+        except Exception as e:
+            logger.error("GPT error: %s", e)
+            return FALLBACK_REPLY
+
+    async def stream_message(
+        self, user_message: str, timeout: Optional[float] = None, use_cache: bool = True
+    ) -> AsyncIterator[str]:
+        """
+        Same as send_message, but yields the reply token by token as it arrives.
+        A cached reply is yielded in one piece. Raises ChatStreamInterrupted if
+        the upstream call fails after some tokens were yielded.
+        """
+        normalized = normalize_prompt(user_message)
+        if use_cache:
+            cached = _cache_lookup(self.system_message, normalized)
+            if cached:
+                yield cached
+                return
+
+        sent_any = False
+        tokens = []
         try:
-            response = client.chat.completions.create(
-                model="gpt-5",  # or "gpt-4o-mini" if gpt-5 not yet deployed
-                messages=[
-                    {"role": "system", "content": self.system_message},
-                    {"role": "user", "content": user_message}
-                ],
-                temperature=0.8,
-                max_tokens=400
-            )
-            return response.choices[0].message.content.strip()
+            with time_llm("stream"):
+                stream = await client.chat.completions.create(**self._request(user_message, timeout), stream=True)
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        sent_any = True
+                        tokens.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            if use_cache:
+                _cache_store(self.system_message, normalized, "".join(tokens).strip())
 
         except Exception as e:
-            print("GPT error:", e)
-            return "⚠️ AI assistant unavailable right now."
+            logger.error("GPT error: %s", e)
+            if sent_any:
+                raise ChatStreamInterrupted(str(e)) from e
+            yield FALLBACK_REPLY
@@ -0,0 +1,234 @@
+# analytics_utils.py
+"""
+Member engagement features and churn-risk scores.
+
+For each gym, the last ANALYTICS_HISTORY_DAYS of attendance are exported in
+EXPORT_CHUNK_SIZE chunks into a pandas frame, and per-member features are
+computed with vectorized group-bys (off the event loop):
+
+    visits_30d, visits_90d, visits_per_week, days_since_last_visit,
+    current_streak_weeks, longest_streak_weeks (consecutive weeks with a visit),
+    avg_session_minutes (check-in to check-out), days_to_expiry
+
+They are combined into a churn_risk in [0, 1] (a logistic score; higher means
+more likely to lapse) and written back to members with bulk_write:
+
+    {churn_risk, engagement: {...features}, churn_scored_at}
+
+GET /api/members?sort=churn_risk lists the riskiest members first. Scoring
+reads a year of attendance per gym, so it runs outside the API, from a daily
+cron job:
+
+    python -m analytics_utils churn [--gym GYM_ID]
+
+A single-process deployment can instead set CHURN_SCORE_INTERVAL (seconds) to
+rescore in the API process; it defaults to 0 (off), because every API worker
+would otherwise run its own copy.
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+
+from archive_utils import archive_cutoff, archive_rows
+from db_utils import connect_from_env
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_HISTORY_DAYS = int(os.environ.get("ANALYTICS_HISTORY_DAYS", 365))
+EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 50000))
+SCORE_WRITE_BATCH = 1000
+CHURN_SCORE_INTERVAL = int(os.environ.get("CHURN_SCORE_INTERVAL", 0))
+
+# Sessions longer than this are treated as a missed check-out
+MAX_SESSION_MINUTES = 6 * 60
+
+# Logistic weights for the churn score (hand-tuned; intercept first)
+CHURN_WEIGHTS = {
+    "intercept": -1.5,
+    "days_since_last_visit": 0.06,   # per day, capped at 60
+    "visits_per_week": -0.5,         # capped at 5
+    "decline": 1.2,                  # 1 - (last 30 days vs the 90-day average), 0-1
+    "expiring": 1.0,                 # expires within 14 days or already expired
+    "current_streak_weeks": -0.1,    # capped at 12
+}
+
+FEATURES = [
+    "visits_30d", "visits_90d", "visits_per_week", "days_since_last_visit",
+    "current_streak_weeks", "longest_streak_weeks", "avg_session_minutes", "days_to_expiry",
+]
+COUNT_FEATURES = {"visits_30d", "visits_90d", "current_streak_weeks", "longest_streak_weeks"}
+
+_WEEK_ORIGIN = pd.Timestamp("1970-01-05", tz="UTC")  # a Monday
+
+
+async def _export_attendance(db: AsyncIOMotorDatabase, gym_id: str, since: datetime) -> pd.DataFrame:
+    """A gym's attendance since a date (archived months included), read in chunks into one frame"""
+    columns = ["_id", "member_id", "check_in_time", "check_out_time"]
+    cursor = db.attendance.find(
+        {"gym_id": gym_id, "check_in_time": {"$gte": since}},
+        {c: 1 for c in columns}
+    ).batch_size(EXPORT_CHUNK_SIZE)
+    frames = []
+    while chunk := await cursor.to_list(EXPORT_CHUNK_SIZE):
+        frames.append(pd.DataFrame(chunk, columns=columns))
+
+    start = since.strftime("%Y-%m-%d")
+    if start < archive_cutoff():
+        archived = await archive_rows(gym_id, start=start, columns=columns)
+        frames.append(archived.to_pandas())
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    # a row can be in both places if compaction was interrupted
+    return pd.concat(frames, ignore_index=True).drop_duplicates("_id")
+
+
+def _utc(series: pd.Series) -> pd.Series:
+    # Mongo returns naive UTC datetimes unless the client is tz_aware
+    values = pd.to_datetime(series, errors="coerce")
+    return values.dt.tz_localize("UTC") if values.dt.tz is None else values.dt.tz_convert("UTC")
+
+
+def _weeks(times: pd.Series) -> pd.Series:
+    return ((times - _WEEK_ORIGIN).dt.days // 7).astype("int64")
+
+
+def compute_features(attendance: pd.DataFrame, members: pd.DataFrame, now: datetime) -> pd.DataFrame:
+    """Per-member features and churn_risk (indexed by member _id) for one gym"""
+    now = pd.Timestamp(now).tz_convert("UTC") if pd.Timestamp(now).tzinfo else pd.Timestamp(now, tz="UTC")
+    features = pd.DataFrame(index=members.index)
+
+    a = attendance.dropna(subset=["member_id", "check_in_time"]).copy()
+    a = a[a["member_id"].isin(members.index)]
+    a["check_in_time"] = _utc(a["check_in_time"])
+    a["check_out_time"] = _utc(a["check_out_time"])
+    age_days = (now - a["check_in_time"]).dt.total_seconds() / 86400
+    by_member = a.groupby("member_id")
+
+    features["visits_30d"] = (age_days <= 30).groupby(a["member_id"]).sum()
+    features["visits_90d"] = (age_days <= 90).groupby(a["member_id"]).sum()
+    last_visit = by_member["check_in_time"].max()
+
+    minutes = (a["check_out_time"] - a["check_in_time"]).dt.total_seconds() / 60
+    minutes = minutes.where((minutes > 0) & (minutes <= MAX_SESSION_MINUTES))
+    features["avg_session_minutes"] = minutes.groupby(a["member_id"]).mean()
+
+    # streaks: runs of consecutive weeks with at least one visit
+    weeks = pd.DataFrame({"member_id": a["member_id"], "week": _weeks(a["check_in_time"])})
+    weeks = weeks.drop_duplicates().sort_values(["member_id", "week"])
+    new_run = (weeks["member_id"] != weeks["member_id"].shift()) | (weeks["week"].diff() != 1)
+    weeks["run_length"] = weeks.groupby(new_run.cumsum())["week"].transform("size")
+    features["longest_streak_weeks"] = weeks.groupby("member_id")["run_length"].max()
+    last = weeks.groupby("member_id").tail(1).set_index("member_id")
+    current_week = int((now - _WEEK_ORIGIN).days // 7)
+    # a streak is still current if the member came this week or last week
+    features["current_streak_weeks"] = last["run_length"].where(last["week"] >= current_week - 1, 0)
+
+    features = features.fillna({
+        "visits_30d": 0, "visits_90d": 0, "longest_streak_weeks": 0, "current_streak_weeks": 0,
+    })
+
+    joined = _utc(members["joining_date"]).fillna(now)
+    tenure_days = ((now - joined).dt.total_seconds() / 86400).clip(lower=7, upper=90)
+    features["visits_per_week"] = features["visits_90d"] / (tenure_days / 7)
+
+    # never visited (in the window): count from joining, capped at the window
+    since_last = (now - last_visit.reindex(features.index)).dt.total_seconds() / 86400
+    since_joined = ((now - joined).dt.total_seconds() / 86400).clip(upper=ANALYTICS_HISTORY_DAYS)
+    features["days_since_last_visit"] = since_last.fillna(since_joined).clip(lower=0)
+
+    expiry = _utc(members["membership_expiry"])
+    features["days_to_expiry"] = (expiry - now).dt.total_seconds() / 86400
+
+    # score
+    w = CHURN_WEIGHTS
+    # last 30 days against the 90-day average; no recent history counts as steady
+    trend = (features["visits_30d"] / (features["visits_90d"] / 3).replace(0, np.nan)).fillna(1.0)
+    z = (
+        w["intercept"]
+        + w["days_since_last_visit"] * features["days_since_last_visit"].clip(upper=60)
+        + w["visits_per_week"] * features["visits_per_week"].clip(upper=5)
+        + w["decline"] * (1 - trend).clip(0, 1)
+        + w["expiring"] * (features["days_to_expiry"].fillna(0) <= 14)
+        + w["current_streak_weeks"] * features["current_streak_weeks"].clip(upper=12)
+    )
+    features["churn_risk"] = 1 / (1 + np.exp(-z.astype("float64")))
+    return features
+
+
+def _feature_value(name: str, value):
+    if pd.isna(value):
+        return None
+    return int(value) if name in COUNT_FEATURES else float(value)
+
+
+def _score_updates(features: pd.DataFrame, now: datetime) -> List[UpdateOne]:
+    rounded = features.round({"visits_per_week": 2, "avg_session_minutes": 1, "days_since_last_visit": 1,
+                              "days_to_expiry": 1, "churn_risk": 4})
+    updates = []
+    for member_id, row in zip(rounded.index, rounded.to_dict("records")):
+        engagement = {f: _feature_value(f, row[f]) for f in FEATURES}
+        updates.append(UpdateOne(
+            {"_id": member_id},
+            {"$set": {"churn_risk": float(row["churn_risk"]), "engagement": engagement, "churn_scored_at": now}}
+        ))
+    return updates
+
+
+async def score_gym(db: AsyncIOMotorDatabase, gym_id: str, now: Optional[datetime] = None) -> int:
+    """Recompute engagement features and churn_risk for one gym's members; returns members scored"""
+    now = now or datetime.now(timezone.utc)
+    member_docs = await db.members.find(
+        {"gym_id": gym_id}, {"joining_date": 1, "membership_expiry": 1}
+    ).to_list(None)
+    if not member_docs:
+        return 0
+    members = pd.DataFrame(member_docs, columns=["_id", "joining_date", "membership_expiry"]).set_index("_id")
+    attendance = await _export_attendance(db, gym_id, now - timedelta(days=ANALYTICS_HISTORY_DAYS))
+
+    loop = asyncio.get_running_loop()
+    features = await loop.run_in_executor(None, compute_features, attendance, members, now)
+    updates = _score_updates(features, now)
+    for start in range(0, len(updates), SCORE_WRITE_BATCH):
+        await db.members.bulk_write(updates[start:start + SCORE_WRITE_BATCH], ordered=False)
+    return len(updates)
+
+
+async def score_all_gyms(db: AsyncIOMotorDatabase, now: Optional[datetime] = None) -> Dict[str, int]:
+    """score_gym for every gym, one at a time; returns members scored per gym"""
+    counts = {}
+    for gym_id in await db.gyms.distinct("_id"):
+        counts[gym_id] = await score_gym(db, gym_id, now)
+    return counts
+
+
+async def run_churn_worker(db: AsyncIOMotorDatabase, interval: int = CHURN_SCORE_INTERVAL) -> None:
+    """Rescore every gym every interval seconds until cancelled"""
+    while True:
+        try:
+            counts = await score_all_gyms(db)
+            logger.info("Churn scores refreshed for %d members in %d gyms", sum(counts.values()), len(counts))
+        except Exception as e:
+            logger.error("Churn scoring failed: %s", e)
+        await asyncio.sleep(interval)
+
+
+async def _main(args) -> None:
+    db = connect_from_env()
+    if args.command == "churn":
+        counts = {args.gym: await score_gym(db, args.gym)} if args.gym else await score_all_gyms(db)
+        print(f"✅ scored {sum(counts.values())} members in {len(counts)} gyms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Member engagement and churn analytics")
+    parser.add_argument("command", choices=["churn"])
+    parser.add_argument("--gym", help="Only score this gym_id's members")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,342 @@
+# archive_utils.py
+"""
+Columnar archive for old attendance.
+
+Attendance from months that ended ATTENDANCE_HOT_DAYS or more ago is moved out
+of the attendance collection into one Arrow IPC file per gym per month:
+
+    <ARCHIVE_DIR>/attendance/<gym_id>/<YYYY-MM>.arrow
+        _id, member_id, gym_id, date, check_in_time, check_out_time
+
+Files are uncompressed and memory-mapped on read, so a range query only pages
+in the months it touches. Daily rollups stay in MongoDB, so gym-stats counts
+don't change. Readers combine the archive with the hot collection (rows still
+waiting to be compacted are read from MongoDB), and bulk ingest rejects scans
+for months already archived. Compaction runs from a daily cron job:
+
+    python -m archive_utils compact [--gym GYM_ID]
+
+(ARCHIVE_INTERVAL, in seconds, can run it in a single-process API instead; it
+defaults to 0, off.) Every rewrite of a gym's files holds an exclusive flock
+on <gym_id>/.lock, so the CLI, API workers and deletes don't lose each other's
+changes. Files are written to a unique temp file and renamed into place.
+"""
+import argparse
+import asyncio
+import fcntl
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.compute as pc
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from db_utils import connect_from_env, decode_cursor, encode_cursor, keyset_query, keyset_sort
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_DIR = Path(os.environ.get("ARCHIVE_DIR", Path(__file__).parent / ".archive"))
+ATTENDANCE_HOT_DAYS = int(os.environ.get("ATTENDANCE_HOT_DAYS", 180))
+ARCHIVE_INTERVAL = int(os.environ.get("ARCHIVE_INTERVAL", 0))
+ARCHIVE_DELETE_BATCH = 5000
+
+ATTENDANCE_SCHEMA = pa.schema([
+    ("_id", pa.string()),
+    ("member_id", pa.string()),
+    ("gym_id", pa.string()),
+    ("date", pa.string()),
+    # naive, like the datetimes MongoDB hands back
+    ("check_in_time", pa.timestamp("ms")),
+    ("check_out_time", pa.timestamp("ms")),
+])
+
+
+def archive_cutoff(today: Optional[date] = None) -> str:
+    """First day (YYYY-MM-DD) of the oldest month still kept in MongoDB"""
+    today = today or datetime.now(timezone.utc).date()
+    return (today - timedelta(days=ATTENDANCE_HOT_DAYS)).strftime("%Y-%m-01")
+
+
+def _gym_dir(gym_id: str) -> Path:
+    return ARCHIVE_DIR / "attendance" / gym_id
+
+
+def _month_path(gym_id: str, month: str) -> Path:
+    return _gym_dir(gym_id) / f"{month}.arrow"
+
+
+@contextmanager
+def _gym_lock(gym_id: str):
+    """Exclusive lock on a gym's archive files, across threads and processes (blocks)"""
+    directory = _gym_dir(gym_id)
+    directory.mkdir(parents=True, exist_ok=True)
+    with open(directory / ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        yield
+
+
+def archived_months(gym_id: str, start: Optional[str] = None, end: Optional[str] = None) -> List[str]:
+    """Archived YYYY-MM months for a gym, oldest first (optionally within a YYYY-MM-DD range)"""
+    months = sorted(p.stem for p in _gym_dir(gym_id).glob("*.arrow"))
+    return [m for m in months if (not start or m >= start[:7]) and (not end or m <= end[:7])]
+
+
+def _read_month(path: Path) -> pa.Table:
+    with pa.memory_map(str(path)) as source:
+        return pa.ipc.open_file(source).read_all()
+
+
+def _save_month(path: Path, table: pa.Table) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.stem}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, ATTENDANCE_SCHEMA) as writer:
+            writer.write_table(table)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def read_archive(
+    gym_id: str,
+    months: List[str],
+    *,
+    member_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    columns: Optional[List[str]] = None
+) -> pa.Table:
+    """Archived rows of some months, filtered by member and date range (blocking; run off the loop)"""
+    tables = []
+    for month in months:
+        path = _month_path(gym_id, month)
+        if not path.exists():
+            continue
+        table = _read_month(path)
+        mask = None
+        for condition in (
+            pc.equal(table["member_id"], member_id) if member_id else None,
+            pc.greater_equal(table["date"], start) if start else None,
+            pc.less_equal(table["date"], end) if end else None,
+        ):
+            if condition is not None:
+                mask = condition if mask is None else pc.and_(mask, condition)
+        if mask is not None:
+            table = table.filter(mask)
+        tables.append(table.select(columns) if columns else table)
+    if not tables:
+        empty = ATTENDANCE_SCHEMA.empty_table()
+        return empty.select(columns) if columns else empty
+    return pa.concat_tables(tables)
+
+
+def _write_month(gym_id: str, month: str, rows: List[dict]) -> None:
+    """Merge rows into a month's file (rows win over archived ones with the same _id)"""
+    path = _month_path(gym_id, month)
+    table = pa.Table.from_pylist(rows, schema=ATTENDANCE_SCHEMA)
+    with _gym_lock(gym_id):
+        if path.exists():
+            existing = _read_month(path)
+            existing = existing.filter(pc.invert(pc.is_in(existing["_id"], value_set=table["_id"])))
+            table = pa.concat_tables([existing, table])
+        _save_month(path, table.sort_by([("check_in_time", "ascending"), ("_id", "ascending")]))
+
+
+def _next_month(month: str) -> str:
+    year, mon = map(int, month.split("-"))
+    return f"{year + mon // 12:04d}-{mon % 12 + 1:02d}"
+
+
+async def compact_gym(db: AsyncIOMotorDatabase, gym_id: str, today: Optional[date] = None) -> int:
+    """Move a gym's attendance before archive_cutoff into month files; returns rows archived"""
+    cutoff = archive_cutoff(today)
+    oldest = await db.attendance.find_one(
+        {"gym_id": gym_id, "date": {"$lt": cutoff}}, {"date": 1}, sort=[("date", 1)]
+    )
+    if not oldest:
+        return 0
+
+    loop = asyncio.get_running_loop()
+    archived, month = 0, oldest["date"][:7]
+    while month < cutoff[:7]:
+        rows = await db.attendance.find(
+            {"gym_id": gym_id, "date": {"$gte": f"{month}-01", "$lt": f"{_next_month(month)}-01"}},
+            {name: 1 for name in ATTENDANCE_SCHEMA.names}
+        ).to_list(None)
+        if rows:
+            # written before the rows are deleted, so a crash at worst leaves
+            # rows in both places (readers dedupe, the next run merges)
+            await loop.run_in_executor(None, _write_month, gym_id, month, rows)
+            ids = [row["_id"] for row in rows]
+            for start in range(0, len(ids), ARCHIVE_DELETE_BATCH):
+                await db.attendance.delete_many({"_id": {"$in": ids[start:start + ARCHIVE_DELETE_BATCH]}})
+            archived += len(rows)
+        month = _next_month(month)
+    return archived
+
+
+async def compact_all_gyms(db: AsyncIOMotorDatabase, today: Optional[date] = None) -> Dict[str, int]:
+    """compact_gym for every gym, one at a time; returns rows archived per gym"""
+    counts = {}
+    for gym_id in await db.gyms.distinct("_id"):
+        counts[gym_id] = await compact_gym(db, gym_id, today)
+    return counts
+
+
+async def run_archive_worker(db: AsyncIOMotorDatabase, interval: int = ARCHIVE_INTERVAL) -> None:
+    """Compact old attendance every interval seconds until cancelled"""
+    while True:
+        try:
+            counts = await compact_all_gyms(db)
+            if any(counts.values()):
+                logger.info("Archived %d attendance rows", sum(counts.values()))
+        except Exception as e:
+            logger.error("Attendance archiving failed: %s", e)
+        await asyncio.sleep(interval)
+
+
+# ==================== READS ====================
+
+async def archive_rows(
+    gym_id: str,
+    *,
+    member_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    columns: Optional[List[str]] = None
+) -> pa.Table:
+    """read_archive over every archived month in a YYYY-MM-DD range, off the event loop"""
+    months = archived_months(gym_id, start, end)
+    if not months:
+        return read_archive(gym_id, [], columns=columns)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        None, lambda: read_archive(gym_id, months, member_id=member_id, start=start, end=end, columns=columns)
+    )
+
+
+def _merge(hot: List[dict], archived: List[dict]) -> List[dict]:
+    hot_ids = {row["_id"] for row in hot}
+    return hot + [row for row in archived if row["_id"] not in hot_ids]
+
+
+async def member_history(
+    db: AsyncIOMotorDatabase,
+    member_id: str,
+    gym_id: str,
+    *,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: int = 30,
+    projection: Optional[dict] = None
+) -> List[dict]:
+    """
+    A member's attendance in a date range, newest first, from MongoDB and the
+    archive. The projection must include check_in_time (the merge sorts on it).
+    """
+    query = {"member_id": member_id}
+    if start or end:
+        query["date"] = {**({"$gte": start} if start else {}), **({"$lte": end} if end else {})}
+    rows = await db.attendance.find(query, projection).sort("check_in_time", -1).limit(limit).to_list(limit)
+
+    # archived months newest first, until the page is full
+    columns = [c for c in ATTENDANCE_SCHEMA.names if not projection or c == "_id" or c in projection]
+    loop = asyncio.get_running_loop()
+    for month in reversed(archived_months(gym_id, start, end)):
+        if len(rows) >= limit:
+            break
+        table = await loop.run_in_executor(
+            None, lambda: read_archive(gym_id, [month], member_id=member_id, start=start, end=end, columns=columns)
+        )
+        rows = _merge(rows, table.to_pylist())
+    rows.sort(key=lambda row: row["check_in_time"], reverse=True)
+    return rows[:limit]
+
+
+def _check_in_order(row: dict):
+    # archived times are naive; hot ones are aware when the client is tz_aware
+    return row["check_in_time"].replace(tzinfo=None), row["_id"]
+
+
+async def archived_day_page(
+    db: AsyncIOMotorDatabase,
+    gym_id: str,
+    day: str,
+    limit: int,
+    after: Optional[str]
+):
+    """
+    A page of one day's records before the archive cutoff in check-in order,
+    like fetch_page; (docs, next cursor). Rows not compacted yet are read from
+    MongoDB and win over archived copies with the same _id.
+    """
+    query = keyset_query({"gym_id": gym_id, "date": day}, "check_in_time", 1, after)
+    hot = await db.attendance.find(query).sort(keyset_sort("check_in_time", 1)).limit(limit + 1).to_list(limit + 1)
+
+    archived = (await archive_rows(gym_id, start=day, end=day)).to_pylist()
+    if after:
+        value, doc_id = decode_cursor(after)
+        archived = [r for r in archived if _check_in_order(r) > (value.replace(tzinfo=None), doc_id)]
+
+    rows = sorted(_merge(hot, archived), key=_check_in_order)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1], "check_in_time")
+    return rows, next_cursor
+
+
+# ==================== DELETES ====================
+
+def _remove_gym_files(gym_id: str) -> None:
+    if not _gym_dir(gym_id).exists():
+        return
+    # waits for an in-flight rewrite to finish before removing its files
+    with _gym_lock(gym_id):
+        shutil.rmtree(_gym_dir(gym_id), ignore_errors=True)
+
+
+async def remove_gym_archive(gym_id: str) -> None:
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, _remove_gym_files, gym_id)
+
+
+def _remove_member_rows(gym_id: str, member_id: str) -> None:
+    if not _gym_dir(gym_id).exists():
+        return
+    with _gym_lock(gym_id):
+        for month in archived_months(gym_id):
+            path = _month_path(gym_id, month)
+            table = _read_month(path)
+            keep = pc.not_equal(table["member_id"], member_id)
+            if pc.all(keep).as_py():
+                continue
+            _save_month(path, table.filter(keep))
+
+
+async def remove_member_archive(gym_id: str, member_id: str) -> None:
+    """Rewrite a gym's month files without a deleted member's rows"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, _remove_member_rows, gym_id, member_id)
+
+
+async def _main(args) -> None:
+    db = connect_from_env()
+    if args.command == "compact":
+        counts = {args.gym: await compact_gym(db, args.gym)} if args.gym else await compact_all_gyms(db)
+        print(f"✅ archived {sum(counts.values())} attendance rows before {archive_cutoff()} to {ARCHIVE_DIR}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Attendance archive")
+    parser.add_argument("command", choices=["compact"])
+    parser.add_argument("--gym", help="Only compact this gym_id's attendance")
+    asyncio.run(_main(parser.parse_args()))
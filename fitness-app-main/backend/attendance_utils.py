@@ -0,0 +1,278 @@
+# attendance_utils.py
+import asyncio
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from cachetools import TTLCache
+from fastapi import HTTPException
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from archive_utils import archive_cutoff
+from id_utils import new_id
+from models import AttendanceEvent, UserRole, CURRENT_MEMBERSHIP_STATUSES
+from rollup_utils import IST_OFFSET, record_check_in, record_check_out, rebuild_attendance_rollups
+
+# (user_id, gym_id) -> member {_id, status}; short-lived so status changes
+# made elsewhere show up quickly even without explicit invalidation
+MEMBERSHIP_CACHE_TTL = int(os.environ.get("MEMBERSHIP_CACHE_TTL", 30))
+# Results of scans sent with an Idempotency-Key are replayed for this long
+SCAN_IDEMPOTENCY_TTL = int(os.environ.get("SCAN_IDEMPOTENCY_TTL", 600))
+
+# Largest batch /attendance/bulk accepts, and how far ahead of the server clock
+# a kiosk timestamp may be before it is rejected
+MAX_BULK_EVENTS = int(os.environ.get("MAX_BULK_EVENTS", 10000))
+BULK_CLOCK_SKEW = timedelta(minutes=5)
+
+_membership_cache = TTLCache(maxsize=10000, ttl=MEMBERSHIP_CACHE_TTL)
+_scan_results = TTLCache(maxsize=10000, ttl=SCAN_IDEMPOTENCY_TTL)
+_scans_in_flight: Dict[str, asyncio.Future] = {}
+
+
+async def resolve_membership(db: AsyncIOMotorDatabase, user_id: str, gym_id: str) -> dict:
+    """Member (_id, status) for a user at a gym, cached; 404/403 if gym or membership is missing"""
+    cached = _membership_cache.get((user_id, gym_id))
+    if cached:
+        return cached
+
+    member = await db.members.find_one({"user_id": user_id, "gym_id": gym_id}, {"status": 1})
+    if not member:
+        # Only look at the gym to tell "no such gym" apart from "not a member"
+        gym = await db.gyms.find_one({"_id": gym_id}, {"_id": 1})
+        if not gym:
+            raise HTTPException(status_code=404, detail="Gym not found")
+        raise HTTPException(status_code=403, detail="You are not a member of this gym")
+
+    _membership_cache[(user_id, gym_id)] = member
+    return member
+
+
+def invalidate_membership(user_id: str) -> None:
+    """Forget cached memberships for a user"""
+    for key in [k for k in list(_membership_cache.keys()) if k[0] == user_id]:
+        _membership_cache.pop(key, None)
+
+
+async def record_scan(db: AsyncIOMotorDatabase, member_id: str, gym_id: str, date: str, local_time: datetime) -> dict:
+    """
+    Check a member in, or out if already checked in, for the given day.
+    Both steps are single atomic writes on the (member_id, gym_id, date) key, so
+    concurrent scans can't create duplicate rows or check out twice.
+    """
+    key = {"member_id": member_id, "gym_id": gym_id, "date": date}
+    try:
+        before = await db.attendance.find_one_and_update(
+            key,
+            {"$setOnInsert": {"_id": new_id("att"), "check_in_time": local_time, "check_out_time": None}},
+            projection={"check_out_time": 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
+        )
+    except DuplicateKeyError:
+        # Lost an upsert race on the unique index: the other scan inserted the row
+        before = await db.attendance.find_one(key, {"check_out_time": 1})
+
+    if before is None:
+        await record_check_in(db, gym_id, date, local_time)
+        return {"message": "Checked in successfully", "type": "check_in"}
+
+    if await record_member_check_out(db, member_id, gym_id, date, local_time):
+        return {"message": "Checked out successfully", "type": "check_out"}
+
+    raise HTTPException(status_code=400, detail="Already checked in and out for today")
+
+
+async def record_member_check_out(
+    db: AsyncIOMotorDatabase,
+    member_id: str,
+    gym_id: str,
+    date: str,
+    local_time: datetime
+) -> bool:
+    """
+    Check a member out for the given day in one conditional write (so concurrent
+    check-outs can't both count); False if not checked in or already out.
+    """
+    checked_out = await db.attendance.find_one_and_update(
+        {"member_id": member_id, "gym_id": gym_id, "date": date, "check_out_time": None},
+        {"$set": {"check_out_time": local_time}},
+        projection={"_id": 1}
+    )
+    if checked_out:
+        await record_check_out(db, gym_id, date)
+    return bool(checked_out)
+
+
+async def run_idempotent(key: Optional[str], func: Callable[[], Awaitable[dict]]) -> dict:
+    """
+    Run func once per idempotency key: repeats get the stored result and
+    concurrent duplicates wait for the first call. Errors are not stored.
+    """
+    if not key:
+        return await func()
+
+    if key in _scan_results:
+        return _scan_results[key]
+    if key in _scans_in_flight:
+        return await asyncio.shield(_scans_in_flight[key])
+
+    future = asyncio.get_running_loop().create_future()
+    _scans_in_flight[key] = future
+    try:
+        result = await func()
+        _scan_results[key] = result
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved when nobody else is waiting
+        raise
+    finally:
+        _scans_in_flight.pop(key, None)
+
+
+def _event_times(timestamp: datetime):
+    """(UTC time, UTC date, local time) for a kiosk timestamp, truncated to Mongo's millisecond precision"""
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+    timestamp = timestamp.astimezone(timezone.utc)
+    timestamp = timestamp.replace(microsecond=timestamp.microsecond // 1000 * 1000)
+    return timestamp, timestamp.strftime("%Y-%m-%d"), timestamp + IST_OFFSET
+
+
+async def _bulk_upsert(db: AsyncIOMotorDatabase, ops: List[UpdateOne]) -> set:
+    """
+    Unordered bulk upserts, returning the indexes of ops that inserted.
+    Upserts that lose a race on the unique key are retried once as updates.
+    """
+    if not ops:
+        return set()
+    try:
+        result = await db.attendance.bulk_write(ops, ordered=False)
+        return set(result.upserted_ids)
+    except BulkWriteError as e:
+        errors = e.details.get("writeErrors", [])
+        if any(err["code"] != 11000 for err in errors):
+            raise
+        await db.attendance.bulk_write([ops[err["index"]] for err in errors], ordered=False)
+        return {u["index"] for u in e.details.get("upserted", [])}
+
+
+async def ingest_events(db: AsyncIOMotorDatabase, gym_id: str, events: List[AttendanceEvent]) -> dict:
+    """
+    Record a batch of buffered kiosk scans for one gym.
+
+    Members are validated with a single $in lookup. Events are grouped per
+    (member, gym, date): the earliest scan of the day is the check-in and the
+    latest later scan is the check-out, so replaying a batch (or overlapping
+    batches) is idempotent. Writes are two unordered bulk_writes: $min
+    check-in upserts, then check-outs that only move later, on records that were checked in
+    earlier. Returns a result per event in request order.
+    """
+    results: List[dict] = [None] * len(events)
+    now = datetime.now(timezone.utc)
+    # rollups for archived days can't be recounted, so those days are closed
+    cutoff = archive_cutoff(now.date())
+
+    member_ids = list({e.member_id for e in events})
+    members = {
+        m["_id"]: m async for m in db.members.find(
+            {"_id": {"$in": member_ids}, "gym_id": gym_id}, {"status": 1, "role": 1}
+        )
+    }
+
+    # (member_id, date) -> [(local_time, index)]
+    scans = defaultdict(list)
+    for i, event in enumerate(events):
+        member = members.get(event.member_id)
+        utc_time, date, local_time = _event_times(event.timestamp)
+        if member is None or (event.gym_id and event.gym_id != gym_id):
+            error = "Member not found in this gym"
+        elif member.get("role") == UserRole.TRAINER.value:
+            error = "Trainers cannot mark attendance"
+        elif member.get("status") not in CURRENT_MEMBERSHIP_STATUSES:
+            error = "Membership inactive"
+        elif utc_time > now + BULK_CLOCK_SKEW:
+            error = "Timestamp is in the future"
+        elif date < cutoff:
+            error = "Timestamp is older than the attendance archive cutoff"
+        else:
+            scans[(event.member_id, date)].append((local_time, i))
+            continue
+        results[i] = {"index": i, "status": "rejected", "detail": error}
+
+    keys = list(scans)
+    check_ins = [
+        UpdateOne(
+            {"member_id": member_id, "gym_id": gym_id, "date": date},
+            {
+                "$setOnInsert": {"_id": new_id("att"), "check_out_time": None},
+                "$min": {"check_in_time": min(scans[(member_id, date)])[0]}
+            },
+            upsert=True
+        )
+        for member_id, date in keys
+    ]
+    inserted = await _bulk_upsert(db, check_ins)
+
+    # A lone scan that just created its record can only be a check-in
+    check_outs = []
+    for i, (member_id, date) in enumerate(keys):
+        key_scans = scans[(member_id, date)]
+        if len(key_scans) == 1 and i in inserted:
+            continue
+        latest = max(key_scans)[0]
+        check_outs.append(UpdateOne(
+            {
+                "member_id": member_id, "gym_id": gym_id, "date": date,
+                "check_in_time": {"$lt": latest},
+                "$or": [{"check_out_time": None}, {"check_out_time": {"$lt": latest}}]
+            },
+            {"$set": {"check_out_time": latest}}
+        ))
+    if check_outs:
+        await db.attendance.bulk_write(check_outs, ordered=False)
+
+    # Read the records back to tell each event what it ended up as
+    records = {}
+    if keys:
+        async for record in db.attendance.find(
+            {"gym_id": gym_id, "member_id": {"$in": list({k[0] for k in keys})},
+             "date": {"$in": list({k[1] for k in keys})}},
+            {"member_id": 1, "date": 1, "check_in_time": 1, "check_out_time": 1}
+        ):
+            records[(record["member_id"], record["date"])] = record
+
+    counts = {"check_in": 0, "check_out": 0, "duplicate": 0}
+    for key, key_scans in scans.items():
+        record = records.get(key, {})
+        check_in, check_out = record.get("check_in_time"), record.get("check_out_time")
+        for local_time, i in key_scans:
+            naive = local_time.replace(tzinfo=None)
+            if check_in is not None and naive == check_in.replace(tzinfo=None):
+                status = "check_in"
+            elif check_out is not None and naive == check_out.replace(tzinfo=None):
+                status = "check_out"
+            else:
+                status = "duplicate"
+            counts[status] += 1
+            results[i] = {"index": i, "status": status}
+
+    # Scans can move a day's check-in hour or land out of order, so recount
+    # the touched days instead of $inc-ing
+    if keys:
+        await rebuild_attendance_rollups(db, gym_id, {date for _, date in keys})
+
+    rejected = len(events) - sum(counts.values())
+    return {
+        "received": len(events),
+        "accepted": len(events) - rejected,
+        "rejected": rejected,
+        "check_ins": counts["check_in"],
+        "check_outs": counts["check_out"],
+        "duplicates": counts["duplicate"],
+        "results": results,
+    }
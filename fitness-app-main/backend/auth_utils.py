@@ -2,23 +2,117 @@ from fastapi import HTTPException, Request, Depends
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from typing import Optional
 from datetime import datetime, timezone
+from cachetools import TTLCache
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import bcrypt
+import httpx
+import logging
+import os
+import secrets
+from http_utils import get_with_retry
 from models import User, UserRole
 
-async def hash_password(password: str) -> str:
-    """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt()
+logger = logging.getLogger(__name__)
+
+# bcrypt is CPU bound (~250 ms at cost 12) and releases the GIL, so it runs on a
+# small dedicated pool. At most BCRYPT_MAX_PENDING calls may be running or queued;
+# callers that wait longer than BCRYPT_QUEUE_TIMEOUT for a slot get a 503.
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+BCRYPT_WORKERS = int(os.environ.get('BCRYPT_WORKERS', min(4, os.cpu_count() or 1)))
+BCRYPT_MAX_PENDING = int(os.environ.get('BCRYPT_MAX_PENDING', BCRYPT_WORKERS * 8))
+BCRYPT_QUEUE_TIMEOUT = float(os.environ.get('BCRYPT_QUEUE_TIMEOUT', 5))
+
+_bcrypt_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_bcrypt_slots = asyncio.Semaphore(BCRYPT_MAX_PENDING)
+
+# Resolved sessions are cached per process so authenticated requests skip the
+# session + user lookups. Entries live at most SESSION_CACHE_TTL seconds, which
+# also bounds how stale another worker's view can be after a logout.
+SESSION_CACHE_TTL = int(os.environ.get('SESSION_CACHE_TTL', 60))
+SESSION_CACHE_SIZE = int(os.environ.get('SESSION_CACHE_SIZE', 10000))
+
+_session_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+_session_cache_stats = {"hits": 0, "misses": 0}
+
+# Emergent OAuth session-data service; validated session IDs are remembered
+# briefly so client retries and double submits don't hit it again
+OAUTH_SESSION_URL = os.environ.get(
+    'OAUTH_SESSION_URL',
+    "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data"
+)
+OAUTH_SESSION_CACHE_TTL = int(os.environ.get('OAUTH_SESSION_CACHE_TTL', 60))
+
+_oauth_session_cache = TTLCache(maxsize=1000, ttl=OAUTH_SESSION_CACHE_TTL)
+
+# owner_id -> the manager's gym, trimmed to MANAGER_GYM_PROJECTION. Head admin
+# edits call invalidate_gym(); the TTL covers changes made by other workers.
+MANAGER_GYM_CACHE_TTL = int(os.environ.get('MANAGER_GYM_CACHE_TTL', 300))
+MANAGER_GYM_PROJECTION = {"name": 1, "is_active": 1, "subscription_plan": 1, "subscription_expiry": 1}
+
+_manager_gym_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=MANAGER_GYM_CACHE_TTL)
+
+async def _run_bcrypt(func, *args):
+    """Run a bcrypt call on the worker pool, rejecting callers when it is saturated"""
+    # asyncio.timeout cancels the acquire in place; wait_for on 3.11 wraps it
+    # in a task and can drop a permit when the timeout races the wakeup
+    try:
+        async with asyncio.timeout(BCRYPT_QUEUE_TIMEOUT):
+            await _bcrypt_slots.acquire()
+    except TimeoutError:
+        raise HTTPException(status_code=503, detail="Server busy, please try again")
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_bcrypt_executor, func, *args)
+    finally:
+        _bcrypt_slots.release()
+
+def _hash_password_sync(password: str) -> str:
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
+def _verify_password_sync(plain_password: str, hashed_password: str) -> bool:
+    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+
+async def hash_password(password: str) -> str:
+    """Hash a password using bcrypt"""
+    return await _run_bcrypt(_hash_password_sync, password)
+
 async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against a hash"""
     if not hashed_password:
         return False
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    return await _run_bcrypt(_verify_password_sync, plain_password, hashed_password)
 
-async def get_current_user(request: Request, db: AsyncIOMotorDatabase) -> Optional[User]:
-    """Get the current authenticated user from session token (header or cookie)."""
+def new_session_token() -> str:
+    """Unguessable bearer token for a new session (ids from new_id are predictable)"""
+    return secrets.token_urlsafe(32)
+
+def shutdown_password_pool() -> None:
+    """Stop the bcrypt worker threads"""
+    _bcrypt_executor.shutdown(wait=False, cancel_futures=True)
+
+async def fetch_oauth_session(session_id: str) -> dict:
+    """Resolve an Emergent OAuth session ID to its session data"""
+    cached = _oauth_session_cache.get(session_id)
+    if cached:
+        return cached
+
+    try:
+        response = await get_with_retry(OAUTH_SESSION_URL, headers={"X-Session-ID": session_id})
+    except httpx.HTTPError:
+        raise HTTPException(status_code=502, detail="Auth service unavailable")
+
+    if response.status_code != 200:
+        raise HTTPException(status_code=401, detail="Invalid session")
+
+    session_data = response.json()
+    _oauth_session_cache[session_id] = session_data
+    return session_data
+
+def get_session_token(request: Request) -> Optional[str]:
+    """Extract the session token from the cookie or Authorization header"""
     session_token = None
 
     # 1️⃣ Try cookie first
@@ -31,15 +125,55 @@ async def get_current_user(request: Request, db: AsyncIOMotorDatabase) -> Option
         if auth_header.lower().startswith('bearer '):  # <-- handles lowercase too
             session_token = auth_header.split(' ', 1)[1].strip()
 
+    return session_token
+
+def invalidate_session(session_token: str) -> None:
+    """Drop a single session from the in-process cache"""
+    _session_cache.pop(session_token, None)
+
+def invalidate_user_sessions(user_id: str) -> None:
+    """Drop every cached session belonging to a user"""
+    for token, (user, _) in list(_session_cache.items()):
+        if user.id == user_id:
+            _session_cache.pop(token, None)
+
+def get_session_cache_stats() -> dict:
+    """Hit/miss counters for the session cache"""
+    hits = _session_cache_stats["hits"]
+    misses = _session_cache_stats["misses"]
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+        "size": len(_session_cache),
+        "max_size": SESSION_CACHE_SIZE,
+        "ttl_seconds": SESSION_CACHE_TTL
+    }
+
+async def get_current_user(request: Request, db: AsyncIOMotorDatabase) -> Optional[User]:
+    """Get the current authenticated user from session token (header or cookie)."""
+    session_token = get_session_token(request)
+
     # 3️⃣ If still nothing, reject
     if not session_token:
-        print("🚫 No session token found in headers or cookies")
+        logger.debug("No session token found in headers or cookies")
         raise HTTPException(status_code=401, detail="Not authenticated")
 
+    # ⚡ Serve from cache while the session is still valid
+    cached = _session_cache.get(session_token)
+    if cached:
+        user, expires_at = cached
+        if not expires_at or expires_at >= datetime.now(timezone.utc):
+            _session_cache_stats["hits"] += 1
+            return user
+        invalidate_session(session_token)
+    _session_cache_stats["misses"] += 1
+
     # 4️⃣ Validate session
     session = await db.user_sessions.find_one({"session_token": session_token})
     if not session:
-        print(f"🚫 Invalid session: {session_token}")
+        logger.info("Invalid session token")
         raise HTTPException(status_code=401, detail="Invalid session")
 
     # 5️⃣ Check expiry
@@ -49,18 +183,20 @@ async def get_current_user(request: Request, db: AsyncIOMotorDatabase) -> Option
 
     if expires_at and expires_at < datetime.now(timezone.utc):
         await db.user_sessions.delete_one({"session_token": session_token})
-        print("⚠️ Session expired and deleted")
+        logger.info("Session expired and deleted", extra={"user_id": session["user_id"]})
         raise HTTPException(status_code=401, detail="Session expired")
 
     # 6️⃣ Get user info
     user_doc = await db.users.find_one({"_id": session["user_id"]})
     if not user_doc:
-        print("🚫 User not found for session")
+        logger.warning("User not found for session", extra={"user_id": session["user_id"]})
         raise HTTPException(status_code=404, detail="User not found")
 
     user_doc["id"] = user_doc.pop("_id")
-    print(f"✅ Authenticated user: {user_doc['name']} ({user_doc['role']})")
-    return User(**user_doc)
+    logger.debug("Authenticated user %s (%s)", user_doc["id"], user_doc["role"])
+    user = User(**user_doc)
+    _session_cache[session_token] = (user, expires_at)
+    return user
 
 async def get_current_gym_manager(request: Request, db: AsyncIOMotorDatabase) -> User:
     """Get current user and verify they are a gym manager"""
@@ -89,3 +225,20 @@ async def get_current_head_admin(request: Request, db: AsyncIOMotorDatabase) ->
     if user.role != UserRole.HEAD_ADMIN:
         raise HTTPException(status_code=403, detail="Only head admins can access this")
     return user
+
+async def get_manager_gym(db: AsyncIOMotorDatabase, owner_id: str) -> dict:
+    """The gym owned by a manager (cached, projected); 404 if they have none"""
+    gym = _manager_gym_cache.get(owner_id)
+    if gym is None:
+        gym = await db.gyms.find_one({"owner_id": owner_id}, MANAGER_GYM_PROJECTION)
+        if not gym:
+            # not cached, so a gym registered afterwards is picked up immediately
+            raise HTTPException(status_code=404, detail="No gym found")
+        _manager_gym_cache[owner_id] = gym
+    return dict(gym)
+
+def invalidate_gym(gym_id: str) -> None:
+    """Forget the cached manager gym for a gym that was changed or deleted"""
+    for owner_id, gym in list(_manager_gym_cache.items()):
+        if gym["_id"] == gym_id:
+            _manager_gym_cache.pop(owner_id, None)
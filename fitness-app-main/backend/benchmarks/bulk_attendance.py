@@ -0,0 +1,80 @@
+# benchmarks/bulk_attendance.py
+"""
+Bulk attendance ingestion benchmark.
+
+Seeds a scratch gym with members directly in MongoDB (MONGO_URL/DB_NAME),
+builds a batch of kiosk scans (check-ins plus later check-outs for some
+members), and times attendance_utils.ingest_events for the batch and for an
+exact replay of it, which must not change anything. Run from the backend
+directory:
+
+    python -m benchmarks.bulk_attendance --events 10000
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from attendance_utils import ingest_events
+from db_utils import connect_from_env, ensure_indexes
+from models import AttendanceEvent
+from rollup_utils import ATTENDANCE_ROLLUPS
+
+
+async def main(args):
+    db = connect_from_env()
+    await ensure_indexes(db)
+
+    gym_id = f"gym_bench_{uuid.uuid4().hex[:8]}"
+    members = [f"member_{gym_id}_{i}" for i in range(args.members)]
+    await db.members.insert_many([
+        {"_id": m, "user_id": m, "gym_id": gym_id, "status": "active", "role": "trainee"}
+        for m in members
+    ])
+
+    # One scan per member per day, plus a later check-out scan for half of them
+    start = datetime.now(timezone.utc).replace(hour=2, minute=0, second=0, microsecond=0) - timedelta(days=args.days)
+    events = []
+    while len(events) < args.events:
+        member = random.choice(members)
+        check_in = start + timedelta(days=random.randrange(args.days), minutes=random.randrange(600))
+        events.append(AttendanceEvent(member_id=member, timestamp=check_in))
+        if random.random() < 0.5:
+            events.append(AttendanceEvent(member_id=member, timestamp=check_in + timedelta(minutes=90)))
+    events = events[:args.events]
+
+    try:
+        timings = {}
+        for run in ("first", "replay"):
+            t0 = time.perf_counter()
+            result = await ingest_events(db, gym_id, events)
+            timings[run] = time.perf_counter() - t0
+            statuses = Counter(r["status"] for r in result["results"])
+            print(f"{run:<7} {len(events)} events in {timings[run] * 1000:8.1f} ms "
+                  f"({len(events) / timings[run]:,.0f} events/s)  {dict(statuses)}")
+
+        records = await db.attendance.count_documents({"gym_id": gym_id})
+        rollup_check_ins = sum([
+            r["check_ins"] async for r in db[ATTENDANCE_ROLLUPS].find({"gym_id": gym_id}, {"check_ins": 1})
+        ])
+        print(f"attendance records: {records}, rollup check-ins: {rollup_check_ins}")
+        ok = records == rollup_check_ins
+        print("✅ rollups match records" if ok else "❌ rollups out of sync")
+    finally:
+        await asyncio.gather(
+            db.members.delete_many({"gym_id": gym_id}),
+            db.attendance.delete_many({"gym_id": gym_id}),
+            db[ATTENDANCE_ROLLUPS].delete_many({"gym_id": gym_id}),
+        )
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=10000)
+    parser.add_argument("--members", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,65 @@
+# benchmarks/common.py
+import os
+import re
+import time
+import statistics
+from typing import Dict, List, Optional, Tuple
+
+BASE_URL = os.environ.get("BENCH_BASE_URL", "http://localhost:8000")
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of samples"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def summarize(samples: List[float], elapsed: float) -> Dict[str, float]:
+    """Throughput and latency percentiles (ms) for a list of request timings in seconds"""
+    ms = [s * 1000 for s in samples]
+    return {
+        "requests": len(ms),
+        "throughput_rps": round(len(ms) / elapsed, 2) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(ms), 2) if ms else 0.0,
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+    }
+
+
+def print_table(title: str, rows: Dict[str, Dict[str, float]]) -> None:
+    """Print a small fixed-width results table"""
+    print(f"\n== {title} ==")
+    print(f"{'name':<28}{'reqs':>8}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, r in rows.items():
+        print(f"{name:<28}{r['requests']:>8}{r['throughput_rps']:>10}"
+              f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}")
+
+
+class Timer:
+    """Context manager collecting wall-clock durations into a list"""
+
+    def __init__(self, samples: List[float]):
+        self.samples = samples
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.samples.append(time.perf_counter() - self.start)
+        return False
+
+
+_SERVER_TIMING_DB = re.compile(r'db;dur=([\d.]+);desc="(\d+) calls"')
+
+
+def server_timing_db(header: Optional[str]) -> Tuple[int, float]:
+    """(MongoDB commands, MongoDB ms) from a response's Server-Timing header"""
+    match = _SERVER_TIMING_DB.search(header or "")
+    if not match:
+        return 0, 0.0
+    return int(match.group(2)), float(match.group(1))
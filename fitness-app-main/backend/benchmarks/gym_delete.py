@@ -0,0 +1,105 @@
+# benchmarks/gym_delete.py
+"""
+Cascading gym delete benchmark.
+
+Seeds a gym in a scratch database (<DB_NAME>_bench_delete on MONGO_URL) with
+members, payments, progress logs and --attendance attendance rows, then
+deletes it three ways: the old sequential delete_many calls,
+delete_utils.delete_all (transaction or concurrent), and a background delete
+job polled to completion. Each run seeds a fresh gym; the scratch database is
+dropped afterwards. Run from the backend directory:
+
+    python -m benchmarks.gym_delete --attendance 100000
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from db_utils import connect_from_env, ensure_indexes
+from delete_utils import GYM_CASCADE, delete_all, delete_job_status, gym_deletes, start_gym_delete_job
+
+SEED_BATCH = 10000
+
+
+async def seed(db, attendance: int, members: int) -> str:
+    gym_id = f"gym_bench_{uuid.uuid4().hex[:8]}"
+    now = datetime.now(timezone.utc)
+    await db.gyms.insert_one({"_id": gym_id, "name": "Delete Bench Gym", "owner_id": f"user_{gym_id}", "is_active": True})
+    member_ids = [f"member_{gym_id}_{i}" for i in range(members)]
+    await asyncio.gather(
+        db.members.insert_many([
+            {"_id": m, "user_id": f"user_{m}", "gym_id": gym_id, "status": "active"} for m in member_ids
+        ]),
+        db.payments.insert_many([
+            {"_id": f"pay_{m}", "member_id": m, "gym_id": gym_id, "amount": 999, "created_at": now} for m in member_ids
+        ]),
+        db.progress_logs.insert_many([
+            {"_id": f"prog_{m}", "member_id": m, "gym_id": gym_id, "weight": 70, "logged_date": now} for m in member_ids
+        ]),
+    )
+    # one row per member per day, going back as far as needed
+    for start in range(0, attendance, SEED_BATCH):
+        await db.attendance.insert_many([
+            {
+                "_id": f"att_{gym_id}_{i}",
+                "member_id": member_ids[i % members],
+                "gym_id": gym_id,
+                "date": (now - timedelta(days=i // members)).strftime("%Y-%m-%d"),
+                "check_in_time": now - timedelta(days=i // members),
+                "check_out_time": None,
+            }
+            for i in range(start, min(start + SEED_BATCH, attendance))
+        ], ordered=False)
+    return gym_id
+
+
+async def sequential(db, gym_id: str) -> None:
+    await db.gyms.delete_one({"_id": gym_id})
+    for collection in GYM_CASCADE:
+        await db[collection].delete_many({"gym_id": gym_id})
+
+
+async def inline(db, gym_id: str) -> None:
+    await delete_all(db, gym_deletes(gym_id))
+
+
+async def background(db, gym_id: str) -> None:
+    job = await start_gym_delete_job(db, gym_id)
+    while True:
+        status = await delete_job_status(db, job["_id"])
+        if status["status"] != "running":
+            break
+        await asyncio.sleep(0.05)
+    await db.delete_jobs.delete_one({"_id": job["_id"]})
+    if status["status"] != "done":
+        raise RuntimeError(status["error"])
+
+
+async def main(args):
+    db = connect_from_env()
+    db = db.client[f"{os.environ.get('DB_NAME', 'fitdesert')}_bench_delete"]
+    await db.client.drop_database(db.name)
+
+    try:
+        await ensure_indexes(db)
+        print(f"\n== delete a gym with {args.attendance:,} attendance rows, {args.members:,} members ==")
+        for label, delete in (("sequential delete_many", sequential), ("delete_all", inline),
+                              ("background job", background)):
+            gym_id = await seed(db, args.attendance, args.members)
+            t0 = time.perf_counter()
+            await delete(db, gym_id)
+            elapsed = time.perf_counter() - t0
+            left = sum(await asyncio.gather(*[db[c].count_documents({"gym_id": gym_id}) for c in GYM_CASCADE]))
+            print(f"{label:<26}{elapsed * 1000:10.1f} ms   documents left: {left}")
+    finally:
+        await db.client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--attendance", type=int, default=100000)
+    parser.add_argument("--members", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,231 @@
+# benchmarks/load_profile.py
+"""
+Scripted load profile against a running server and the seeded dataset.
+
+Run benchmarks.seed_data first with the same --gyms/--members. Sessions for
+the seeded admin, managers and members are written straight to MongoDB
+(MONGO_URL/DB_NAME) so setup costs no bcrypt time, then --concurrency workers
+pick requests from PROFILE by weight for --duration seconds after a --warmup
+that is not measured. Per endpoint it reports throughput, p50/p95/p99 and the
+MongoDB commands / time per request read from the Server-Timing header.
+
+    python -m benchmarks.load_profile --concurrency 32 --duration 60 --output release.json
+    python -m benchmarks.load_profile --baseline release.json
+
+With --baseline the run is compared with an earlier --output report; the exit
+status is 1 if p95/p99 latency grew (or throughput dropped) by more than
+--tolerance, DB commands per request went up, or new server errors appeared.
+Scans create today's attendance, so re-seed before runs that are compared.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from benchmarks.common import BASE_URL, server_timing_db, summarize
+from benchmarks.seed_data import ADMIN_EMAIL, SEED_PASSWORD, gym_qr, manager_email, member_email
+from db_utils import connect_from_env
+
+# endpoint -> weight (share of requests)
+PROFILE = {
+    "POST /api/attendance/scan": 40,
+    "GET /api/attendance/gym-stats": 20,
+    "GET /api/members": 20,
+    "POST /api/auth/login": 10,
+    "GET /api/gyms/all": 10,
+}
+
+
+async def create_sessions(db, run: str, gyms: int, members: int) -> dict:
+    """Session headers for the seeded admin, every manager and every member"""
+    emails = [ADMIN_EMAIL] + [manager_email(g) for g in range(gyms)]
+    emails += [member_email(g, i) for g in range(gyms) for i in range(members)]
+    users = {u["email"]: u["_id"] async for u in db.users.find({"email": {"$in": emails}, "seed": True}, {"email": 1})}
+    missing = len(emails) - len(users)
+    if missing:
+        raise SystemExit(f"{missing} seeded users not found; run benchmarks.seed_data with the same --gyms/--members")
+
+    now = datetime.now(timezone.utc)
+    sessions = [{
+        "user_id": user_id, "session_token": f"session_bench_{run}_{user_id}",
+        "expires_at": now + timedelta(hours=2), "created_at": now,
+    } for user_id in users.values()]
+    for start in range(0, len(sessions), 10000):
+        await db.user_sessions.insert_many(sessions[start:start + 10000], ordered=False)
+    return {email: {"Authorization": f"Bearer session_bench_{run}_{user_id}"} for email, user_id in users.items()}
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.db_ops = defaultdict(list)
+        self.db_ms = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+
+    def record(self, name: str, seconds: float, response) -> None:
+        self.samples[name].append(seconds)
+        if response is None:
+            self.statuses[name]["transport error"] += 1
+            return
+        self.statuses[name][response.status_code] += 1
+        calls, ms = server_timing_db(response.headers.get("server-timing"))
+        self.db_ops[name].append(calls)
+        self.db_ms[name].append(ms)
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name in PROFILE:
+            statuses = self.statuses[name]
+            endpoints[name] = {
+                **summarize(self.samples[name], elapsed),
+                "db_ops_per_request": round(statistics.fmean(self.db_ops[name]), 2) if self.db_ops[name] else 0.0,
+                "db_ms_per_request": round(statistics.fmean(self.db_ms[name]), 2) if self.db_ms[name] else 0.0,
+                "rejected": sum(n for s, n in statuses.items() if isinstance(s, int) and 400 <= s < 500),
+                "errors": sum(n for s, n in statuses.items() if not isinstance(s, int) or s >= 500),
+            }
+        all_samples = [s for samples in self.samples.values() for s in samples]
+        all_ops = [c for ops in self.db_ops.values() for c in ops]
+        total = {
+            **summarize(all_samples, elapsed),
+            "db_ops_per_request": round(statistics.fmean(all_ops), 2) if all_ops else 0.0,
+            "rejected": sum(e["rejected"] for e in endpoints.values()),
+            "errors": sum(e["errors"] for e in endpoints.values()),
+        }
+        return {"endpoints": endpoints, "total": total}
+
+
+async def worker(client, sessions, args, rng: random.Random, deadline: float, recorder: Recorder) -> None:
+    names, weights = list(PROFILE), list(PROFILE.values())
+    while time.perf_counter() < deadline:
+        name = rng.choices(names, weights)[0]
+        g, i = rng.randrange(args.gyms), rng.randrange(args.members)
+        manager = sessions[manager_email(g)]
+        if name == "POST /api/attendance/scan":
+            call = client.post("/api/attendance/scan", headers=sessions[member_email(g, i)], json={"qr_code": gym_qr(g)})
+        elif name == "GET /api/attendance/gym-stats":
+            call = client.get("/api/attendance/gym-stats", headers=manager)
+        elif name == "GET /api/members":
+            call = client.get("/api/members", headers=manager)
+        elif name == "POST /api/auth/login":
+            call = client.post("/api/auth/login", json={"email": member_email(g, i), "password": args.password})
+        else:
+            call = client.get("/api/gyms/all", headers=sessions[ADMIN_EMAIL])
+
+        t0 = time.perf_counter()
+        try:
+            response = await call
+        except httpx.HTTPError:
+            response = None
+        if recorder is not None:
+            recorder.record(name, time.perf_counter() - t0, response)
+
+
+def print_report(title: str, report: dict) -> None:
+    print(f"\n== {title} ==")
+    print(f"{'endpoint':<32}{'reqs':>8}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'db ops':>8}{'db ms':>8}"
+          f"{'4xx':>7}{'err':>6}")
+    for name, r in {**report["endpoints"], "total": report["total"]}.items():
+        print(f"{name:<32}{r['requests']:>8}{r['throughput_rps']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+              f"{r['p99_ms']:>9}{r['db_ops_per_request']:>8}{r.get('db_ms_per_request', ''):>8}"
+              f"{r['rejected']:>7}{r['errors']:>6}")
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Print per-endpoint changes against a baseline report; returns the regressions found"""
+    regressions = []
+    print(f"\n== vs baseline from {baseline['meta']['started_at']} ==")
+    print(f"{'endpoint':<32}{'p95':>18}{'p99':>18}{'rps':>18}{'db ops':>14}")
+    rows = {**report["endpoints"], "total": report["total"]}
+    base_rows = {**baseline["endpoints"], "total": baseline["total"]}
+    for name, r in rows.items():
+        base = base_rows.get(name)
+        if not base or not base["requests"] or not r["requests"]:
+            continue
+
+        def change(key):
+            return f"{base[key]}→{r[key]}"
+
+        print(f"{name:<32}{change('p95_ms'):>18}{change('p99_ms'):>18}{change('throughput_rps'):>18}"
+              f"{change('db_ops_per_request'):>14}")
+        for key in ("p95_ms", "p99_ms"):
+            if r[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {base[key]} → {r[key]}")
+        if r["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']} → {r['throughput_rps']} rps")
+        if r["db_ops_per_request"] > base["db_ops_per_request"] + 0.5:
+            regressions.append(f"{name}: DB ops/request {base['db_ops_per_request']} → {r['db_ops_per_request']}")
+        if r["errors"] > base["errors"]:
+            regressions.append(f"{name}: server errors {base['errors']} → {r['errors']}")
+    return regressions
+
+
+async def main(args):
+    db = connect_from_env()
+    run = uuid.uuid4().hex[:8]
+    sessions = await create_sessions(db, run, args.gyms, args.members)
+    started_at = datetime.now(timezone.utc).isoformat()
+
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+            rngs = [random.Random(args.seed + n) for n in range(args.concurrency)]
+            if args.warmup:
+                deadline = time.perf_counter() + args.warmup
+                await asyncio.gather(*[worker(client, sessions, args, rng, deadline, None) for rng in rngs])
+
+            recorder = Recorder()
+            start = time.perf_counter()
+            deadline = start + args.duration
+            await asyncio.gather(*[worker(client, sessions, args, rng, deadline, recorder) for rng in rngs])
+            elapsed = time.perf_counter() - start
+    finally:
+        await db.user_sessions.delete_many({"session_token": {"$regex": f"^session_bench_{run}_"}})
+
+    report = {
+        "meta": {
+            "started_at": started_at, "base_url": args.base_url, "concurrency": args.concurrency,
+            "duration": args.duration, "gyms": args.gyms, "members": args.members, "profile": PROFILE,
+        },
+        **recorder.report(elapsed),
+    }
+    print_report(f"load profile ({args.concurrency} concurrent, {args.duration:g}s, "
+                 f"{args.gyms} gyms x {args.members} members)", report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nreport written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\n❌ regressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\n✅ no regressions")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--gyms", type=int, default=10)
+    parser.add_argument("--members", type=int, default=200, help="members per gym")
+    parser.add_argument("--password", default=SEED_PASSWORD)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=60)
+    parser.add_argument("--warmup", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the report as JSON")
+    parser.add_argument("--baseline", help="compare with an earlier --output report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative latency/throughput change")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,79 @@
+# benchmarks/login_storm.py
+"""
+Login storm benchmark.
+
+Fires concurrent /api/auth/login calls against a running server while a probe
+hits /api/health, then reports login throughput and the latency of the
+unrelated endpoint. Run from the backend directory:
+
+    python -m benchmarks.login_storm --concurrency 50 --duration 15
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.common import BASE_URL, Timer, print_table, summarize
+
+
+async def ensure_user(client: httpx.AsyncClient, email: str, password: str) -> None:
+    await client.post("/api/auth/register", json={
+        "email": email, "password": password, "name": "Bench User", "role": "trainee"
+    })
+
+
+async def login_worker(client, email, password, deadline, samples, errors):
+    while time.perf_counter() < deadline:
+        with Timer(samples):
+            r = await client.post("/api/auth/login", json={"email": email, "password": password})
+        if r.status_code != 200:
+            errors[r.status_code] = errors.get(r.status_code, 0) + 1
+
+
+async def probe_worker(client, deadline, samples, interval):
+    while time.perf_counter() < deadline:
+        with Timer(samples):
+            await client.get("/api/health")
+        await asyncio.sleep(interval)
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.concurrency + 4)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        await ensure_user(client, args.email, args.password)
+
+        # Baseline: the probe alone
+        baseline = []
+        start = time.perf_counter()
+        await probe_worker(client, start + 3, baseline, args.probe_interval)
+        baseline_elapsed = time.perf_counter() - start
+
+        logins, probes, errors = [], [], {}
+        start = time.perf_counter()
+        deadline = start + args.duration
+        await asyncio.gather(
+            probe_worker(client, deadline, probes, args.probe_interval),
+            *[login_worker(client, args.email, args.password, deadline, logins, errors)
+              for _ in range(args.concurrency)]
+        )
+        elapsed = time.perf_counter() - start
+
+    print_table(f"login storm ({args.concurrency} concurrent, {args.duration}s)", {
+        "/api/health (idle)": summarize(baseline, baseline_elapsed),
+        "/api/health (under storm)": summarize(probes, elapsed),
+        "/api/auth/login": summarize(logins, elapsed),
+    })
+    if errors:
+        print("login errors by status:", errors)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--email", default="bench.login@fitdesert.test")
+    parser.add_argument("--password", default="bench-password")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--duration", type=float, default=15)
+    parser.add_argument("--probe-interval", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,64 @@
+# benchmarks/membership_sweep.py
+"""
+Membership status sweep benchmark.
+
+Seeds a scratch database (<DB_NAME>_bench_membership on MONGO_URL) with
+synthetic members whose expiry dates are spread around today, then times a
+dry run, the real sweep and a second (no-op) sweep of
+membership_utils.sweep_membership_statuses. The scratch database is dropped
+afterwards. Run from the backend directory:
+
+    python -m benchmarks.membership_sweep --members 1000000
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from db_utils import connect_from_env, ensure_indexes
+from membership_utils import sweep_membership_statuses
+
+SEED_BATCH = 10000
+
+
+async def seed(db, members: int) -> None:
+    now = datetime.now(timezone.utc)
+    statuses = ["active"] * 8 + ["expiring_soon", "expired", "frozen"]
+    for start in range(0, members, SEED_BATCH):
+        await db.members.insert_many([
+            {
+                "_id": f"member_bench_{i}",
+                "user_id": f"user_bench_{i}",
+                "gym_id": f"gym_bench_{i % 500}",
+                "status": random.choice(statuses),
+                "membership_expiry": now + timedelta(days=random.uniform(-60, 120)),
+            }
+            for i in range(start, min(start + SEED_BATCH, members))
+        ], ordered=False)
+
+
+async def main(args):
+    db = connect_from_env()
+    db = db.client[f"{os.environ.get('DB_NAME', 'fitdesert')}_bench_membership"]
+    await db.client.drop_database(db.name)
+
+    try:
+        await ensure_indexes(db)
+        t0 = time.perf_counter()
+        await seed(db, args.members)
+        print(f"seeded {args.members:,} members in {time.perf_counter() - t0:.1f} s")
+
+        for label, dry_run in (("dry run", True), ("sweep", False), ("re-sweep", False)):
+            t0 = time.perf_counter()
+            counts = await sweep_membership_statuses(db, dry_run=dry_run)
+            print(f"{label:<9} {(time.perf_counter() - t0) * 1000:9.1f} ms  {counts}")
+    finally:
+        await db.client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--members", type=int, default=1000000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,101 @@
+# benchmarks/oauth_session.py
+"""
+OAuth session-data client benchmark.
+
+Starts a local stub of the session-data service (with configurable latency and
+failure rate) and resolves session IDs through auth_utils.fetch_oauth_session,
+first with unique IDs (pooled HTTP + retries) and then with repeated IDs
+(validated-session cache). Run from the backend directory:
+
+    python -m benchmarks.oauth_session --requests 500 --concurrency 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from benchmarks.common import Timer, print_table, summarize
+
+
+def start_stub(latency: float, failure_rate: float) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            time.sleep(latency)
+            if random.random() < failure_rate:
+                status, body = 503, b"{}"
+            else:
+                session_id = self.headers.get("X-Session-ID", "")
+                status, body = 200, json.dumps({
+                    "email": f"{session_id}@stub.test",
+                    "name": "Stub User",
+                    "picture": None,
+                    "session_token": f"token_{session_id}",
+                }).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+async def run(session_ids, concurrency):
+    import auth_utils
+
+    samples, failures = [], 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(session_id):
+        nonlocal failures
+        async with semaphore:
+            with Timer(samples):
+                try:
+                    await auth_utils.fetch_oauth_session(session_id)
+                except Exception:
+                    failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*[one(s) for s in session_ids])
+    return summarize(samples, time.perf_counter() - start), failures
+
+
+async def main(args):
+    stub = start_stub(args.latency, args.failure_rate)
+    os.environ["OAUTH_SESSION_URL"] = f"http://127.0.0.1:{stub.server_port}/session-data"
+
+    from http_utils import close_http_client
+
+    unique_ids = [f"session{i}" for i in range(args.requests)]
+    repeated_ids = [f"session{i % 10}" for i in range(args.requests)]
+
+    unique, unique_failures = await run(unique_ids, args.concurrency)
+    repeated, repeated_failures = await run(repeated_ids, args.concurrency)
+    await close_http_client()
+    stub.shutdown()
+
+    print_table(f"session-data ({args.latency * 1000:.0f} ms stub, {args.failure_rate:.0%} 5xx)", {
+        "unique session IDs": unique,
+        "repeated session IDs": repeated,
+    })
+    print(f"failures after retries: unique={unique_failures} repeated={repeated_failures}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--failure-rate", type=float, default=0.05)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,144 @@
+# benchmarks/payload_size.py
+"""
+Read endpoint payload-size benchmark.
+
+Seeds a gym directly in MongoDB (MONGO_URL/DB_NAME, shared with the running
+API): a legacy gym document with an embedded base64 QR, members with photos and
+a trainee with photo-bearing progress logs, plus sessions for the manager and
+trainee. For each read endpoint it compares the size of the whole documents
+(what the endpoints used to return) with the projected response and a sparse
+?fields= response, then removes the seeded data. Run from the backend directory:
+
+    python -m benchmarks.payload_size --members 200 --photo-kb 60
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+
+from benchmarks.common import BASE_URL
+from db_utils import connect_from_env
+
+
+def blob(kb: int) -> str:
+    return base64.b64encode(os.urandom(kb * 768)).decode()
+
+
+def json_size(docs) -> int:
+    return len(json.dumps(jsonable_encoder(docs), separators=(",", ":")).encode())
+
+
+async def seed(db, run: str, members: int, photo_kb: int, logs: int) -> dict:
+    now = datetime.now(timezone.utc)
+    manager_id, gym_id = f"user_bench_{run}_manager", f"gym_bench_{run}"
+    users = [{"_id": manager_id, "email": f"manager.{run}@fitdesert.test", "name": "Bench Manager",
+              "role": "gym_manager", "created_at": now}]
+    gym = {"_id": gym_id, "name": f"Payload Gym {run}", "address": "1 Bench St", "city": "Bench",
+           "state": "BN", "phone": "0000000000", "email": f"gym.{run}@fitdesert.test",
+           "owner_id": manager_id, "qr_code": f"data:image/png;base64,{blob(4)}", "kyc_verified": False,
+           "is_active": True, "registration_date": now, "subscription_plan": "basic"}
+
+    member_docs = []
+    for i in range(members):
+        user_id = f"user_bench_{run}_{i}"
+        users.append({"_id": user_id, "email": f"member{i}.{run}@fitdesert.test", "name": f"Member {i}",
+                      "role": "trainee", "created_at": now})
+        member_docs.append({
+            "_id": f"member_bench_{run}_{i}", "user_id": user_id, "gym_id": gym_id, "role": "trainee",
+            "photo": blob(photo_kb), "contact_info": "0000000000", "joining_date": now,
+            "membership_plan": "Monthly", "plan_duration_months": 1,
+            "membership_expiry": now + timedelta(days=30), "goal": "Strength",
+            "assigned_trainer_id": None, "status": "active", "height": 175.0, "weight": 72.5, "age": 30
+        })
+
+    trainee = member_docs[0]
+    progress = [{
+        "_id": f"prog_bench_{run}_{i}", "member_id": trainee["_id"], "gym_id": gym_id,
+        "weight": 72.5 - i * 0.1, "body_fat_percentage": 18.0, "measurements": {"waist": 80},
+        "photos": [blob(photo_kb) for _ in range(3)], "notes": None, "logged_date": now - timedelta(days=i)
+    } for i in range(logs)]
+
+    sessions = [
+        {"user_id": user_id, "session_token": f"session_bench_{run}_{user_id}",
+         "expires_at": now + timedelta(hours=1), "created_at": now}
+        for user_id in (manager_id, trainee["user_id"])
+    ]
+    await asyncio.gather(
+        db.users.insert_many(users), db.gyms.insert_one(gym), db.members.insert_many(member_docs),
+        db.progress_logs.insert_many(progress), db.user_sessions.insert_many(sessions)
+    )
+    return {
+        "gym": gym, "members": member_docs, "users": {u["_id"]: u for u in users}, "progress": progress,
+        "manager": {"Authorization": f"Bearer {sessions[0]['session_token']}"},
+        "trainee": {"Authorization": f"Bearer {sessions[1]['session_token']}"},
+    }
+
+
+async def cleanup(db, run: str) -> None:
+    prefix = {"$regex": f"^(user|gym|member|prog)_bench_{run}"}
+    await asyncio.gather(
+        db.users.delete_many({"_id": prefix}), db.gyms.delete_many({"_id": prefix}),
+        db.members.delete_many({"_id": prefix}), db.progress_logs.delete_many({"_id": prefix}),
+        db.user_sessions.delete_many({"session_token": {"$regex": f"^session_bench_{run}"}}),
+    )
+
+
+def whole_documents(data: dict) -> dict:
+    """What the endpoints returned before projections: full documents with _id renamed"""
+    members = []
+    for m in data["members"]:
+        user = data["users"][m["user_id"]]
+        members.append({**m, "id": m["_id"], "user_name": user["name"], "user_email": user["email"]})
+    return {
+        "members": [{k: v for k, v in m.items() if k != "_id"} for m in members],
+        "gym": data["gym"],
+        "progress": [{**{k: v for k, v in p.items() if k != "_id"}, "id": p["_id"]} for p in data["progress"]],
+    }
+
+
+async def main(args):
+    db = connect_from_env()
+    run = uuid.uuid4().hex[:8]
+    data = await seed(db, run, args.members, args.photo_kb, args.logs)
+    before = whole_documents(data)
+    gym_id = data["gym"]["_id"]
+
+    endpoints = [
+        ("/api/members", data["manager"], json_size(before["members"]),
+         "id,user_name,status,membership_expiry"),
+        (f"/api/gyms/{gym_id}", data["manager"], json_size(before["gym"]), "name,city"),
+        ("/api/progress/my-history", data["trainee"], json_size(before["progress"]),
+         "logged_date,weight"),
+    ]
+
+    try:
+        async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+            print(f"\n== payload sizes, {args.members} members, {args.photo_kb} KB photos ==")
+            print(f"{'endpoint':<28}{'before':>12}{'after':>12}{'fields=':>12}{'after ms':>10}")
+            for path, headers, before_bytes, sparse in endpoints:
+                t0 = time.perf_counter()
+                full = await client.get(path, headers=headers)
+                elapsed = (time.perf_counter() - t0) * 1000
+                full.raise_for_status()
+                slim = await client.get(path, headers=headers, params={"fields": sparse})
+                slim.raise_for_status()
+                print(f"{path.split(gym_id)[0] + ('{id}' if gym_id in path else ''):<28}"
+                      f"{before_bytes:>12,}{len(full.content):>12,}{len(slim.content):>12,}{elapsed:>10.1f}")
+    finally:
+        await cleanup(db, run)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--members", type=int, default=200)
+    parser.add_argument("--photo-kb", type=int, default=60)
+    parser.add_argument("--logs", type=int, default=30)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,103 @@
+# benchmarks/revenue_report.py
+"""
+Revenue analytics benchmark.
+
+Seeds a scratch database (<DB_NAME>_bench_revenue on MONGO_URL) with one gym's
+--payments payments spread over --years, builds the monthly payment rollups
+with the backfill, then times a monthly revenue report computed the old way
+(a $group over raw payments) against revenue_totals / mrr_report reading the
+rollups. The scratch database is dropped afterwards. Run from the backend
+directory:
+
+    python -m benchmarks.revenue_report --payments 500000 --years 5
+"""
+import argparse
+import asyncio
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from db_utils import connect_from_env, ensure_indexes
+from models import PaymentStatus, PaymentType
+from rollup_utils import mrr_report, rebuild_payment_rollups, revenue_totals
+
+SEED_BATCH = 10000
+GYM_ID = "gym_bench_revenue"
+
+
+async def seed(db, payments: int, years: float) -> None:
+    now = datetime.now(timezone.utc)
+    types, statuses = [t.value for t in PaymentType], [s.value for s in PaymentStatus]
+    for start in range(0, payments, SEED_BATCH):
+        await db.payments.insert_many([
+            {
+                "_id": f"pay_bench_{i}",
+                "member_id": f"member_bench_{i % 5000}",
+                "gym_id": GYM_ID,
+                "amount": random.choice([500.0, 1500.0, 4000.0, 14000.0]),
+                "payment_type": random.choice(types),
+                "status": random.choices(statuses, [1, 18, 1])[0],
+                "plan_duration_months": random.choice([1, 3, 12]),
+                "created_at": now - timedelta(days=random.uniform(0, 365 * years)),
+            }
+            for i in range(start, min(start + SEED_BATCH, payments))
+        ], ordered=False)
+
+
+async def raw_monthly(db, start: datetime, end: datetime) -> list:
+    return await db.payments.aggregate([
+        {"$match": {"gym_id": GYM_ID, "created_at": {"$gte": start, "$lte": end}}},
+        {"$group": {
+            "_id": {
+                "month": {"$dateToString": {"format": "%Y-%m", "date": "$created_at"}},
+                "status": "$status",
+                "payment_type": "$payment_type"
+            },
+            "count": {"$sum": 1},
+            "amount": {"$sum": "$amount"}
+        }}
+    ]).to_list(None)
+
+
+async def main(args):
+    db = connect_from_env()
+    db = db.client[f"{os.environ.get('DB_NAME', 'fitdesert')}_bench_revenue"]
+    await db.client.drop_database(db.name)
+
+    try:
+        await ensure_indexes(db)
+        t0 = time.perf_counter()
+        await seed(db, args.payments, args.years)
+        print(f"seeded {args.payments:,} payments in {time.perf_counter() - t0:.1f} s")
+
+        t0 = time.perf_counter()
+        rollups = await rebuild_payment_rollups(db, GYM_ID)
+        print(f"backfill: {rollups} monthly rollups in {(time.perf_counter() - t0) * 1000:.0f} ms")
+
+        end = datetime.now(timezone.utc)
+        start = end - timedelta(days=365 * args.years)
+        runs = {
+            "raw $group by month": lambda: raw_monthly(db, start, end),
+            "rollups, by month": lambda: revenue_totals(db, GYM_ID, "month", start.date(), end.date()),
+            "rollups, by day": lambda: revenue_totals(db, GYM_ID, "day", start.date(), end.date()),
+            "rollups, MRR 12 months": lambda: mrr_report(db, GYM_ID, 12, end.date()),
+        }
+        print(f"\n== revenue over {args.years:g} years, best of {args.repeat} ==")
+        for label, run in runs.items():
+            timings = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                await run()
+                timings.append(time.perf_counter() - t0)
+            print(f"{label:<26}{min(timings) * 1000:10.1f} ms")
+    finally:
+        await db.client.drop_database(db.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--payments", type=int, default=500000)
+    parser.add_argument("--years", type=float, default=5)
+    parser.add_argument("--repeat", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,94 @@
+# benchmarks/scan_race.py
+"""
+Concurrent attendance scan load test.
+
+Creates a gym and one member through the API, fires many simultaneous
+/api/attendance/scan calls for that member (turnstile double scans), and checks
+that exactly one attendance record exists for today with at most one
+check-out. Run from the backend directory against a running server:
+
+    python -m benchmarks.scan_race --scans 200
+
+The same invariant is checked without a server by tests/test_attendance.py.
+"""
+import argparse
+import asyncio
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+
+import httpx
+
+from benchmarks.common import BASE_URL, Timer, print_table, summarize
+
+
+async def register(client, email, password, role):
+    r = await client.post("/api/auth/register", json={
+        "email": email, "password": password, "name": email.split("@")[0], "role": role
+    })
+    r.raise_for_status()
+    return {"Authorization": f"Bearer {r.json()['session_token']}"}
+
+
+async def setup(client):
+    run = uuid.uuid4().hex[:8]
+    manager = await register(client, f"race.manager.{run}@fitdesert.test", "bench-password", "gym_manager")
+    r = await client.post("/api/gyms/register", headers=manager, json={
+        "name": f"Race Gym {run}", "address": "1 Bench St", "city": "Bench",
+        "state": "BN", "phone": "0000000000", "email": f"race.gym.{run}@fitdesert.test"
+    })
+    r.raise_for_status()
+    gym_id = r.json()["gym_id"]
+
+    member_email = f"race.member.{run}@fitdesert.test"
+    r = await client.post("/api/members", headers=manager, json={
+        "name": "Race Member", "email": member_email, "phone": "0000000000", "password": "bench-password"
+    })
+    r.raise_for_status()
+    r = await client.post("/api/auth/login", json={"email": member_email, "password": "bench-password"})
+    r.raise_for_status()
+    return gym_id, {"Authorization": f"Bearer {r.json()['session_token']}"}
+
+
+async def main(args):
+    limits = httpx.Limits(max_connections=args.scans)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60, limits=limits) as client:
+        gym_id, member = await setup(client)
+        qr = {"qr_code": f"fitdesert://gym/{gym_id}/attendance"}
+
+        samples, outcomes = [], Counter()
+
+        async def scan(i):
+            headers = dict(member)
+            if args.idempotency_keys:
+                headers["Idempotency-Key"] = f"scan-{i % args.idempotency_keys}"
+            with Timer(samples):
+                r = await client.post("/api/attendance/scan", headers=headers, json=qr)
+            outcomes[r.json().get("type") or f"{r.status_code} {r.json().get('detail')}"] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*[scan(i) for i in range(args.scans)])
+        elapsed = time.perf_counter() - start
+
+        history = (await client.get("/api/attendance/my-history", headers=member)).json()
+
+    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    records = [r for r in history if r["date"] == today]
+
+    print_table(f"{args.scans} concurrent scans for one member", {"/api/attendance/scan": summarize(samples, elapsed)})
+    print("outcomes:", dict(outcomes))
+    print(f"attendance records for today: {len(records)}")
+
+    ok = len(records) == 1
+    print("✅ exactly one record" if ok else "❌ duplicate or missing attendance")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--scans", type=int, default=200)
+    parser.add_argument("--idempotency-keys", type=int, default=0,
+                        help="spread scans over this many Idempotency-Key values (0 = no key)")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,212 @@
+# benchmarks/seed_data.py
+"""
+Synthetic dataset generator for load tests.
+
+Seeds MongoDB (MONGO_URL/DB_NAME, the database the API under test uses) with
+--gyms gyms, each with a manager and --members members, --years of attendance
+(about --visits-per-week check-ins per member, never today, so scans during a
+load run are real check-ins), monthly payments and fortnightly progress logs,
+plus one head admin. Output is deterministic for a given --seed. Every seeded
+document carries seed: true and re-running replaces the previous seed, so the
+same dataset can be rebuilt before each release's run. Attendance and payment
+rollups are rebuilt at the end. Run from the backend directory:
+
+    python -m benchmarks.seed_data --gyms 10 --members 200 --years 2
+    python -m benchmarks.seed_data --clean
+
+All seeded users share --password; the load profile logs in as them.
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+
+from archive_utils import remove_gym_archive
+from auth_utils import hash_password
+from db_utils import connect_from_env, ensure_indexes
+from membership_utils import status_for_expiry
+from rollup_utils import (
+    ATTENDANCE_ROLLUPS, IST_OFFSET, PAYMENT_ROLLUPS, rebuild_attendance_rollups, rebuild_payment_rollups
+)
+
+SEED_BATCH = 10000
+SEED_PASSWORD = "bench-password"
+ADMIN_EMAIL = "seed.admin@fitdesert.test"
+
+# Scan QR codes carry a numeric gym id (gym_<digits>), so seeded gyms use ids
+# far below the timestamp-based ones id_utils generates
+SEED_GYM_BASE = 100000
+
+SEEDED_COLLECTIONS = ["users", "gyms", "members", "attendance", "payments", "progress_logs"]
+PLANS = [("Monthly", 1, 1500.0), ("Quarterly", 3, 4000.0), ("Yearly", 12, 14000.0)]
+GOALS = ["Weight Loss", "Muscle Gain", "Strength", "Endurance", None]
+
+
+def seed_gym_id(g: int) -> str:
+    return f"gym_{SEED_GYM_BASE + g}"
+
+
+def manager_email(g: int) -> str:
+    return f"seed.manager.{g}@fitdesert.test"
+
+
+def member_email(g: int, i: int) -> str:
+    return f"seed.member.{g}.{i}@fitdesert.test"
+
+
+def gym_qr(g: int) -> str:
+    return f"fitdesert://gym/{seed_gym_id(g)}/attendance"
+
+
+async def clean(db) -> None:
+    """Remove everything a previous seed run created"""
+    seed_users = await db.users.distinct("_id", {"seed": True})
+    gym_ids = await db.gyms.distinct("_id", {"seed": True})
+    await asyncio.gather(
+        *[db[c].delete_many({"seed": True}) for c in SEEDED_COLLECTIONS],
+        db.user_sessions.delete_many({"user_id": {"$in": seed_users}}),
+        db[ATTENDANCE_ROLLUPS].delete_many({"gym_id": {"$in": gym_ids}}),
+        db[PAYMENT_ROLLUPS].delete_many({"gym_id": {"$in": gym_ids}}),
+        *[remove_gym_archive(gym_id) for gym_id in gym_ids],
+    )
+
+
+async def insert_batched(collection, docs: List[dict]) -> None:
+    for start in range(0, len(docs), SEED_BATCH):
+        await collection.insert_many(docs[start:start + SEED_BATCH], ordered=False)
+
+
+async def seed_gym(db, g: int, args, rng: random.Random, password: str, now: datetime) -> int:
+    """One gym with its manager, members and their history; returns the attendance row count"""
+    gym_id = seed_gym_id(g)
+    manager_id = f"user_seed_manager_{g}"
+    start = now - timedelta(days=365 * args.years)
+    users = [{
+        "_id": manager_id, "email": manager_email(g), "name": f"Seed Manager {g}", "phone": "0000000000",
+        "role": "gym_manager", "password": password, "created_at": start, "must_change_password": False,
+        "seed": True,
+    }]
+    gym = {
+        "_id": gym_id, "name": f"Seed Gym {g}", "address": f"{g} Bench St", "city": rng.choice(
+            ["Pune", "Mumbai", "Delhi", "Bengaluru", "Jaipur"]), "state": "MH", "phone": "0000000000",
+        "email": f"seed.gym.{g}@fitdesert.test", "owner_id": manager_id, "kyc_verified": True,
+        "is_active": True, "registration_date": start, "subscription_plan": "pro",
+        "subscription_expiry": now + timedelta(days=365), "seed": True,
+    }
+
+    members, attendance, payments, progress = [], [], [], []
+    for i in range(args.members):
+        user_id, member_id = f"user_seed_{g}_{i}", f"member_seed_{g}_{i}"
+        plan, months, price = rng.choice(PLANS)
+        joined = start + timedelta(days=rng.uniform(0, 365 * args.years * 0.8))
+        # a quarter of members lapse some time before today
+        if rng.random() < 0.25:
+            expiry = now - timedelta(days=rng.uniform(1, 120))
+        else:
+            expiry = now + timedelta(days=rng.uniform(-5, months * 30))
+        users.append({
+            "_id": user_id, "email": member_email(g, i), "name": f"Seed Member {g}.{i}", "phone": "0000000000",
+            "role": "trainee", "password": password, "created_at": joined, "must_change_password": False,
+            "seed": True,
+        })
+        weight = rng.uniform(55, 110)
+        members.append({
+            "_id": member_id, "user_id": user_id, "gym_id": gym_id, "role": "trainee", "photo_id": None,
+            "contact_info": "0000000000", "joining_date": joined, "membership_plan": plan,
+            "plan_duration_months": months, "membership_expiry": expiry, "goal": rng.choice(GOALS),
+            "assigned_trainer_id": None, "status": status_for_expiry(expiry, now),
+            "height": round(rng.uniform(150, 195), 1), "weight": round(weight, 1), "age": rng.randint(18, 60),
+            "seed": True,
+        })
+
+        # attendance on random days up to yesterday, at most one per (UTC) day like live scans
+        active_until = min(expiry, now - timedelta(days=1))
+        day = joined
+        while day < active_until:
+            if rng.random() < args.visits_per_week / 7:
+                check_in = day.replace(hour=rng.randint(0, 15), minute=rng.randint(0, 59), microsecond=0)
+                date = check_in.strftime("%Y-%m-%d")
+                # stored in gym-local time, keyed by the UTC day
+                check_in += IST_OFFSET
+                attendance.append({
+                    "_id": f"att_seed_{g}_{i}_{date}", "member_id": member_id, "gym_id": gym_id,
+                    "check_in_time": check_in, "date": date,
+                    "check_out_time": check_in + timedelta(minutes=rng.randint(30, 120)), "seed": True,
+                })
+            day += timedelta(days=1)
+
+        # one payment per plan period, the first a new membership
+        paid, n = joined, 0
+        while paid < min(expiry, now):
+            payments.append({
+                "_id": f"pay_seed_{g}_{i}_{n}", "member_id": member_id, "gym_id": gym_id, "amount": price,
+                "payment_type": "new_membership" if n == 0 else "renewal", "plan_duration_months": months,
+                "status": "success" if rng.random() < 0.95 else "failed",
+                "razorpay_order_id": f"order_seed_{g}_{i}_{n}", "invoice_number": f"INV-SEED-{g}-{i}-{n}",
+                "created_at": paid, "payment_date": paid, "seed": True,
+            })
+            paid += timedelta(days=months * 30)
+            n += 1
+
+        # fortnightly progress logs drifting toward the goal
+        logged, drift = joined, rng.uniform(-0.4, 0.2)
+        while logged < active_until:
+            weight = max(40.0, weight + drift + rng.gauss(0, 0.5))
+            progress.append({
+                "_id": f"prog_seed_{g}_{i}_{logged:%Y%m%d}", "member_id": member_id, "gym_id": gym_id,
+                "weight": round(weight, 1), "body_fat_percentage": round(rng.uniform(12, 35), 1),
+                "measurements": {"waist": round(rng.uniform(65, 110), 1)}, "photo_ids": [], "notes": None,
+                "logged_date": logged, "seed": True,
+            })
+            logged += timedelta(days=14)
+
+    await asyncio.gather(db.users.insert_many(users, ordered=False), db.gyms.insert_one(gym))
+    await asyncio.gather(
+        insert_batched(db.members, members), insert_batched(db.attendance, attendance),
+        insert_batched(db.payments, payments), insert_batched(db.progress_logs, progress),
+    )
+    return len(attendance)
+
+
+async def main(args):
+    db = connect_from_env()
+    t0 = time.perf_counter()
+    await clean(db)
+    if args.clean:
+        print(f"✅ removed seeded data in {time.perf_counter() - t0:.1f} s")
+        return
+
+    await ensure_indexes(db)
+    rng = random.Random(args.seed)
+    now = datetime.now(timezone.utc)
+    # one bcrypt hash shared by every seeded user
+    password = await hash_password(args.password)
+    await db.users.insert_one({
+        "_id": "user_seed_admin", "email": ADMIN_EMAIL, "name": "Seed Admin", "role": "head_admin",
+        "password": password, "created_at": now, "must_change_password": False, "seed": True,
+    })
+
+    rows = 0
+    for g in range(args.gyms):
+        rows += await seed_gym(db, g, args, rng, password, now)
+        print(f"  gym {g + 1}/{args.gyms}: {rows:,} attendance rows so far")
+    for g in range(args.gyms):
+        await rebuild_attendance_rollups(db, seed_gym_id(g))
+        await rebuild_payment_rollups(db, seed_gym_id(g))
+
+    print(f"✅ seeded {args.gyms} gyms, {args.gyms * args.members:,} members, {rows:,} attendance rows "
+          f"in {time.perf_counter() - t0:.1f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--gyms", type=int, default=10)
+    parser.add_argument("--members", type=int, default=200, help="members per gym")
+    parser.add_argument("--years", type=float, default=2)
+    parser.add_argument("--visits-per-week", type=float, default=3)
+    parser.add_argument("--password", default=SEED_PASSWORD)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--clean", action="store_true", help="only remove previously seeded data")
+    asyncio.run(main(parser.parse_args()))
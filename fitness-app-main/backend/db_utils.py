@@ -0,0 +1,401 @@
+# db_utils.py
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase, AsyncIOMotorCollection, AsyncIOMotorCursor
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple, Type
+from pydantic import BaseModel
+from datetime import datetime
+from dotenv import load_dotenv
+from pathlib import Path
+import asyncio
+import base64
+import certifi
+import json
+import logging
+import os
+from metrics_utils import command_listener
+from models import CURRENT_MEMBERSHIP_STATUSES
+
+logger = logging.getLogger(__name__)
+
+
+def create_mongo_client(mongo_url: str) -> AsyncIOMotorClient:
+    """Motor client for either a local or an Atlas MongoDB URL"""
+    # Handle both local and Atlas MongoDB connections
+    if "mongodb+srv" in mongo_url or "mongodb.net" in mongo_url:
+        # Atlas connection with SSL using certifi certificates
+        return AsyncIOMotorClient(
+            mongo_url,
+            tlsCAFile=certifi.where(),
+            serverSelectionTimeoutMS=5000,
+            connectTimeoutMS=10000,
+            event_listeners=[command_listener]
+        )
+    # Local MongoDB connection
+    return AsyncIOMotorClient(mongo_url, event_listeners=[command_listener])
+
+
+def connect_from_env() -> AsyncIOMotorDatabase:
+    """Database handle from MONGO_URL/DB_NAME, for jobs and scripts run outside the API"""
+    load_dotenv(Path(__file__).parent / '.env')
+    client = create_mongo_client(os.environ['MONGO_URL'])
+    return client[os.environ.get('DB_NAME', 'fitdesert')]
+
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+DocsTransform = Callable[[List[dict]], Awaitable[List[dict]]]
+
+
+async def attach_user_info(db: AsyncIOMotorDatabase, docs: List[dict], user_field: str = "user_id") -> List[dict]:
+    """Attach user_name/user_email to each doc using a single $in query on users"""
+    user_ids = list({doc[user_field] for doc in docs if doc.get(user_field)})
+    if not user_ids:
+        return docs
+
+    users = await db.users.find(
+        {"_id": {"$in": user_ids}},
+        {"name": 1, "email": 1}
+    ).to_list(None)
+    users_by_id = {u["_id"]: u for u in users}
+
+    for doc in docs:
+        user_doc = users_by_id.get(doc.get(user_field))
+        if user_doc:
+            doc["user_name"] = user_doc["name"]
+            doc["user_email"] = user_doc["email"]
+    return docs
+
+
+async def attach_member_names(db: AsyncIOMotorDatabase, docs: List[dict], member_field: str = "member_id") -> List[dict]:
+    """Attach member_name to each doc by resolving members -> users in one $lookup aggregation"""
+    member_ids = list({doc[member_field] for doc in docs if doc.get(member_field)})
+    if not member_ids:
+        return docs
+
+    members = await db.members.aggregate([
+        {"$match": {"_id": {"$in": member_ids}}},
+        {"$lookup": {
+            "from": "users",
+            "localField": "user_id",
+            "foreignField": "_id",
+            "as": "user"
+        }},
+        {"$project": {"name": {"$arrayElemAt": ["$user.name", 0]}}}
+    ]).to_list(None)
+    names_by_member = {m["_id"]: m.get("name") for m in members}
+
+    for doc in docs:
+        member_id = doc.get(member_field)
+        if member_id in names_by_member:
+            doc["member_name"] = names_by_member[member_id] or "Unknown"
+    return docs
+
+
+
+def parse_fields(fields: Optional[str], model: Type[BaseModel]) -> List[str]:
+    """Response fields for a ?fields=a,b,c sparse fieldset (all of the model's fields if omitted)"""
+    available = list(model.model_fields)
+    if not fields:
+        return available
+    wanted = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in wanted if f not in available]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return wanted
+
+
+def fields_projection(fields: Iterable[str], *required: str) -> dict:
+    """
+    Inclusion projection for response fields plus any stored fields needed to
+    build them (join keys, sort keys). "id" maps to _id, which is always returned;
+    computed names simply match nothing.
+    """
+    return {f: 1 for f in (*fields, *required) if f != "id"}
+
+
+def select_fields(docs: List[dict], fields: Iterable[str]) -> List[dict]:
+    """Drop everything but the selected response fields from a batch of documents"""
+    wanted = set(fields)
+    return [{k: v for k, v in doc.items() if k in wanted} for doc in docs]
+
+
+async def gym_dashboard_stats(db: AsyncIOMotorDatabase, gym_ids: List[str], today: str) -> Dict[str, dict]:
+    """
+    Member totals, active members and today's attendance for a batch of gyms.
+    One $group over members and one over attendance, issued concurrently.
+    """
+    if not gym_ids:
+        return {}
+
+    member_stats, attendance_stats = await asyncio.gather(
+        db.members.aggregate([
+            {"$match": {"gym_id": {"$in": gym_ids}}},
+            {"$group": {
+                "_id": "$gym_id",
+                "total_members": {"$sum": 1},
+                "active_members": {"$sum": {"$cond": [{"$in": ["$status", CURRENT_MEMBERSHIP_STATUSES]}, 1, 0]}}
+            }}
+        ]).to_list(None),
+        db.attendance.aggregate([
+            {"$match": {"gym_id": {"$in": gym_ids}, "date": today}},
+            {"$group": {"_id": "$gym_id", "today_attendance": {"$sum": 1}}}
+        ]).to_list(None)
+    )
+
+    stats = {
+        gym_id: {"total_members": 0, "active_members": 0, "today_attendance": 0}
+        for gym_id in gym_ids
+    }
+    for row in member_stats:
+        stats[row["_id"]]["total_members"] = row["total_members"]
+        stats[row["_id"]]["active_members"] = row["active_members"]
+    for row in attendance_stats:
+        stats[row["_id"]]["today_attendance"] = row["today_attendance"]
+    return stats
+
+
+# ==================== PAGINATION ====================
+
+def encode_cursor(doc: dict, sort_field: str = "_id") -> str:
+    """Build an opaque keyset cursor from the last document of a page"""
+    value = doc.get(sort_field)
+    if isinstance(value, datetime):
+        value = {"$date": value.isoformat()}
+    raw = json.dumps([value, doc["_id"]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[object, object]:
+    """Decode a cursor produced by encode_cursor into (sort value, _id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value, doc_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if isinstance(value, dict) and "$date" in value:
+            value = datetime.fromisoformat(value["$date"])
+        return value, doc_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def keyset_query(query: dict, sort_field: str, direction: int, after: Optional[str]) -> dict:
+    """Extend a query so it only matches documents after the given cursor"""
+    if not after:
+        return query
+
+    value, doc_id = decode_cursor(after)
+    op = "$gt" if direction > 0 else "$lt"
+    if sort_field == "_id":
+        condition = {"_id": {op: doc_id}}
+    elif value is None:
+        # null/missing values sort before all others: ascending pages move on
+        # to the non-null values, descending ones only have nulls left
+        condition = {"$or": [
+            {sort_field: {"$ne": None}},
+            {sort_field: None, "_id": {op: doc_id}}
+        ]} if direction > 0 else {sort_field: None, "_id": {op: doc_id}}
+    else:
+        clauses = [
+            {sort_field: {op: value}},
+            {sort_field: value, "_id": {op: doc_id}}
+        ]
+        if direction < 0:
+            # comparisons never match null, which sorts after every value here
+            clauses.append({sort_field: None})
+        condition = {"$or": clauses}
+    return {"$and": [query, condition]} if query else condition
+
+
+def keyset_sort(sort_field: str, direction: int) -> List[Tuple[str, int]]:
+    """Sort spec matching keyset_query (the _id tiebreaker keeps pages stable)"""
+    if sort_field == "_id":
+        return [("_id", direction)]
+    return [(sort_field, direction), ("_id", direction)]
+
+
+async def fetch_page(
+    collection: AsyncIOMotorCollection,
+    query: dict,
+    *,
+    sort_field: str = "_id",
+    direction: int = 1,
+    limit: int = 100,
+    after: Optional[str] = None,
+    projection: Optional[dict] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """Fetch one keyset page; returns (docs, next cursor or None)"""
+    docs = await collection.find(
+        keyset_query(query, sort_field, direction, after),
+        projection
+    ).sort(keyset_sort(sort_field, direction)).limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1], sort_field)
+    return docs, next_cursor
+
+
+def find_sorted(
+    collection: AsyncIOMotorCollection,
+    query: dict,
+    *,
+    sort_field: str = "_id",
+    direction: int = 1,
+    after: Optional[str] = None,
+    projection: Optional[dict] = None
+) -> AsyncIOMotorCursor:
+    """Unbounded cursor in keyset order, for streaming responses"""
+    return collection.find(
+        keyset_query(query, sort_field, direction, after),
+        projection
+    ).sort(keyset_sort(sort_field, direction)).batch_size(STREAM_BATCH_SIZE)
+
+
+async def iter_ndjson(cursor: AsyncIOMotorCursor, transform: Optional[DocsTransform] = None) -> AsyncIterator[bytes]:
+    """Yield NDJSON lines straight from a Motor cursor, transforming one batch at a time"""
+    batch = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= STREAM_BATCH_SIZE:
+            yield _encode_ndjson(await transform(batch) if transform else batch)
+            batch = []
+    if batch:
+        yield _encode_ndjson(await transform(batch) if transform else batch)
+
+
+def _encode_ndjson(docs: List[dict]) -> bytes:
+    return "".join(json.dumps(jsonable_encoder(doc)) + "\n" for doc in docs).encode()
+
+
+def ndjson_response(cursor: AsyncIOMotorCursor, transform: Optional[DocsTransform] = None) -> StreamingResponse:
+    """Stream a Motor cursor as application/x-ndjson"""
+    return StreamingResponse(iter_ndjson(cursor, transform), media_type="application/x-ndjson")
+
+
+# ==================== INDEXES ====================
+
+# Every index the API's hot paths rely on. ensure_indexes() creates them at
+# startup; creating an index that already exists with the same spec is a no-op.
+INDEXES: Dict[str, List[IndexModel]] = {
+    "user_sessions": [
+        IndexModel([("session_token", ASCENDING)], name="session_token"),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        # Mongo removes sessions once expires_at has passed
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+        # media_utils reference checks
+        IndexModel([("picture", ASCENDING)], name="picture", sparse=True),
+    ],
+    "gyms": [
+        IndexModel([("owner_id", ASCENDING)], name="owner_id"),
+    ],
+    "members": [
+        IndexModel([("gym_id", ASCENDING), ("_id", ASCENDING)], name="gym_id_id"),
+        IndexModel([("gym_id", ASCENDING), ("status", ASCENDING)], name="gym_id_status"),
+        IndexModel([("gym_id", ASCENDING), ("role", ASCENDING)], name="gym_id_role"),
+        IndexModel([("user_id", ASCENDING)], name="user_id"),
+        # membership_utils status sweeps
+        IndexModel([("status", ASCENDING), ("membership_expiry", ASCENDING)], name="status_membership_expiry"),
+        # /members?sort=churn_risk
+        IndexModel([("gym_id", ASCENDING), ("churn_risk", DESCENDING), ("_id", DESCENDING)], name="gym_id_churn_risk"),
+        # media_utils reference checks
+        IndexModel([("photo_id", ASCENDING)], name="photo_id", sparse=True),
+    ],
+    "attendance": [
+        IndexModel(
+            [("member_id", ASCENDING), ("gym_id", ASCENDING), ("date", ASCENDING)],
+            name="member_gym_date_unique", unique=True
+        ),
+        IndexModel([("gym_id", ASCENDING), ("check_in_time", ASCENDING)], name="gym_id_check_in_time"),
+        IndexModel([("gym_id", ASCENDING), ("date", ASCENDING)], name="gym_id_date"),
+        IndexModel([("member_id", ASCENDING), ("check_in_time", DESCENDING)], name="member_id_check_in_time"),
+    ],
+    "payments": [
+        IndexModel(
+            [("gym_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING)],
+            name="gym_id_status_created_at"
+        ),
+        IndexModel([("gym_id", ASCENDING), ("created_at", DESCENDING)], name="gym_id_created_at"),
+        IndexModel([("member_id", ASCENDING), ("created_at", DESCENDING)], name="member_id_created_at"),
+    ],
+    "workout_plans": [
+        IndexModel([("member_id", ASCENDING)], name="member_id"),
+        IndexModel([("gym_id", ASCENDING)], name="gym_id"),
+    ],
+    "diet_plans": [
+        IndexModel([("member_id", ASCENDING)], name="member_id"),
+        IndexModel([("gym_id", ASCENDING)], name="gym_id"),
+    ],
+    "progress_logs": [
+        IndexModel([("member_id", ASCENDING), ("logged_date", DESCENDING)], name="member_id_logged_date"),
+        IndexModel([("gym_id", ASCENDING)], name="gym_id"),
+        IndexModel([("photo_ids", ASCENDING)], name="photo_ids", sparse=True),
+    ],
+    # rollup_utils.ATTENDANCE_ROLLUPS; looked up by _id, deleted by gym
+    "attendance_daily": [
+        IndexModel([("gym_id", ASCENDING), ("date", ASCENDING)], name="gym_id_date"),
+    ],
+    # rollup_utils.PAYMENT_ROLLUPS; same access pattern
+    "payments_monthly": [
+        IndexModel([("gym_id", ASCENDING), ("month", ASCENDING)], name="gym_id_month"),
+    ],
+    "chat_messages": [
+        IndexModel([("user_id", ASCENDING), ("timestamp", ASCENDING)], name="user_id_timestamp"),
+    ],
+}
+
+
+async def _ensure_collection_indexes(db: AsyncIOMotorDatabase, collection: str, models: List[IndexModel]) -> dict:
+    created, failed = [], {}
+    # One index per command so a conflicting or unbuildable index (e.g. a unique
+    # index over existing duplicates) doesn't block the rest
+    for model in models:
+        name = model.document["name"]
+        try:
+            await db[collection].create_indexes([model])
+            created.append(name)
+        except OperationFailure as e:
+            logger.warning(f"Could not create index {collection}.{name}: {e}")
+            failed[name] = str(e)
+    return {"ensured": created, "failed": failed}
+
+
+async def ensure_indexes(db: AsyncIOMotorDatabase) -> Dict[str, dict]:
+    """Idempotently create every declared index; returns per-collection results"""
+    results = await asyncio.gather(*[
+        _ensure_collection_indexes(db, collection, models)
+        for collection, models in INDEXES.items()
+    ])
+    return dict(zip(INDEXES.keys(), results))
+
+
+async def index_usage_report(db: AsyncIOMotorDatabase) -> Dict[str, dict]:
+    """Per-collection index usage ($indexStats) plus any declared index that is missing"""
+    async def collection_report(collection: str) -> dict:
+        stats = await db[collection].aggregate([{"$indexStats": {}}]).to_list(None)
+        existing = {s["name"] for s in stats}
+        return {
+            "indexes": [
+                {
+                    "name": s["name"],
+                    "key": dict(s["key"]),
+                    "ops": s.get("accesses", {}).get("ops", 0),
+                    "since": s.get("accesses", {}).get("since"),
+                }
+                for s in sorted(stats, key=lambda s: s["name"])
+            ],
+            "missing": [
+                m.document["name"] for m in INDEXES[collection]
+                if m.document["name"] not in existing
+            ],
+        }
+
+    reports = await asyncio.gather(*[collection_report(c) for c in INDEXES])
+    return dict(zip(INDEXES.keys(), reports))
@@ -0,0 +1,185 @@
+# delete_utils.py
+"""
+Cascading deletes for gyms and members.
+
+Small cascades run as one MongoDB transaction when the deployment supports
+them (replica set / sharded cluster). A session can't be shared by concurrent
+operations, so inside a transaction the deletes are issued back to back; on a
+standalone server they run concurrently instead.
+
+Gyms with more than DELETE_INLINE_LIMIT attendance rows are deleted by a
+background job tracked in the delete_jobs collection:
+
+    {_id, kind: "gym", target_id, status: running|done|failed,
+     total: {collection: n}, deleted: {collection: n}, error, created_at, finished_at}
+
+The job marks the gym inactive first, removes related documents in batches
+(collections in parallel) and deletes the gym document last, so repeating the
+delete after a crash picks up where it stopped.
+
+Photos the deleted documents referenced are removed from the media store once
+nothing else refers to them (media_utils gc catches any a crash leaves behind).
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set, Tuple
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from archive_utils import remove_gym_archive
+from id_utils import new_id
+from media_utils import remove_unreferenced_media
+from rollup_utils import ATTENDANCE_ROLLUPS, PAYMENT_ROLLUPS
+
+logger = logging.getLogger(__name__)
+
+DELETE_INLINE_LIMIT = int(os.environ.get("DELETE_INLINE_LIMIT", 10000))
+DELETE_BATCH_SIZE = int(os.environ.get("DELETE_BATCH_SIZE", 5000))
+
+# Collections holding documents that belong to a gym / a member
+GYM_CASCADE = [
+    "members", "attendance", ATTENDANCE_ROLLUPS, "workout_plans", "diet_plans", "progress_logs", "payments",
+    PAYMENT_ROLLUPS
+]
+MEMBER_CASCADE = ["attendance", "workout_plans", "diet_plans", "progress_logs", "payments"]
+
+Deletes = List[Tuple[str, dict]]
+
+_supports_transactions: Optional[bool] = None
+_running_jobs: Set[asyncio.Task] = set()
+
+
+async def supports_transactions(db: AsyncIOMotorDatabase) -> bool:
+    """Whether the server is a replica set or mongos (checked once per process)"""
+    global _supports_transactions
+    if _supports_transactions is None:
+        try:
+            hello = await db.command("hello")
+            _supports_transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+        except Exception:
+            _supports_transactions = False
+    return _supports_transactions
+
+
+async def delete_all(db: AsyncIOMotorDatabase, deletes: Deletes) -> Dict[str, int]:
+    """Run a set of delete_many calls atomically if possible, else concurrently; returns counts"""
+    if await supports_transactions(db):
+        counts = {}
+
+        async def run(session):
+            counts.clear()
+            for collection, query in deletes:
+                result = await db[collection].delete_many(query, session=session)
+                counts[collection] = counts.get(collection, 0) + result.deleted_count
+
+        async with await db.client.start_session() as session:
+            await session.with_transaction(run)
+        return counts
+
+    results = await asyncio.gather(*[db[collection].delete_many(query) for collection, query in deletes])
+    counts = {}
+    for (collection, _), result in zip(deletes, results):
+        counts[collection] = counts.get(collection, 0) + result.deleted_count
+    return counts
+
+
+def member_deletes(member_id: str) -> Deletes:
+    return [("members", {"_id": member_id})] + [(c, {"member_id": member_id}) for c in MEMBER_CASCADE]
+
+
+async def media_ids(db: AsyncIOMotorDatabase, members: dict, progress_logs: dict) -> List[str]:
+    """Media referenced by the matching members and progress logs (collect before deleting them)"""
+    photos, progress = await asyncio.gather(
+        db.members.distinct("photo_id", members), db.progress_logs.distinct("photo_ids", progress_logs)
+    )
+    return [media_id for media_id in photos + progress if media_id]
+
+
+def member_media_ids(db: AsyncIOMotorDatabase, member_id: str):
+    return media_ids(db, {"_id": member_id}, {"member_id": member_id})
+
+
+def gym_media_ids(db: AsyncIOMotorDatabase, gym_id: str):
+    return media_ids(db, {"gym_id": gym_id}, {"gym_id": gym_id})
+
+
+def gym_deletes(gym_id: str) -> Deletes:
+    return [(c, {"gym_id": gym_id}) for c in GYM_CASCADE] + [("gyms", {"_id": gym_id})]
+
+
+async def _delete_in_batches(db: AsyncIOMotorDatabase, job_id: str, collection: str, query: dict) -> None:
+    while True:
+        ids = [doc["_id"] async for doc in db[collection].find(query, {"_id": 1}).limit(DELETE_BATCH_SIZE)]
+        if not ids:
+            return
+        result = await db[collection].delete_many({"_id": {"$in": ids}})
+        await db.delete_jobs.update_one({"_id": job_id}, {"$inc": {f"deleted.{collection}": result.deleted_count}})
+
+
+async def _run_gym_job(db: AsyncIOMotorDatabase, job_id: str, gym_id: str) -> None:
+    try:
+        photos = await gym_media_ids(db, gym_id)
+        await asyncio.gather(*[
+            _delete_in_batches(db, job_id, collection, {"gym_id": gym_id}) for collection in GYM_CASCADE
+        ])
+        await remove_gym_archive(gym_id)
+        await remove_unreferenced_media(db, photos)
+        await db.gyms.delete_one({"_id": gym_id})
+        await db.delete_jobs.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "done", "deleted.gyms": 1, "finished_at": datetime.now(timezone.utc)}}
+        )
+    except Exception as e:
+        logger.error("Delete job %s for %s failed: %s", job_id, gym_id, e)
+        await db.delete_jobs.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "failed", "error": str(e), "finished_at": datetime.now(timezone.utc)}}
+        )
+
+
+async def start_gym_delete_job(db: AsyncIOMotorDatabase, gym_id: str) -> dict:
+    """Deactivate a gym and delete it with its related data in the background; returns the job"""
+    await db.gyms.update_one({"_id": gym_id}, {"$set": {"is_active": False, "deleting": True}})
+    totals = await asyncio.gather(*[db[c].count_documents({"gym_id": gym_id}) for c in GYM_CASCADE])
+    job = {
+        "_id": new_id("deljob"),
+        "kind": "gym",
+        "target_id": gym_id,
+        "status": "running",
+        "total": {**dict(zip(GYM_CASCADE, totals)), "gyms": 1},
+        "deleted": {c: 0 for c in [*GYM_CASCADE, "gyms"]},
+        "error": None,
+        "created_at": datetime.now(timezone.utc),
+        "finished_at": None,
+    }
+    await db.delete_jobs.insert_one(job)
+
+    task = asyncio.create_task(_run_gym_job(db, job["_id"], gym_id))
+    _running_jobs.add(task)
+    task.add_done_callback(_running_jobs.discard)
+    return job
+
+
+async def delete_gym_cascade(db: AsyncIOMotorDatabase, gym_id: str) -> Optional[dict]:
+    """Delete a gym with its related data: inline if small, else as a background job (returned)"""
+    attendance = await db.attendance.count_documents({"gym_id": gym_id}, limit=DELETE_INLINE_LIMIT + 1)
+    if attendance > DELETE_INLINE_LIMIT:
+        return await start_gym_delete_job(db, gym_id)
+    photos = await gym_media_ids(db, gym_id)
+    await delete_all(db, gym_deletes(gym_id))
+    await remove_gym_archive(gym_id)
+    await remove_unreferenced_media(db, photos)
+    return None
+
+
+async def delete_job_status(db: AsyncIOMotorDatabase, job_id: str) -> Optional[dict]:
+    """A delete job with overall progress (0-1)"""
+    job = await db.delete_jobs.find_one({"_id": job_id})
+    if not job:
+        return None
+    total = sum(job["total"].values())
+    job["id"] = job.pop("_id")
+    job["progress"] = round(sum(job["deleted"].values()) / total, 4) if total else 1.0
+    return job
@@ -0,0 +1,54 @@
+# http_utils.py
+import asyncio
+import os
+import random
+from typing import Optional
+
+import httpx
+
+# One keep-alive pool shared by every outbound call the API makes
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 10))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 3))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 50))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", 2))
+HTTP_BACKOFF = float(os.environ.get("HTTP_BACKOFF", 0.2))
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Shared pooled async HTTP client (created on first use)"""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS
+            )
+        )
+    return _client
+
+
+async def close_http_client():
+    """Close the shared HTTP client"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+async def get_with_retry(url: str, *, headers: Optional[dict] = None, retries: int = HTTP_RETRIES) -> httpx.Response:
+    """
+    GET with retries on connection errors, timeouts and 5xx responses.
+    Waits between attempts use exponential backoff with full jitter.
+    """
+    for attempt in range(retries + 1):
+        try:
+            response = await get_http_client().get(url, headers=headers)
+            if response.status_code < 500 or attempt == retries:
+                return response
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+        await asyncio.sleep(random.uniform(0, HTTP_BACKOFF * 2 ** attempt))
@@ -0,0 +1,47 @@
+# id_utils.py
+"""
+Document ids: "<prefix>_<unix seconds>.<micros:6><sequence:3><node:4>"
+
+e.g. gym_1729700000.1234560000042. Ids keep the shape of the legacy
+f"gym_{datetime.utcnow().timestamp()}" ids (digits, one dot), so existing QR
+payloads and the attendance QR regex keep working, and they sort by creation
+time alongside legacy ids. A per-process sequence makes ids unique within a
+process even when the clock stalls or steps back; the random node suffix
+separates processes.
+"""
+import os
+import random
+import threading
+import time
+
+_lock = threading.Lock()
+_last_micros = 0
+_sequence = 0
+_node = ""
+
+
+def _reset_node():
+    global _node, _last_micros, _sequence
+    _node = f"{random.SystemRandom().randrange(10000):04d}"
+    _last_micros, _sequence = 0, 0
+
+
+_reset_node()
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_node)
+
+
+def new_id(prefix: str) -> str:
+    """Monotonic, time-sortable id for a new document"""
+    global _last_micros, _sequence
+    with _lock:
+        now = time.time_ns() // 1000
+        if now > _last_micros:
+            _last_micros, _sequence = now, 0
+        else:
+            _sequence += 1
+            if _sequence > 999:
+                # borrow the next microsecond rather than wrap
+                _last_micros, _sequence = _last_micros + 1, 0
+        micros, sequence = _last_micros, _sequence
+    return f"{prefix}_{micros // 1_000_000}.{micros % 1_000_000:06d}{sequence:03d}{_node}"
@@ -0,0 +1,345 @@
+# media_utils.py
+"""
+Content-addressed media store for member and progress photos.
+
+Files live on local disk under MEDIA_DIR, named by the sha256 of their bytes,
+so uploading the same image twice stores it once:
+
+    <MEDIA_DIR>/<sha[:2]>/<sha>                 original
+    <MEDIA_DIR>/thumbs/<sha[:2]>/<sha>.jpg      thumbnail (MEDIA_THUMB_SIZE px)
+
+The media collection keeps {_id: sha, content_type, size, width, height,
+uploaded_at}. Documents reference media by id (members.photo_id,
+progress_logs.photo_ids, users.picture holds the /api/media URL). Image
+decoding and thumbnailing run on a small worker pool, off the event loop.
+
+Deleting a member removes the files only they referenced. Files can also be
+orphaned by uploads that were never attached to anything, so a daily cron
+should run the garbage collector, which deletes unreferenced files uploaded
+more than MEDIA_GC_GRACE seconds ago:
+
+    python -m media_utils gc
+
+Existing base64 fields are moved into the store with:
+
+    python -m media_utils migrate-base64
+"""
+import argparse
+import asyncio
+import base64
+import binascii
+import hashlib
+import os
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Iterable, List, Optional, Set, Tuple
+
+from fastapi import HTTPException, UploadFile
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from PIL import Image, UnidentifiedImageError
+
+from db_utils import connect_from_env
+
+MEDIA_DIR = Path(os.environ.get("MEDIA_DIR", Path(__file__).parent / ".media"))
+MEDIA_MAX_BYTES = int(os.environ.get("MEDIA_MAX_BYTES", 10 * 1024 * 1024))
+MEDIA_THUMB_SIZE = int(os.environ.get("MEDIA_THUMB_SIZE", 256))
+MEDIA_WORKERS = int(os.environ.get("MEDIA_WORKERS", min(4, os.cpu_count() or 1)))
+MEDIA_GC_GRACE = int(os.environ.get("MEDIA_GC_GRACE", 24 * 3600))
+MEDIA_CHUNK_SIZE = 1024 * 1024
+MEDIA_GC_BATCH = 1000
+
+# Pillow format -> content type for the image types we accept
+FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+
+_media_executor = ThreadPoolExecutor(max_workers=MEDIA_WORKERS, thread_name_prefix="media")
+_MEDIA_ID = re.compile(r"^[0-9a-f]{64}$")
+_DATA_URL = re.compile(r"^data:[\w/+.-]+;base64,")
+
+
+class InvalidImage(Exception):
+    """The uploaded bytes are not an image we accept"""
+
+
+def media_url(media_id: str) -> str:
+    """API path serving a stored file"""
+    return f"/api/media/{media_id}"
+
+
+def _original_path(media_id: str) -> Path:
+    return MEDIA_DIR / media_id[:2] / media_id
+
+
+def _thumbnail_path(media_id: str) -> Path:
+    return MEDIA_DIR / "thumbs" / media_id[:2] / f"{media_id}.jpg"
+
+
+def _write_thumbnail(image: Image.Image, media_id: str) -> None:
+    path = _thumbnail_path(media_id)
+    if path.exists():
+        return
+    thumb = image.convert("RGB")
+    thumb.thumbnail((MEDIA_THUMB_SIZE, MEDIA_THUMB_SIZE))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{uuid.uuid4().hex}.tmp")
+    thumb.save(tmp_path, format="JPEG", quality=80)
+    tmp_path.replace(path)
+
+
+def _open_image(path: Path) -> Image.Image:
+    """Open and decode an uploaded file; InvalidImage if it isn't a supported image"""
+    try:
+        image = Image.open(path)
+    except (UnidentifiedImageError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e)) from e
+    try:
+        if image.format not in FORMATS:
+            raise InvalidImage(f"Unsupported image format {image.format}")
+        # decoders report truncated or corrupt data as OSError / SyntaxError
+        image.load()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        image.close()
+        raise InvalidImage(str(e)) from e
+    except InvalidImage:
+        image.close()
+        raise
+    return image
+
+
+def _ingest_file(tmp_path: Path, media_id: str) -> Tuple[str, int, int]:
+    """Validate an uploaded temp file as an image, thumbnail it and move it into place"""
+    try:
+        with _open_image(tmp_path) as image:
+            _write_thumbnail(image, media_id)
+            content_type, width, height = FORMATS[image.format], image.width, image.height
+
+        path = _original_path(media_id)
+        if path.exists():
+            # already stored (dedup)
+            tmp_path.unlink(missing_ok=True)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.replace(path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return content_type, width, height
+
+
+def _new_tmp_path() -> Path:
+    tmp_dir = MEDIA_DIR / "tmp"
+    tmp_dir.mkdir(parents=True, exist_ok=True)
+    return tmp_dir / uuid.uuid4().hex
+
+
+async def _commit(db: AsyncIOMotorDatabase, tmp_path: Path, media_id: str, size: int) -> dict:
+    loop = asyncio.get_running_loop()
+    try:
+        content_type, width, height = await loop.run_in_executor(_media_executor, _ingest_file, tmp_path, media_id)
+    except InvalidImage:
+        raise HTTPException(status_code=400, detail="File is not a supported image (JPEG, PNG, WebP or GIF)")
+
+    # uploaded_at is refreshed on every upload so the garbage collector
+    # leaves freshly (re)uploaded files alone until they can be referenced
+    await db.media.update_one(
+        {"_id": media_id},
+        {"$set": {"uploaded_at": datetime.now(timezone.utc)}, "$setOnInsert": {
+            "content_type": content_type,
+            "size": size,
+            "width": width,
+            "height": height,
+            "created_at": datetime.now(timezone.utc)
+        }},
+        upsert=True
+    )
+    return {
+        "id": media_id,
+        "url": media_url(media_id),
+        "thumbnail_url": f"{media_url(media_id)}?size=thumb",
+        "content_type": content_type,
+        "size": size,
+    }
+
+
+async def save_upload(db: AsyncIOMotorDatabase, upload: UploadFile) -> dict:
+    """Stream an uploaded image to disk in chunks, hashing as it goes; returns its media reference"""
+    tmp_path = _new_tmp_path()
+    digest, size = hashlib.sha256(), 0
+    try:
+        with open(tmp_path, "wb") as f:
+            while chunk := await upload.read(MEDIA_CHUNK_SIZE):
+                size += len(chunk)
+                if size > MEDIA_MAX_BYTES:
+                    raise HTTPException(status_code=413, detail=f"Files are limited to {MEDIA_MAX_BYTES} bytes")
+                digest.update(chunk)
+                await asyncio.to_thread(f.write, chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    return await _commit(db, tmp_path, digest.hexdigest(), size)
+
+
+def _write_bytes(data: bytes) -> Tuple[Path, str]:
+    tmp_path = _new_tmp_path()
+    tmp_path.write_bytes(data)
+    return tmp_path, hashlib.sha256(data).hexdigest()
+
+
+async def save_base64(db: AsyncIOMotorDatabase, data: str) -> str:
+    """Store a base64 (or data: URL) image sent inline by older clients; returns its media id"""
+    try:
+        raw = await asyncio.to_thread(base64.b64decode, _DATA_URL.sub("", data.strip()), validate=False)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid base64 image")
+    if len(raw) > MEDIA_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Files are limited to {MEDIA_MAX_BYTES} bytes")
+
+    tmp_path, media_id = await asyncio.to_thread(_write_bytes, raw)
+    media = await _commit(db, tmp_path, media_id, len(raw))
+    return media["id"]
+
+
+async def save_base64_list(db: AsyncIOMotorDatabase, items: Optional[List[str]]) -> List[str]:
+    """save_base64 for a list of images, stored concurrently"""
+    return list(await asyncio.gather(*[save_base64(db, item) for item in items or []]))
+
+
+def _regenerate_thumbnail(media_id: str) -> None:
+    with Image.open(_original_path(media_id)) as image:
+        _write_thumbnail(image, media_id)
+
+
+async def media_file(db: AsyncIOMotorDatabase, media_id: str, thumbnail: bool = False) -> Tuple[Path, str]:
+    """(path, content type) of a stored file or its thumbnail; 404 if unknown"""
+    if not _MEDIA_ID.match(media_id):
+        raise HTTPException(status_code=404, detail="Media not found")
+    media = await db.media.find_one({"_id": media_id}, {"content_type": 1})
+    if not media or not _original_path(media_id).exists():
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    if not thumbnail:
+        return _original_path(media_id), media["content_type"]
+
+    path = _thumbnail_path(media_id)
+    if not path.exists():
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(_media_executor, _regenerate_thumbnail, media_id)
+    return path, "image/jpeg"
+
+
+async def _unreferenced(db: AsyncIOMotorDatabase, media_ids: Set[str]) -> Set[str]:
+    """The media ids no member, progress log or user picture refers to"""
+    ids = list(media_ids)
+    photos, progress, pictures = await asyncio.gather(
+        db.members.distinct("photo_id", {"photo_id": {"$in": ids}}),
+        db.progress_logs.distinct("photo_ids", {"photo_ids": {"$in": ids}}),
+        db.users.distinct("picture", {"picture": {"$in": [media_url(media_id) for media_id in ids]}}),
+    )
+    used = set(photos) | set(progress) | {url.rsplit("/", 1)[-1] for url in pictures}
+    return media_ids - used
+
+
+def _remove_files(media_id: str) -> None:
+    _original_path(media_id).unlink(missing_ok=True)
+    _thumbnail_path(media_id).unlink(missing_ok=True)
+
+
+async def remove_unreferenced_media(
+    db: AsyncIOMotorDatabase,
+    media_ids: Iterable[str],
+    grace: int = MEDIA_GC_GRACE
+) -> int:
+    """Delete the given media that nothing references and that wasn't uploaded within grace seconds; returns count"""
+    settled = {"uploaded_at": {"$not": {"$gte": datetime.now(timezone.utc) - timedelta(seconds=grace)}}}
+    candidates = {
+        m["_id"] async for m in db.media.find({"_id": {"$in": list(set(media_ids))}, **settled}, {"_id": 1})
+    }
+    if not candidates:
+        return 0
+
+    removed = 0
+    for media_id in await _unreferenced(db, candidates):
+        # re-check uploaded_at so a concurrent re-upload keeps its file
+        result = await db.media.delete_one({"_id": media_id, **settled})
+        if result.deleted_count:
+            await asyncio.to_thread(_remove_files, media_id)
+            removed += 1
+    return removed
+
+
+def _remove_stale_tmp_files(grace: int) -> None:
+    cutoff = datetime.now(timezone.utc).timestamp() - grace
+    for path in (MEDIA_DIR / "tmp").glob("*"):
+        if path.stat().st_mtime < cutoff:
+            path.unlink(missing_ok=True)
+
+
+async def collect_garbage(db: AsyncIOMotorDatabase, grace: int = MEDIA_GC_GRACE) -> int:
+    """Delete every stored file nothing references (and abandoned temp files); returns media removed"""
+    removed, after = 0, None
+    while True:
+        query = {"_id": {"$gt": after}} if after else {}
+        batch = [m["_id"] async for m in db.media.find(query, {"_id": 1}).sort("_id", 1).limit(MEDIA_GC_BATCH)]
+        if not batch:
+            break
+        removed += await remove_unreferenced_media(db, batch, grace)
+        after = batch[-1]
+    await asyncio.to_thread(_remove_stale_tmp_files, grace)
+    return removed
+
+
+def shutdown_media_pool() -> None:
+    """Stop the media worker threads"""
+    _media_executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def migrate_base64(db: AsyncIOMotorDatabase) -> dict:
+    """Move inline base64 photos into the store and replace them with references"""
+    counts = {"members": 0, "users": 0, "progress_logs": 0, "failed": 0}
+
+    async def migrate(collection: str, query: dict, projection: dict, convert) -> None:
+        async for doc in db[collection].find(query, projection):
+            try:
+                update = await convert(doc)
+            except HTTPException:
+                counts["failed"] += 1
+                continue
+            await db[collection].update_one({"_id": doc["_id"]}, update)
+            counts[collection] += 1
+
+    async def member_photo(doc):
+        return {"$set": {"photo_id": await save_base64(db, doc["photo"])}, "$unset": {"photo": ""}}
+
+    async def user_picture(doc):
+        return {"$set": {"picture": media_url(await save_base64(db, doc["picture"]))}}
+
+    async def progress_photos(doc):
+        return {"$set": {"photo_ids": await save_base64_list(db, doc["photos"])}, "$unset": {"photos": ""}}
+
+    await migrate("members", {"photo": {"$type": "string", "$ne": ""}}, {"photo": 1}, member_photo)
+    # OAuth pictures are plain URLs; only inline images are migrated
+    await migrate("users", {"picture": {"$type": "string", "$not": re.compile(r"^(https?:|/api/)")}},
+                  {"picture": 1}, user_picture)
+    await migrate("progress_logs", {"photos.0": {"$exists": True}}, {"photos": 1}, progress_photos)
+    await db.members.update_many({"photo": {"$in": [None, ""]}}, {"$unset": {"photo": ""}})
+    await db.progress_logs.update_many({"photos": {"$in": [None, []]}}, {"$unset": {"photos": ""}})
+    return counts
+
+
+async def _main(args) -> None:
+    db = connect_from_env()
+    if args.command == "migrate-base64":
+        counts = await migrate_base64(db)
+        print(f"✅ moved inline photos to {MEDIA_DIR}: {counts}")
+    elif args.command == "gc":
+        removed = await collect_garbage(db)
+        print(f"✅ removed {removed} unreferenced files from {MEDIA_DIR}")
+    shutdown_media_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Media store maintenance")
+    parser.add_argument("command", choices=["migrate-base64", "gc"])
+    asyncio.run(_main(parser.parse_args()))
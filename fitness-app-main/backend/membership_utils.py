@@ -0,0 +1,146 @@
+# membership_utils.py
+"""
+Keeps members.status in step with membership_expiry.
+
+    active / expiring_soon  -> expired         once membership_expiry has passed
+    active / expired        -> expiring_soon   within EXPIRING_SOON_DAYS of expiry
+                                               (expired: after a short extension)
+    expiring_soon / expired -> active          after an extension or renewal
+
+Frozen memberships are never touched. Each transition is one set-based
+update_many over the (status, membership_expiry) index, run periodically by an
+in-process worker started with the API. Every move stamps status_changed_at
+with the sweep time. Hooks registered with on_status_change() receive the
+members that crossed a threshold.
+
+    python -m membership_utils sweep [--dry-run]
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from db_utils import connect_from_env
+from models import MembershipStatus
+
+logger = logging.getLogger(__name__)
+
+EXPIRING_SOON_DAYS = int(os.environ.get("EXPIRING_SOON_DAYS", 7))
+# Seconds between sweeps; 0 disables the worker
+MEMBERSHIP_SWEEP_INTERVAL = int(os.environ.get("MEMBERSHIP_SWEEP_INTERVAL", 300))
+# Members handed to hooks (and updated) per batch when hooks are registered
+HOOK_BATCH_SIZE = 1000
+
+ACTIVE = MembershipStatus.ACTIVE.value
+EXPIRING_SOON = MembershipStatus.EXPIRING_SOON.value
+EXPIRED = MembershipStatus.EXPIRED.value
+
+# hook(new_status, members) with members as {_id, user_id, gym_id, membership_expiry}
+StatusHook = Callable[[str, List[dict]], Awaitable[None]]
+_hooks: List[StatusHook] = []
+
+
+def on_status_change(hook: StatusHook) -> StatusHook:
+    """Register a coroutine called with each batch of members that changed status"""
+    _hooks.append(hook)
+    return hook
+
+
+def status_for_expiry(expiry: datetime, now: Optional[datetime] = None) -> str:
+    """Status a non-frozen membership should have for its expiry date"""
+    now = now or datetime.now(timezone.utc)
+    if expiry.tzinfo is None:
+        expiry = expiry.replace(tzinfo=timezone.utc)
+    if expiry <= now:
+        return EXPIRED
+    if expiry <= now + timedelta(days=EXPIRING_SOON_DAYS):
+        return EXPIRING_SOON
+    return ACTIVE
+
+
+def _transitions(now: datetime) -> Dict[str, dict]:
+    """new status -> filter for members that should move to it"""
+    soon = now + timedelta(days=EXPIRING_SOON_DAYS)
+    return {
+        EXPIRED: {"status": {"$in": [ACTIVE, EXPIRING_SOON]}, "membership_expiry": {"$lte": now}},
+        EXPIRING_SOON: {"status": {"$in": [ACTIVE, EXPIRED]}, "membership_expiry": {"$gt": now, "$lte": soon}},
+        ACTIVE: {"status": {"$in": [EXPIRING_SOON, EXPIRED]}, "membership_expiry": {"$gt": soon}},
+    }
+
+
+async def _apply_with_hooks(db: AsyncIOMotorDatabase, status: str, query: dict, now: datetime) -> int:
+    """Move matching members in batches so hooks see exactly the members that changed"""
+    changed = 0
+    projection = {"user_id": 1, "gym_id": 1, "membership_expiry": 1}
+    cursor = db.members.find(query, {"_id": 1})
+    while batch := await cursor.to_list(HOOK_BATCH_SIZE):
+        ids = [m["_id"] for m in batch]
+        # re-apply the filter so members changed since the read are skipped,
+        # then read back the ones this sweep's timestamp marks as moved
+        await db.members.update_many(
+            {**query, "_id": {"$in": ids}}, {"$set": {"status": status, "status_changed_at": now}}
+        )
+        moved = await db.members.find(
+            {"_id": {"$in": ids}, "status": status, "status_changed_at": now}, projection
+        ).to_list(None)
+        changed += len(moved)
+        if not moved:
+            continue
+        for hook in _hooks:
+            try:
+                await hook(status, moved)
+            except Exception as e:
+                logger.error("Membership status hook %s failed: %s", hook.__name__, e)
+    return changed
+
+
+async def sweep_membership_statuses(
+    db: AsyncIOMotorDatabase,
+    now: Optional[datetime] = None,
+    dry_run: bool = False
+) -> Dict[str, int]:
+    """Apply every status transition that is due; returns members moved per new status"""
+    now = now or datetime.now(timezone.utc)
+    counts = {}
+    # expiry first, so a lapsed active member goes straight to expired
+    for status, query in _transitions(now).items():
+        if dry_run:
+            counts[status] = await db.members.count_documents(query)
+        elif _hooks:
+            counts[status] = await _apply_with_hooks(db, status, query, now)
+        else:
+            result = await db.members.update_many(query, {"$set": {"status": status, "status_changed_at": now}})
+            counts[status] = result.modified_count
+    return counts
+
+
+async def run_membership_worker(db: AsyncIOMotorDatabase, interval: int = MEMBERSHIP_SWEEP_INTERVAL) -> None:
+    """Sweep membership statuses every interval seconds until cancelled"""
+    while True:
+        try:
+            counts = await sweep_membership_statuses(db)
+            if any(counts.values()):
+                logger.info("Membership status sweep: %s", counts)
+        except Exception as e:
+            logger.error("Membership status sweep failed: %s", e)
+        await asyncio.sleep(interval)
+
+
+async def _main(args) -> None:
+    db = connect_from_env()
+    if args.command == "sweep":
+        counts = await sweep_membership_statuses(db, dry_run=args.dry_run)
+        prefix = "would move" if args.dry_run else "moved"
+        for status, n in counts.items():
+            print(f"{prefix} {n} members to {status}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Membership status maintenance")
+    parser.add_argument("command", choices=["sweep"])
+    parser.add_argument("--dry-run", action="store_true", help="Only count members that would change")
+    asyncio.run(_main(parser.parse_args()))
@@ -0,0 +1,259 @@
+# metrics_utils.py
+"""
+Request-level performance metrics and logging setup.
+
+MetricsMiddleware times every request and, through a context variable,
+collects the MongoDB commands (MongoCommandListener, registered on the Motor
+client) and LLM calls (time_llm) it makes. Each response gets a Server-Timing
+header:
+
+    Server-Timing: app;dur=41.2, db;dur=12.7;desc="5 calls", llm;dur=0.0
+
+and the totals feed in-process histograms exposed at /api/metrics in
+Prometheus text format. Routes are labelled by their template
+(/api/members/{member_id}), so label cardinality stays bounded.
+
+Logging is configured from LOG_LEVEL and LOG_FORMAT (text | json). Call sites
+pass values as logger arguments / extra={...}, so nothing is formatted for
+levels that are disabled.
+"""
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from pymongo import monitoring
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", 1000))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DB_CALL_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+logger = logging.getLogger(__name__)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus model"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestStats:
+    """Work done on behalf of one request"""
+    __slots__ = ("db_calls", "db_seconds", "llm_calls", "llm_seconds")
+
+    def __init__(self):
+        self.db_calls = 0
+        self.db_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+
+
+# Motor runs commands on its thread pool with a copy of the caller's context,
+# so the listener sees the RequestStats of the request that issued them
+_request_stats: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "request_stats", default=None
+)
+
+# metric name -> label values -> Histogram
+_histograms: Dict[str, Dict[Tuple[str, ...], Histogram]] = {}
+_lock = threading.Lock()
+
+# name -> (help, label names, buckets)
+METRICS = {
+    "fitdesert_http_request_duration_seconds": (
+        "HTTP request latency", ("method", "route", "status"), LATENCY_BUCKETS),
+    "fitdesert_http_request_db_calls": (
+        "MongoDB commands per HTTP request", ("method", "route"), DB_CALL_BUCKETS),
+    "fitdesert_http_request_db_seconds": (
+        "Time spent in MongoDB per HTTP request", ("method", "route"), LATENCY_BUCKETS),
+    "fitdesert_http_request_llm_seconds": (
+        "Time spent waiting on the LLM per HTTP request", ("method", "route"), LATENCY_BUCKETS),
+    "fitdesert_db_command_duration_seconds": (
+        "MongoDB command latency", ("command", "outcome"), LATENCY_BUCKETS),
+    "fitdesert_llm_request_duration_seconds": (
+        "LLM completion latency", ("mode", "outcome"), LATENCY_BUCKETS),
+}
+
+
+def observe(name: str, labels: Tuple[str, ...], value: float) -> None:
+    with _lock:
+        series = _histograms.setdefault(name, {})
+        histogram = series.get(labels)
+        if histogram is None:
+            histogram = series[labels] = Histogram(METRICS[name][2])
+        histogram.observe(value)
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    """Counts MongoDB commands and their time, globally and per request"""
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def _finished(self, event, outcome: str) -> None:
+        seconds = event.duration_micros / 1e6
+        observe("fitdesert_db_command_duration_seconds", (event.command_name, outcome), seconds)
+        stats = _request_stats.get()
+        if stats is not None:
+            with _lock:
+                stats.db_calls += 1
+                stats.db_seconds += seconds
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        self._finished(event, "ok")
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        self._finished(event, "error")
+
+
+command_listener = MongoCommandListener()
+
+
+@contextmanager
+def time_llm(mode: str) -> Iterator[None]:
+    """Time an LLM call (mode: complete | stream) into the LLM metrics and the current request"""
+    outcome = "error"
+    t0 = time.perf_counter()
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        seconds = time.perf_counter() - t0
+        observe("fitdesert_llm_request_duration_seconds", (mode, outcome), seconds)
+        stats = _request_stats.get()
+        if stats is not None:
+            stats.llm_calls += 1
+            stats.llm_seconds += seconds
+
+
+def _server_timing(elapsed: float, stats: RequestStats) -> bytes:
+    return (
+        f'app;dur={elapsed * 1000:.1f}, '
+        f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.db_calls} calls", '
+        f'llm;dur={stats.llm_seconds * 1000:.1f}'
+    ).encode()
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, DB and LLM time per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _request_stats.set(stats)
+        t0 = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", _server_timing(time.perf_counter() - t0, stats)))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - t0
+            _request_stats.reset(token)
+            route = scope.get("route")
+            # unmatched paths share one label instead of one series per URL
+            labels = (scope["method"], getattr(route, "path", "unmatched"))
+            observe("fitdesert_http_request_duration_seconds", (*labels, str(status)), elapsed)
+            observe("fitdesert_http_request_db_calls", labels, stats.db_calls)
+            observe("fitdesert_http_request_db_seconds", labels, stats.db_seconds)
+            observe("fitdesert_http_request_llm_seconds", labels, stats.llm_seconds)
+            if elapsed * 1000 >= SLOW_REQUEST_MS:
+                logger.warning(
+                    "Slow request %s %s: %.0f ms", *labels, elapsed * 1000,
+                    extra={"route": labels[1], "status": status, "duration_ms": round(elapsed * 1000, 1),
+                           "db_calls": stats.db_calls, "db_ms": round(stats.db_seconds * 1000, 1),
+                           "llm_ms": round(stats.llm_seconds * 1000, 1)}
+                )
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def render_metrics() -> str:
+    """All histograms in Prometheus text exposition format"""
+    lines: List[str] = []
+    with _lock:
+        snapshot = {
+            name: [(labels, list(h.counts), h.sum, h.count) for labels, h in series.items()]
+            for name, series in _histograms.items()
+        }
+    for name, (help_text, label_names, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, counts, total, count in sorted(snapshot.get(name, [])):
+            cumulative = 0
+            for bound, n in zip((*buckets, float("inf")), counts):
+                cumulative += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound:g}"'
+                lines.append(f"{name}_bucket{_labels(label_names, labels, le)} {cumulative}")
+            lines.append(f"{name}_sum{_labels(label_names, labels)} {total:.6f}")
+            lines.append(f"{name}_count{_labels(label_names, labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+# attributes every LogRecord has; anything else came from extra={...}
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any extra={...} fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS})
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging() -> None:
+    """Root logging from LOG_LEVEL and LOG_FORMAT (text | json)"""
+    handler = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    logging.basicConfig(level=LOG_LEVEL, handlers=[handler])
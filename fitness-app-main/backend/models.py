@@ -2,6 +2,7 @@ from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
 from enum import Enum
+from id_utils import new_id
 
 # Enums
 class UserRole(str, Enum):
@@ -16,6 +17,9 @@ class MembershipStatus(str, Enum):
     EXPIRED = "expired"
     FROZEN = "frozen"
 
+# Statuses whose members can still use the gym
+CURRENT_MEMBERSHIP_STATUSES = [MembershipStatus.ACTIVE.value, MembershipStatus.EXPIRING_SOON.value]
+
 class PaymentType(str, Enum):
     NEW_MEMBERSHIP = "new_membership"
     RENEWAL = "renewal"
@@ -61,13 +65,13 @@ class UserLogin(BaseModel):
 
 # Gym Models
 class Gym(BaseModel):
-    id: str = Field(default_factory=lambda: f"gym_{datetime.utcnow().timestamp()}")
+    id: str = Field(default_factory=lambda: new_id("gym"))
     name: str
     address: str
     city: str
     state: str
     owner_id: str  # User ID of gym manager
-    qr_code: str  # Base64 encoded QR code
+    qr_code: Optional[str] = None  # Legacy base64 QR; served from /api/gyms/{id}/qr.png
     kyc_verified: bool = False
     is_active: bool = True
     phone: str
@@ -86,10 +90,10 @@ class GymCreate(BaseModel):
 
 # Member (Trainee) Models
 class Member(BaseModel):
-    id: str = Field(default_factory=lambda: f"member_{datetime.utcnow().timestamp()}")
+    id: str = Field(default_factory=lambda: new_id("member"))
     user_id: str  # Reference to User
     gym_id: str
-    photo: Optional[str] = None  # Base64 encoded
+    photo_id: Optional[str] = None  # media_utils id
     contact_info: str
     joining_date: datetime = Field(default_factory=datetime.utcnow)
     membership_plan: str  # Monthly, Quarterly, Yearly
@@ -115,20 +119,29 @@ class MemberCreate(BaseModel):
     height: Optional[float] = None
     weight: Optional[float] = None
     age: Optional[int] = None
-    photo: Optional[str] = None
+    photo_id: Optional[str] = None  # from POST /api/media
+    photo: Optional[str] = None  # base64; still accepted, stored as photo_id
 
 
 # Attendance Models
 class Attendance(BaseModel):
-    id: str = Field(default_factory=lambda: f"att_{datetime.utcnow().timestamp()}")
+    id: str = Field(default_factory=lambda: new_id("att"))
     member_id: str
     gym_id: str
     check_in_time: datetime = Field(default_factory=datetime.utcnow)
     date: str  # YYYY-MM-DD format
 
+class AttendanceEvent(BaseModel):
+    member_id: str
+    gym_id: Optional[str] = None  # defaults to the manager's gym
+    timestamp: datetime  # when the kiosk scanned (UTC if no offset given)
+
+class BulkAttendanceRequest(BaseModel):
+    events: List[AttendanceEvent]
+
 # Payment Models
 class Payment(BaseModel):
-    id: str = Field(default_factory=lambda: f"pay_{datetime.utcnow().timestamp()}")
+    id: str = Field(default_factory=lambda: new_id("pay"))
     member_id: str
     gym_id: str
     amount: float
@@ -160,7 +173,7 @@ class WorkoutDay(BaseModel):
     exercises: List[Exercise]
 
 class WorkoutPlan(BaseModel):
-    id: str = Field(default_factory=lambda: f"workout_{datetime.utcnow().timestamp()}")
+    id: str = Field(default_factory=lambda: new_id("workout"))
     member_id: str
     trainer_id: str
     gym_id: str
@@ -182,7 +195,7 @@ class Meal(BaseModel):
     notes: Optional[str] = None
 
 class DietPlan(BaseModel):
-    id: str = Field(default_factory=lambda: f"diet_{datetime.utcnow().timestamp()}")
+    id: str = Field(default_factory=lambda: new_id("diet"))
     member_id: str
     trainer_id: str
     gym_id: str
@@ -200,13 +213,13 @@ class DietPlanCreate(BaseModel):
 
 # Progress Tracking Models
 class ProgressLog(BaseModel):
-    id: str = Field(default_factory=lambda: f"prog_{datetime.utcnow().timestamp()}")
+    id: str = Field(default_factory=lambda: new_id("prog"))
     member_id: str
     gym_id: str
     weight: Optional[float] = None
     body_fat_percentage: Optional[float] = None
     measurements: Optional[dict] = None  # chest, waist, arms, etc.
-    photos: Optional[List[str]] = None  # Base64 encoded progress photos
+    photo_ids: Optional[List[str]] = None  # media_utils ids
     notes: Optional[str] = None
     logged_date: datetime = Field(default_factory=datetime.utcnow)
 
@@ -214,12 +227,13 @@ class ProgressLogCreate(BaseModel):
     weight: Optional[float] = None
     body_fat_percentage: Optional[float] = None
     measurements: Optional[dict] = None
-    photos: Optional[List[str]] = None
+    photo_ids: Optional[List[str]] = None  # from POST /api/media
+    photos: Optional[List[str]] = None  # base64; still accepted, stored as photo_ids
     notes: Optional[str] = None
 
 # AI Chat Models
 class ChatMessage(BaseModel):
-    id: str = Field(default_factory=lambda: f"chat_{datetime.utcnow().timestamp()}")
+    id: str = Field(default_factory=lambda: new_id("chat"))
     user_id: str
     role: str  # user or assistant
     message: str
@@ -228,3 +242,88 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     message: str
     user_context: Optional[dict] = None  # user's goals, stats, etc.
+
+# Read Models
+# Response shapes for the read endpoints. Every field is optional so a
+# ?fields= subset still validates; routes use response_model_exclude_unset so
+# fields that weren't selected are left out. Photos are media references; the
+# legacy base64 gym qr_code is never returned.
+class GymSummary(BaseModel):
+    id: Optional[str] = None
+    name: Optional[str] = None
+    address: Optional[str] = None
+    city: Optional[str] = None
+    state: Optional[str] = None
+    phone: Optional[str] = None
+    email: Optional[str] = None
+    owner_id: Optional[str] = None
+    kyc_verified: Optional[bool] = None
+    is_active: Optional[bool] = None
+    registration_date: Optional[datetime] = None
+    subscription_plan: Optional[str] = None
+    subscription_expiry: Optional[datetime] = None
+    qr_code_url: Optional[str] = None
+    stats: Optional[dict] = None
+
+class MemberSummary(BaseModel):
+    id: Optional[str] = None
+    user_id: Optional[str] = None
+    user_name: Optional[str] = None
+    user_email: Optional[str] = None
+    gym_id: Optional[str] = None
+    role: Optional[str] = None
+    contact_info: Optional[str] = None
+    joining_date: Optional[datetime] = None
+    membership_plan: Optional[str] = None
+    plan_duration_months: Optional[int] = None
+    membership_expiry: Optional[datetime] = None
+    goal: Optional[str] = None
+    assigned_trainer_id: Optional[str] = None
+    status: Optional[str] = None
+    height: Optional[float] = None
+    weight: Optional[float] = None
+    age: Optional[int] = None
+    photo_id: Optional[str] = None
+    churn_risk: Optional[float] = None
+    engagement: Optional[dict] = None
+
+class AttendanceRecord(BaseModel):
+    id: Optional[str] = None
+    member_id: Optional[str] = None
+    gym_id: Optional[str] = None
+    date: Optional[str] = None
+    check_in_time: Optional[datetime] = None
+    check_out_time: Optional[datetime] = None
+
+class PaymentSummary(BaseModel):
+    id: Optional[str] = None
+    member_id: Optional[str] = None
+    member_name: Optional[str] = None
+    gym_id: Optional[str] = None
+    amount: Optional[float] = None
+    payment_type: Optional[str] = None
+    status: Optional[str] = None
+    razorpay_order_id: Optional[str] = None
+    razorpay_payment_id: Optional[str] = None
+    invoice_number: Optional[str] = None
+    created_at: Optional[datetime] = None
+    payment_date: Optional[datetime] = None
+
+class ProgressLogSummary(BaseModel):
+    id: Optional[str] = None
+    member_id: Optional[str] = None
+    gym_id: Optional[str] = None
+    weight: Optional[float] = None
+    body_fat_percentage: Optional[float] = None
+    measurements: Optional[dict] = None
+    photo_ids: Optional[List[str]] = None
+    notes: Optional[str] = None
+    logged_date: Optional[datetime] = None
+
+class ChatMessageSummary(BaseModel):
+    id: Optional[str] = None
+    user_id: Optional[str] = None
+    role: Optional[str] = None
+    message: Optional[str] = None
+    timestamp: Optional[datetime] = None
+    truncated: Optional[bool] = None
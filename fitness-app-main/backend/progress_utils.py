@@ -0,0 +1,167 @@
+# progress_utils.py
+"""
+Weight and body-fat trends from a member's progress logs.
+
+Only the numeric fields (logged_date, weight, body_fat_percentage) are read.
+Per metric the trend has:
+
+    points          the logged values with a trailing MOVING_AVERAGE_DAYS
+                    average, downsampled with LTTB to at most max_points
+    rate_per_week   least-squares slope of the daily means over the last
+                    RATE_WINDOW_DAYS (None until two different days are logged)
+    projection      the average extended PROJECTION_DAYS along that slope and,
+                    given a target, the date it would be reached
+
+Results are cached per member until their next progress log (or
+PROGRESS_TREND_CACHE_TTL seconds, for logs written by other workers).
+"""
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import numpy as np
+from cachetools import TTLCache
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+MOVING_AVERAGE_DAYS = int(os.environ.get("MOVING_AVERAGE_DAYS", 28))
+RATE_WINDOW_DAYS = int(os.environ.get("RATE_WINDOW_DAYS", 56))
+PROJECTION_DAYS = int(os.environ.get("PROJECTION_DAYS", 90))
+TREND_MAX_POINTS = int(os.environ.get("TREND_MAX_POINTS", 200))
+PROGRESS_TREND_CACHE_TTL = int(os.environ.get("PROGRESS_TREND_CACHE_TTL", 3600))
+
+METRICS = ["weight", "body_fat_percentage"]
+DAY = 86400
+
+# (member_id, max_points, targets) -> trends
+_trend_cache = TTLCache(maxsize=10000, ttl=PROGRESS_TREND_CACHE_TTL)
+
+
+def invalidate_trends(member_id: str) -> None:
+    """Forget a member's cached trends (after a new progress log)"""
+    for key in [k for k in list(_trend_cache.keys()) if k[0] == member_id]:
+        _trend_cache.pop(key, None)
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of the points Largest-Triangle-Three-Buckets keeps (first and last always)"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # interior points split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    keep = np.empty(threshold, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        # the next bucket's mean (the last point for the last bucket)
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+
+def _moving_average(t: np.ndarray, y: np.ndarray, days: int) -> np.ndarray:
+    """Mean of each point and the points logged in the days before it"""
+    cumsum = np.concatenate([[0.0], np.cumsum(y)])
+    first = np.searchsorted(t, t - days * DAY, side="left")
+    last = np.arange(1, len(y) + 1)
+    return (cumsum[last] - cumsum[first]) / (last - first)
+
+
+def _daily_means(t: np.ndarray, y: np.ndarray):
+    """(UTC day numbers, mean value logged that day), one entry per distinct day"""
+    days, index = np.unique(np.floor(t / DAY), return_inverse=True)
+    return days, np.bincount(index, weights=y) / np.bincount(index)
+
+
+def _slope_per_day(t: np.ndarray, y: np.ndarray) -> Optional[float]:
+    """Least-squares slope of the daily means over RATE_WINDOW_DAYS; None with fewer than 2 distinct days"""
+    recent = t >= t[-1] - RATE_WINDOW_DAYS * DAY
+    # one value per day, so logs minutes apart (or a same-day correction)
+    # can't produce a huge slope
+    days, values = _daily_means(t[recent], y[recent])
+    if len(days) < 2:
+        return None
+    return float(np.polyfit(days, values, 1)[0])
+
+
+def _iso(seconds: float) -> str:
+    return datetime.fromtimestamp(seconds, timezone.utc).isoformat()
+
+
+def metric_trend(t: np.ndarray, y: np.ndarray, max_points: int, target: Optional[float] = None) -> dict:
+    """Trend for one metric from epoch-second times and values, both sorted by time"""
+    if len(y) == 0:
+        return {"count": 0, "points": []}
+
+    average = _moving_average(t, y, MOVING_AVERAGE_DAYS)
+    slope = _slope_per_day(t, y)
+    latest = float(average[-1])
+    projection = {
+        "horizon_days": PROJECTION_DAYS, "value": None, "target": target, "reached": None, "eta": None,
+        "on_track": None,
+    }
+    if target is not None:
+        # reached once the average has crossed the target, coming from the first log's side
+        projection["reached"] = bool((target - latest) * np.sign(target - average[0]) <= 0)
+    if slope is not None:
+        projection["value"] = round(latest + slope * PROJECTION_DAYS, 2)
+        if target is not None and not projection["reached"]:
+            days = (target - latest) / slope if slope else -1
+            projection["on_track"] = days > 0
+            if days > 0:
+                projection["eta"] = _iso(t[-1] + days * DAY)
+
+    keep = lttb(t, y, max_points)
+    return {
+        "count": len(y),
+        "latest": float(y[-1]),
+        "moving_average": round(latest, 2),
+        "change": round(float(y[-1] - y[0]), 2),
+        "rate_per_week": round(slope * 7, 3) if slope is not None else None,
+        "projection": projection,
+        "points": [
+            {"date": _iso(t[i]), "value": float(y[i]), "moving_average": round(float(average[i]), 2)}
+            for i in keep
+        ],
+    }
+
+
+def _epoch(when: datetime) -> float:
+    # Mongo returns naive UTC datetimes unless the client is tz_aware
+    return (when if when.tzinfo else when.replace(tzinfo=timezone.utc)).timestamp()
+
+
+async def member_trends(
+    db: AsyncIOMotorDatabase,
+    member_id: str,
+    max_points: int = TREND_MAX_POINTS,
+    targets: Optional[Dict[str, float]] = None
+) -> dict:
+    """Weight and body-fat trends for a member, cached until their next progress log"""
+    targets = targets or {}
+    key = (member_id, max_points, tuple(sorted(targets.items())))
+    cached = _trend_cache.get(key)
+    if cached:
+        return cached
+
+    logs = await db.progress_logs.find(
+        {"member_id": member_id}, {"_id": 0, "logged_date": 1, **{m: 1 for m in METRICS}}
+    ).sort("logged_date", 1).to_list(None)
+
+    trends = {}
+    for metric in METRICS:
+        logged = [(_epoch(log["logged_date"]), log[metric]) for log in logs
+                  if log.get("logged_date") and log.get(metric) is not None]
+        t = np.array([p[0] for p in logged], dtype=float)
+        y = np.array([p[1] for p in logged], dtype=float)
+        trends[metric] = metric_trend(t, y, max_points, targets.get(metric))
+
+    _trend_cache[key] = trends
+    return trends
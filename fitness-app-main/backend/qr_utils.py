@@ -0,0 +1,68 @@
+# qr_utils.py
+import asyncio
+import hashlib
+import io
+import os
+import re
+from pathlib import Path
+from typing import Tuple
+
+import qrcode
+from cachetools import LRUCache
+
+# Rendered gym QR codes are cached in memory and on disk; a gym's QR never
+# changes, so neither cache needs invalidating.
+QR_CACHE_DIR = Path(os.environ.get("QR_CACHE_DIR", Path(__file__).parent / ".qr_cache"))
+QR_MEMORY_CACHE_SIZE = int(os.environ.get("QR_MEMORY_CACHE_SIZE", 256))
+
+_qr_cache = LRUCache(maxsize=QR_MEMORY_CACHE_SIZE)
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_.\-]+$")
+
+
+def gym_qr_payload(gym_id: str) -> str:
+    """Data encoded in a gym's attendance QR code"""
+    return f"fitdesert://gym/{gym_id}/attendance"
+
+
+def gym_qr_url(gym_id: str) -> str:
+    """API path serving a gym's QR code image"""
+    return f"/api/gyms/{gym_id}/qr.png"
+
+
+def _render_png(data: str) -> bytes:
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _load_or_render(gym_id: str) -> bytes:
+    path = QR_CACHE_DIR / f"{gym_id}.png"
+    if path.exists():
+        return path.read_bytes()
+
+    png = _render_png(gym_qr_payload(gym_id))
+    QR_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp_path.write_bytes(png)
+    tmp_path.replace(path)
+    return png
+
+
+async def get_gym_qr_png(gym_id: str) -> Tuple[bytes, str]:
+    """PNG bytes and ETag for a gym's QR code, rendered off the event loop on a cache miss"""
+    if not _SAFE_ID.match(gym_id):
+        raise ValueError(f"Invalid gym id: {gym_id!r}")
+
+    cached = _qr_cache.get(gym_id)
+    if cached:
+        return cached
+
+    png = await asyncio.to_thread(_load_or_render, gym_id)
+    etag = f'"{hashlib.sha1(png).hexdigest()}"'
+    _qr_cache[gym_id] = (png, etag)
+    return png, etag
@@ -0,0 +1,415 @@
+# rollup_utils.py
+"""
+Incrementally maintained rollup collections.
+
+attendance_daily holds one document per gym per day:
+    {_id: "<gym_id>:<YYYY-MM-DD>", gym_id, date, check_ins, check_outs,
+     unique_members, hours: {"<hour>": check_ins}}
+
+Days and hours are both UTC, like the attendance "date" key (check-in times
+themselves are stored in gym-local IST wall-clock time).
+
+payments_monthly holds one document per gym per month (UTC, by created_at):
+    {_id: "<gym_id>:<YYYY-MM>", gym_id, month,
+     days: {"<DD>": {"<status>": {"<payment_type>": {count, amount}}}},
+     mrr, memberships_ending}
+
+A successful membership payment (new or renewal) adds amount / plan months to
+the mrr of every month it covers and counts one membership ending in the month
+after its last. Renewal rate for a month is its successful renewals over the
+memberships ending in it.
+
+Live writes keep them current with atomic $inc upserts; the backfills rebuild
+them from raw data for existing data:
+
+    python -m rollup_utils backfill-attendance [--gym GYM_ID]
+    python -m rollup_utils backfill-payments [--gym GYM_ID]
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReplaceOne, UpdateOne
+
+from db_utils import connect_from_env
+from models import PaymentStatus, PaymentType
+
+ATTENDANCE_ROLLUPS = "attendance_daily"
+
+# Attendance times are stored in gym-local (IST) wall-clock time
+IST_OFFSET = timedelta(hours=5, minutes=30)
+PAYMENT_ROLLUPS = "payments_monthly"
+
+# Payment types that start or extend a membership (and so count toward MRR)
+MEMBERSHIP_PAYMENT_TYPES = [PaymentType.NEW_MEMBERSHIP.value, PaymentType.RENEWAL.value]
+
+
+def attendance_rollup_id(gym_id: str, date: str) -> str:
+    return f"{gym_id}:{date}"
+
+
+async def record_check_in(db: AsyncIOMotorDatabase, gym_id: str, date: str, check_in_time: datetime) -> None:
+    """Count a check-in (its stored IST time) in the gym's daily rollup for a UTC date"""
+    # attendance is unique per (member, gym, date), so every check-in is a new
+    # member for the day
+    hour = (check_in_time - IST_OFFSET).hour
+    await db[ATTENDANCE_ROLLUPS].update_one(
+        {"_id": attendance_rollup_id(gym_id, date)},
+        {
+            "$inc": {"check_ins": 1, "unique_members": 1, f"hours.{hour}": 1},
+            "$setOnInsert": {"gym_id": gym_id, "date": date}
+        },
+        upsert=True
+    )
+
+
+async def record_check_out(db: AsyncIOMotorDatabase, gym_id: str, date: str) -> None:
+    """Count a check-out in the gym's daily rollup"""
+    await db[ATTENDANCE_ROLLUPS].update_one(
+        {"_id": attendance_rollup_id(gym_id, date)},
+        {
+            "$inc": {"check_outs": 1},
+            "$setOnInsert": {"gym_id": gym_id, "date": date}
+        },
+        upsert=True
+    )
+
+
+async def attendance_rollups(db: AsyncIOMotorDatabase, gym_id: str, dates: Iterable[str]) -> Dict[str, dict]:
+    """Daily rollups for a gym keyed by date; days without attendance are zero-filled"""
+    dates = list(dates)
+    docs = await db[ATTENDANCE_ROLLUPS].find(
+        {"_id": {"$in": [attendance_rollup_id(gym_id, d) for d in dates]}}
+    ).to_list(None)
+    by_date = {doc["date"]: doc for doc in docs}
+
+    rollups = {}
+    for date in dates:
+        doc = by_date.get(date, {})
+        rollups[date] = {
+            "check_ins": doc.get("check_ins", 0),
+            "check_outs": doc.get("check_outs", 0),
+            "unique_members": doc.get("unique_members", 0),
+            "hours": {int(h): n for h, n in doc.get("hours", {}).items()},
+        }
+    return rollups
+
+
+async def rebuild_attendance_rollups(
+    db: AsyncIOMotorDatabase,
+    gym_id: Optional[str] = None,
+    dates: Optional[Iterable[str]] = None
+) -> None:
+    """Recompute daily rollups from raw attendance (optionally for one gym / some dates)"""
+    match = {}
+    if gym_id:
+        match["gym_id"] = gym_id
+    if dates is not None:
+        match["date"] = {"$in": list(dates)}
+
+    await db.attendance.aggregate([
+        {"$match": match},
+        # per gym/day/hour first so the hourly histogram can be assembled below
+        {"$group": {
+            "_id": {"gym_id": "$gym_id", "date": "$date", "hour": {"$hour": {
+                "$subtract": ["$check_in_time", int(IST_OFFSET.total_seconds() * 1000)]
+            }}},
+            "check_ins": {"$sum": 1},
+            "check_outs": {"$sum": {"$cond": [{"$ifNull": ["$check_out_time", False]}, 1, 0]}},
+            "members": {"$addToSet": "$member_id"}
+        }},
+        {"$group": {
+            "_id": {"gym_id": "$_id.gym_id", "date": "$_id.date"},
+            "check_ins": {"$sum": "$check_ins"},
+            "check_outs": {"$sum": "$check_outs"},
+            "members": {"$push": "$members"},
+            "hours": {"$push": {"k": {"$toString": "$_id.hour"}, "v": "$check_ins"}}
+        }},
+        {"$project": {
+            "_id": {"$concat": ["$_id.gym_id", ":", "$_id.date"]},
+            "gym_id": "$_id.gym_id",
+            "date": "$_id.date",
+            "check_ins": 1,
+            "check_outs": 1,
+            "unique_members": {"$size": {"$reduce": {
+                "input": "$members",
+                "initialValue": [],
+                "in": {"$setUnion": ["$$value", "$$this"]}
+            }}},
+            "hours": {"$arrayToObject": "$hours"}
+        }},
+        {"$merge": {"into": ATTENDANCE_ROLLUPS, "on": "_id", "whenMatched": "replace", "whenNotMatched": "insert"}}
+    ]).to_list(None)
+
+
+def payment_rollup_id(gym_id: str, month: str) -> str:
+    return f"{gym_id}:{month}"
+
+
+def add_months(month: str, n: int) -> str:
+    """YYYY-MM shifted by n months"""
+    year, mon = map(int, month.split("-"))
+    total = year * 12 + mon - 1 + n
+    return f"{total // 12:04d}-{total % 12 + 1:02d}"
+
+
+def _plan_months(payment: dict) -> int:
+    try:
+        return max(1, int(payment.get("plan_duration_months") or 1))
+    except (TypeError, ValueError):
+        return 1
+
+
+def _add_payment(incs: Dict[str, dict], payment: dict, status: str, sign: int) -> None:
+    """Accumulate the $inc fields (per month) for counting a payment under a status"""
+    month, day = payment["created_at"].strftime("%Y-%m"), payment["created_at"].strftime("%d")
+    amount = float(payment.get("amount") or 0)
+    cell = f"days.{day}.{status}.{payment['payment_type']}"
+
+    def inc(m: str, field: str, value) -> None:
+        incs[m][field] = incs[m].get(field, 0) + value
+
+    inc(month, f"{cell}.count", sign)
+    inc(month, f"{cell}.amount", sign * amount)
+    if status == PaymentStatus.SUCCESS.value and payment["payment_type"] in MEMBERSHIP_PAYMENT_TYPES:
+        months = _plan_months(payment)
+        for k in range(months):
+            inc(add_months(month, k), "mrr", sign * amount / months)
+        inc(add_months(month, months), "memberships_ending", sign)
+
+
+async def _apply_payment_incs(db: AsyncIOMotorDatabase, gym_id: str, incs: Dict[str, dict]) -> None:
+    ops = [
+        UpdateOne(
+            {"_id": payment_rollup_id(gym_id, month)},
+            {"$inc": fields, "$setOnInsert": {"gym_id": gym_id, "month": month}},
+            upsert=True
+        )
+        for month, fields in incs.items() if fields
+    ]
+    if ops:
+        await db[PAYMENT_ROLLUPS].bulk_write(ops, ordered=False)
+
+
+async def record_payment(db: AsyncIOMotorDatabase, payment: dict) -> None:
+    """Count a newly created payment in its gym's monthly rollups"""
+    incs = defaultdict(dict)
+    _add_payment(incs, payment, payment["status"], 1)
+    await _apply_payment_incs(db, payment["gym_id"], incs)
+
+
+async def record_payment_status(db: AsyncIOMotorDatabase, payment: dict, status: str) -> None:
+    """Move a payment (as it was before the update) from its old status to a new one"""
+    if payment["status"] == status:
+        return
+    incs = defaultdict(dict)
+    _add_payment(incs, payment, payment["status"], -1)
+    _add_payment(incs, payment, status, 1)
+    await _apply_payment_incs(db, payment["gym_id"], incs)
+
+
+def months_between(start: date, end: date) -> List[str]:
+    """YYYY-MM for every month from start to end inclusive"""
+    months, month = [], start.strftime("%Y-%m")
+    while month <= end.strftime("%Y-%m"):
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+async def payment_rollups(db: AsyncIOMotorDatabase, gym_id: str, months: Iterable[str]) -> Dict[str, dict]:
+    """Monthly payment rollups for a gym keyed by month; missing months are empty"""
+    months = list(months)
+    docs = await db[PAYMENT_ROLLUPS].find(
+        {"_id": {"$in": [payment_rollup_id(gym_id, m) for m in months]}}
+    ).to_list(None)
+    by_month = {doc["month"]: doc for doc in docs}
+    return {
+        m: {
+            "days": by_month.get(m, {}).get("days", {}),
+            "mrr": by_month.get(m, {}).get("mrr", 0.0),
+            "memberships_ending": by_month.get(m, {}).get("memberships_ending", 0),
+        }
+        for m in months
+    }
+
+
+def _period_start(day: date, period: str) -> date:
+    if period == "week":
+        return day - timedelta(days=day.weekday())
+    if period == "month":
+        return day.replace(day=1)
+    return day
+
+
+def _empty_totals(period_start: date) -> dict:
+    return {
+        "period_start": period_start.isoformat(),
+        "revenue": 0.0,
+        "payments": 0,
+        "by_status": {s.value: {"count": 0, "amount": 0.0} for s in PaymentStatus},
+        "by_type": {t.value: {"count": 0, "amount": 0.0} for t in PaymentType},
+    }
+
+
+async def revenue_totals(db: AsyncIOMotorDatabase, gym_id: str, period: str, start: date, end: date) -> List[dict]:
+    """
+    Payment totals per day / week (from Monday) / month between start and end,
+    zero-filled. revenue and by_type count successful payments; by_status
+    counts all of them.
+    """
+    rollups = await payment_rollups(db, gym_id, months_between(start, end))
+    buckets = {}
+    day = start
+    while day <= end:
+        key = _period_start(day, period)
+        if key not in buckets:
+            buckets[key] = _empty_totals(key)
+        day += timedelta(days=1)
+
+    for month, rollup in rollups.items():
+        year, mon = map(int, month.split("-"))
+        for dd, statuses in rollup["days"].items():
+            day = date(year, mon, int(dd))
+            if not start <= day <= end:
+                continue
+            totals = buckets[_period_start(day, period)]
+            for status, types in statuses.items():
+                for payment_type, cell in types.items():
+                    count, amount = cell.get("count", 0), cell.get("amount", 0.0)
+                    totals["payments"] += count
+                    by_status = totals["by_status"].setdefault(status, {"count": 0, "amount": 0.0})
+                    by_status["count"] += count
+                    by_status["amount"] += amount
+                    if status == PaymentStatus.SUCCESS.value:
+                        totals["revenue"] += amount
+                        by_type = totals["by_type"].setdefault(payment_type, {"count": 0, "amount": 0.0})
+                        by_type["count"] += count
+                        by_type["amount"] += amount
+
+    results = [buckets[key] for key in sorted(buckets)]
+    for totals in results:
+        totals["revenue"] = round(totals["revenue"], 2)
+        for group in (totals["by_status"], totals["by_type"]):
+            for cell in group.values():
+                cell["amount"] = round(cell["amount"], 2)
+    return results
+
+
+async def mrr_report(db: AsyncIOMotorDatabase, gym_id: str, months: int, today: date) -> List[dict]:
+    """MRR, new memberships, renewals and renewal rate for the last n months (oldest first)"""
+    current = today.strftime("%Y-%m")
+    month_keys = [add_months(current, -k) for k in reversed(range(months))]
+    rollups = await payment_rollups(db, gym_id, month_keys)
+
+    report = []
+    for month in month_keys:
+        rollup = rollups[month]
+        success = PaymentStatus.SUCCESS.value
+        counts = defaultdict(int)
+        for statuses in rollup["days"].values():
+            for payment_type, cell in statuses.get(success, {}).items():
+                counts[payment_type] += cell.get("count", 0)
+        renewals = counts[PaymentType.RENEWAL.value]
+        ending = rollup["memberships_ending"]
+        report.append({
+            "month": month,
+            "mrr": round(rollup["mrr"], 2),
+            "new_memberships": counts[PaymentType.NEW_MEMBERSHIP.value],
+            "renewals": renewals,
+            "memberships_ending": ending,
+            # early renewals can land before the month a membership ends, so this can exceed 1
+            "renewal_rate": round(renewals / ending, 4) if ending else None,
+        })
+    return report
+
+
+async def rebuild_payment_rollups(db: AsyncIOMotorDatabase, gym_id: Optional[str] = None) -> int:
+    """Recompute monthly payment rollups from raw payments (optionally for one gym); returns the count"""
+    match = {"gym_id": gym_id} if gym_id else {}
+    month_expr = {"$dateToString": {"format": "%Y-%m", "date": "$created_at"}}
+
+    cells, memberships = await asyncio.gather(
+        db.payments.aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": {
+                    "gym_id": "$gym_id",
+                    "month": month_expr,
+                    "day": {"$dateToString": {"format": "%d", "date": "$created_at"}},
+                    "status": "$status",
+                    "payment_type": "$payment_type"
+                },
+                "count": {"$sum": 1},
+                "amount": {"$sum": "$amount"}
+            }}
+        ]).to_list(None),
+        # successful membership payments per gym/month/plan length, for MRR
+        db.payments.aggregate([
+            {"$match": {**match, "status": PaymentStatus.SUCCESS.value,
+                        "payment_type": {"$in": MEMBERSHIP_PAYMENT_TYPES}}},
+            # payments made before plan_duration_months was stored take the member's plan
+            {"$lookup": {"from": "members", "localField": "member_id", "foreignField": "_id", "as": "member"}},
+            {"$group": {
+                "_id": {
+                    "gym_id": "$gym_id",
+                    "month": month_expr,
+                    "months": {"$ifNull": [
+                        "$plan_duration_months",
+                        {"$ifNull": [{"$arrayElemAt": ["$member.plan_duration_months", 0]}, 1]}
+                    ]}
+                },
+                "count": {"$sum": 1},
+                "amount": {"$sum": "$amount"}
+            }}
+        ]).to_list(None)
+    )
+
+    docs = {}
+
+    def rollup(gym: str, month: str) -> dict:
+        key = payment_rollup_id(gym, month)
+        if key not in docs:
+            docs[key] = {"_id": key, "gym_id": gym, "month": month, "days": {}, "mrr": 0.0, "memberships_ending": 0}
+        return docs[key]
+
+    for row in cells:
+        k = row["_id"]
+        days = rollup(k["gym_id"], k["month"])["days"]
+        days.setdefault(k["day"], {}).setdefault(k["status"], {})[k["payment_type"]] = {
+            "count": row["count"], "amount": float(row["amount"] or 0)
+        }
+    for row in memberships:
+        k = row["_id"]
+        months = _plan_months({"plan_duration_months": k["months"]})
+        for n in range(months):
+            rollup(k["gym_id"], add_months(k["month"], n))["mrr"] += float(row["amount"] or 0) / months
+        rollup(k["gym_id"], add_months(k["month"], months))["memberships_ending"] += row["count"]
+
+    if docs:
+        await db[PAYMENT_ROLLUPS].bulk_write(
+            [ReplaceOne({"_id": key}, doc, upsert=True) for key, doc in docs.items()], ordered=False
+        )
+    await db[PAYMENT_ROLLUPS].delete_many({**match, "_id": {"$nin": list(docs)}})
+    return len(docs)
+
+
+async def _main(args) -> None:
+    db = connect_from_env()
+    if args.command == "backfill-attendance":
+        await rebuild_attendance_rollups(db, gym_id=args.gym)
+        total = await db[ATTENDANCE_ROLLUPS].count_documents({"gym_id": args.gym} if args.gym else {})
+        print(f"✅ {ATTENDANCE_ROLLUPS}: {total} daily rollups")
+    elif args.command == "backfill-payments":
+        total = await rebuild_payment_rollups(db, gym_id=args.gym)
+        print(f"✅ {PAYMENT_ROLLUPS}: {total} monthly rollups")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild rollup collections from raw data")
+    parser.add_argument("command", choices=["backfill-attendance", "backfill-payments"])
+    parser.add_argument("--gym", help="Only rebuild rollups for this gym_id")
+    asyncio.run(_main(parser.parse_args()))
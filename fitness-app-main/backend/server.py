@@ -1,22 +1,45 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Request,Depends, Header
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, APIRouter, HTTPException, Request,Depends, Header, Query, Response, UploadFile, File
+from fastapi.responses import StreamingResponse, FileResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
 import uvicorn
 import os
 import logging
 from pathlib import Path
 from typing import List, Optional
-from datetime import datetime, timezone, timedelta
-import qrcode
-import io
-import base64
-import requests
-from ai_utils import GPTChat
-from datetime import timedelta
-
-IST_OFFSET = timedelta(hours=5, minutes=30)
+from datetime import date, datetime, timezone, timedelta
+import json
+import asyncio
+from ai_utils import GPTChat, ChatStreamInterrupted, close_client as close_ai_client, get_response_cache_stats
+from db_utils import (
+    attach_user_info, attach_member_names, fetch_page, find_sorted, ndjson_response,
+    ensure_indexes, index_usage_report, gym_dashboard_stats, create_mongo_client,
+    parse_fields, fields_projection, select_fields,
+    MAX_PAGE_SIZE, NEXT_CURSOR_HEADER
+)
+from rollup_utils import (
+    attendance_rollups, record_payment, record_payment_status, revenue_totals, mrr_report,
+    add_months, MEMBERSHIP_PAYMENT_TYPES
+)
+from attendance_utils import (
+    resolve_membership, invalidate_membership, record_scan, record_member_check_out, run_idempotent, ingest_events,
+    IST_OFFSET, MAX_BULK_EVENTS
+)
+from qr_utils import get_gym_qr_png, gym_qr_url
+from http_utils import close_http_client
+from id_utils import new_id
+from membership_utils import run_membership_worker, status_for_expiry, MEMBERSHIP_SWEEP_INTERVAL
+from analytics_utils import run_churn_worker, CHURN_SCORE_INTERVAL
+from archive_utils import (
+    archive_cutoff, archived_day_page, member_history, remove_member_archive, run_archive_worker, ARCHIVE_INTERVAL
+)
+from delete_utils import delete_all, delete_gym_cascade, delete_job_status, member_deletes, member_media_ids
+from media_utils import (
+    save_upload, save_base64, save_base64_list, media_file, media_url, remove_unreferenced_media, shutdown_media_pool
+)
+from metrics_utils import MetricsMiddleware, configure_logging, render_metrics
+from progress_utils import invalidate_trends, member_trends, TREND_MAX_POINTS
 
 # Import models
 from models import *
@@ -26,21 +49,8 @@ ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
-import certifi
-
 mongo_url = os.environ['MONGO_URL']
-# Handle both local and Atlas MongoDB connections
-if "mongodb+srv" in mongo_url or "mongodb.net" in mongo_url:
-    # Atlas connection with SSL using certifi certificates
-    client = AsyncIOMotorClient(
-        mongo_url,
-        tlsCAFile=certifi.where(),
-        serverSelectionTimeoutMS=5000,
-        connectTimeoutMS=10000
-    )
-else:
-    # Local MongoDB connection
-    client = AsyncIOMotorClient(mongo_url)
+client = create_mongo_client(mongo_url)
     
 db_name = os.environ.get('DB_NAME', 'fitdesert')
 db = client[db_name]
@@ -53,20 +63,32 @@ RAZORPAY_KEY_SECRET = os.environ.get('RAZORPAY_KEY_SECRET', 'test_secret')
 # Initialize Emergent LLM Key
 EMERGENT_LLM_KEY = os.environ.get('EMERGENT_LLM_KEY', '')
 
+# Bearer token required by /api/metrics when set (scrapers are not app users)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Longest /payments/revenue range (about 5 years)
+MAX_REVENUE_DAYS = int(os.environ.get('MAX_REVENUE_DAYS', 1830))
+
 # Create the main app
 app = FastAPI(title="FitDesert API")
 
 # Create API router
 api_router = APIRouter(prefix="/api")
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Configure logging (LOG_LEVEL, LOG_FORMAT=text|json)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 
+# Route dependencies for gym manager endpoints
+async def current_gym_manager(request: Request) -> User:
+    return await get_current_gym_manager(request, db)
+
+async def manager_gym(user: User = Depends(current_gym_manager)) -> dict:
+    """The calling manager's gym (_id, name, is_active, subscription fields)"""
+    return await get_manager_gym(db, user.id)
+
+
 # ==================== AUTHENTICATION ROUTES ====================
 
 @api_router.post("/auth/register")
@@ -81,7 +103,7 @@ async def register_user(user_data: UserCreate):
     hashed_password = await hash_password(user_data.password)
     
     # Create user document
-    user_id = f"user_{datetime.utcnow().timestamp()}"
+    user_id = new_id("user")
     user_doc = {
         "_id": user_id,
         "email": user_data.email,
@@ -96,7 +118,7 @@ async def register_user(user_data: UserCreate):
     await db.users.insert_one(user_doc)
     
     # Create session
-    session_token = f"session_{user_id}_{datetime.utcnow().timestamp()}"
+    session_token = new_session_token()
     session_doc = {
         "user_id": user_id,
         "session_token": session_token,
@@ -129,7 +151,7 @@ async def login_user(login_data: UserLogin):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     # Create session
-    session_token = f"session_{user_doc['_id']}_{datetime.utcnow().timestamp()}"
+    session_token = new_session_token()
     session_doc = {
         "user_id": user_doc['_id'],
         "session_token": session_token,
@@ -154,23 +176,15 @@ async def login_user(login_data: UserLogin):
 async def get_session_data(x_session_id: str = Header(...)):
     """Get user data from Emergent OAuth session ID"""
     try:
-        # Call Emergent auth service
-        response = requests.get(
-            "https://demobackend.emergentagent.com/auth/v1/env/oauth/session-data",
-            headers={"X-Session-ID": x_session_id}
-        )
-        
-        if response.status_code != 200:
-            raise HTTPException(status_code=401, detail="Invalid session")
-        
-        session_data = response.json()
+        # Call Emergent auth service (pooled, with timeouts and retries)
+        session_data = await fetch_oauth_session(x_session_id)
         
         # Check if user exists
         user_doc = await db.users.find_one({"email": session_data['email']})
         
         if not user_doc:
             # Create new user (default to trainee role for OAuth users)
-            user_id = f"user_{datetime.utcnow().timestamp()}"
+            user_id = new_id("user")
             user_doc = {
                 "_id": user_id,
                 "email": session_data['email'],
@@ -208,6 +222,8 @@ async def get_session_data(x_session_id: str = Header(...)):
             "session_token": session_token
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"OAuth session error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -221,14 +237,11 @@ async def get_current_user_info(request: Request):
 @api_router.post("/auth/logout")
 async def logout_user(request: Request):
     """Logout user and delete session"""
-    session_token = request.cookies.get('session_token')
-    if not session_token:
-        auth_header = request.headers.get('Authorization', '')
-        if auth_header.startswith('Bearer '):
-            session_token = auth_header.replace('Bearer ', '')
+    session_token = get_session_token(request)
     
     if session_token:
         await db.user_sessions.delete_one({"session_token": session_token})
+        invalidate_session(session_token)
     
     return {"message": "Logged out successfully"}
 
@@ -256,12 +269,34 @@ async def change_password(request: Request, old_password: str, new_password: str
             "must_change_password": False
         }}
     )
+    invalidate_user_sessions(user.id)
     
     return {"message": "Password changed successfully"}
 
+@api_router.get("/admin/session-cache")
+async def get_session_cache_info(request: Request):
+    """Session cache hit/miss counters (Head Admin only)"""
+    user = await get_current_head_admin(request, db)
+    return get_session_cache_stats()
+
+@api_router.get("/admin/ai-cache")
+async def get_ai_cache_info(request: Request):
+    """AI response cache hit-rate metrics (Head Admin only)"""
+    user = await get_current_head_admin(request, db)
+    return get_response_cache_stats()
+
+@api_router.get("/admin/indexes")
+async def get_index_report(request: Request):
+    """Index usage statistics for every collection (Head Admin only)"""
+    user = await get_current_head_admin(request, db)
+    return await index_usage_report(db)
+
 
 # ==================== GYM ROUTES ====================
 
+# Gym reads project only GymSummary fields, so the base64 qr_code embedded in
+# gyms created before QR codes were served separately is never shipped
+
 @api_router.post("/gyms/create")
 async def create_gym_by_admin(request: Request, gym_data: GymCreate, owner_email: str, password: str):
     """Create a gym for a user (Head Admin only)"""
@@ -274,7 +309,7 @@ async def create_gym_by_admin(request: Request, gym_data: GymCreate, owner_email
     owner = await db.users.find_one({"email": owner_email})
     if not owner:
         # Create gym manager account
-        owner_id = f"user_{datetime.utcnow().timestamp()}"
+        owner_id = new_id("user")
         owner_doc = {
             "_id": owner_id,
             "email": owner_email,
@@ -291,22 +326,8 @@ async def create_gym_by_admin(request: Request, gym_data: GymCreate, owner_email
     else:
         owner_id = owner['_id']
     
-    # Generate QR code
-    # Reuse gym_id if it already exists
-    gym_id = f"gym_{datetime.utcnow().timestamp()}"
-
-    # Generate QR data (static per gym)
-    qr_data = f"fitdesert://gym/{gym_id}/attendance"
-
-    
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    qr_code_base64 = base64.b64encode(buffer.getvalue()).decode()
+    # QR code is served (and rendered lazily) by /gyms/{gym_id}/qr.png
+    gym_id = new_id("gym")
     
     # Create gym document
     gym_doc = {
@@ -316,7 +337,6 @@ async def create_gym_by_admin(request: Request, gym_data: GymCreate, owner_email
         "city": gym_data.city,
         "state": gym_data.state,
         "owner_id": owner_id,
-        "qr_code": qr_code_base64,
         "kyc_verified": True,
         "is_active": True,
         "phone": gym_data.phone,
@@ -332,7 +352,7 @@ async def create_gym_by_admin(request: Request, gym_data: GymCreate, owner_email
         "message": "Gym created successfully",
         "gym_id": gym_id,
         "owner_email": owner_email,
-        "qr_code": qr_code_base64
+        "qr_code_url": gym_qr_url(gym_id)
     }
 
 @api_router.post("/gyms/register")
@@ -345,18 +365,8 @@ async def register_gym(request: Request, gym_data: GymCreate):
     if existing_gym:
         raise HTTPException(status_code=400, detail="You already have a gym registered")
     
-    # Generate QR code
-    gym_id = f"gym_{datetime.utcnow().timestamp()}"
-    qr_data = f"fitdesert://attendance/{gym_id}"
-    
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(qr_data)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    qr_code_base64 = base64.b64encode(buffer.getvalue()).decode()
+    # QR code is served (and rendered lazily) by /gyms/{gym_id}/qr.png
+    gym_id = new_id("gym")
     
     # Create gym document
     gym_doc = {
@@ -366,7 +376,6 @@ async def register_gym(request: Request, gym_data: GymCreate):
         "city": gym_data.city,
         "state": gym_data.state,
         "owner_id": user.id,
-        "qr_code": qr_code_base64,
         "kyc_verified": False,
         "is_active": True,
         "phone": gym_data.phone,
@@ -381,73 +390,91 @@ async def register_gym(request: Request, gym_data: GymCreate):
     return {
         "message": "Gym registered successfully",
         "gym_id": gym_id,
-        "qr_code": qr_code_base64
+        "qr_code_url": gym_qr_url(gym_id)
     }
 
-@api_router.get("/gyms/my-gym")
-async def get_my_gym(request: Request):
-    """Get gym for current gym manager"""
+def _gyms_transform(fields: List[str]):
+    """NDJSON/page transform attaching stats (only if selected) and the QR URL to gym documents"""
+    async def transform(gyms: List[dict]) -> List[dict]:
+        stats = {}
+        if "stats" in fields:
+            today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+            stats = await gym_dashboard_stats(db, [gym['_id'] for gym in gyms], today)
+        for gym in gyms:
+            gym['id'] = gym.pop('_id')
+            gym['qr_code_url'] = gym_qr_url(gym['id'])
+            if stats:
+                gym['stats'] = stats[gym['id']]
+        return select_fields(gyms, fields)
+    return transform
+
+@api_router.get("/gyms/my-gym", response_model=GymSummary, response_model_exclude_unset=True)
+async def get_my_gym(request: Request, fields: Optional[str] = None):
+    """Get gym for current gym manager (with member/attendance stats)"""
     user = await get_current_gym_manager(request, db)
     
-    gym = await db.gyms.find_one({"owner_id": user.id})
+    fields = parse_fields(fields, GymSummary)
+    gym = await db.gyms.find_one({"owner_id": user.id}, fields_projection(fields))
     if not gym:
         raise HTTPException(status_code=404, detail="No gym found")
     
-    # Get stats
-    total_members = await db.members.count_documents({"gym_id": gym['_id']})
-    active_members = await db.members.count_documents({
-        "gym_id": gym['_id'],
-        "status": MembershipStatus.ACTIVE.value
-    })
-    
-    # Get today's attendance
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    today_attendance = await db.attendance.count_documents({
-        "gym_id": gym['_id'],
-        "date": today
-    })
-    
-    gym['_id'] = gym.pop('_id') if '_id' in gym else gym.get('id')
-    gym['stats'] = {
-        "total_members": total_members,
-        "active_members": active_members,
-        "today_attendance": today_attendance
-    }
-    
-    return gym
+    return (await _gyms_transform(fields)([gym]))[0]
 
-@api_router.get("/gyms/all")
-async def get_all_gyms(request: Request):
-    """Get all gyms (Head Admin only)"""
+@api_router.get("/gyms/all", response_model=List[GymSummary], response_model_exclude_unset=True)
+async def get_all_gyms(
+    request: Request,
+    response: Response,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    fields: Optional[str] = None
+):
+    """
+    Get all gyms (Head Admin only). Paginate with ?after=<X-Next-Cursor>, or ?stream=true for NDJSON.
+    ?fields=name,city,stats returns only those fields.
+    """
     user = await get_current_head_admin(request, db)
     
-    gyms = await db.gyms.find().to_list(1000)
+    fields = parse_fields(fields, GymSummary)
+    projection = fields_projection(fields)
+    if stream:
+        return ndjson_response(find_sorted(db.gyms, {}, after=after, projection=projection), _gyms_transform(fields))
     
-    # Enrich with stats
-    for gym in gyms:
-        total_members = await db.members.count_documents({"gym_id": gym['_id']})
-        active_members = await db.members.count_documents({
-            "gym_id": gym['_id'],
-            "status": MembershipStatus.ACTIVE.value
-        })
-        gym['id'] = gym.pop('_id')
-        gym['stats'] = {
-            "total_members": total_members,
-            "active_members": active_members
-        }
+    gyms, next_cursor = await fetch_page(db.gyms, {}, limit=limit, after=after, projection=projection)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     
-    return gyms
+    # Enrich with stats
+    return await _gyms_transform(fields)(gyms)
 
-@api_router.get("/gyms/{gym_id}")
-async def get_gym_details(request: Request, gym_id: str):
+@api_router.get("/gyms/{gym_id}", response_model=GymSummary, response_model_exclude_unset=True)
+async def get_gym_details(request: Request, gym_id: str, fields: Optional[str] = None):
     """Get gym details"""
     user = await get_current_user(request, db)
     
-    gym = await db.gyms.find_one({"_id": gym_id})
+    fields = parse_fields(fields, GymSummary)
+    gym = await db.gyms.find_one({"_id": gym_id}, fields_projection(fields))
+    if not gym:
+        raise HTTPException(status_code=404, detail="Gym not found")
+    
+    gym['id'] = gym.pop('_id')
+    gym['qr_code_url'] = gym_qr_url(gym_id)
+    return select_fields([gym], fields)[0]
+
+@api_router.get("/gyms/{gym_id}/qr.png")
+async def get_gym_qr_code(request: Request, gym_id: str):
+    """Gym attendance QR code as a cacheable PNG"""
+    user = await get_current_user(request, db)
+    
+    gym = await db.gyms.find_one({"_id": gym_id}, {"_id": 1})
     if not gym:
         raise HTTPException(status_code=404, detail="Gym not found")
     
-    return gym
+    png, etag = await get_gym_qr_png(gym_id)
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=86400"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=png, media_type="image/png", headers=headers)
 
 @api_router.put("/gyms/{gym_id}")
 async def update_gym(request: Request, gym_id: str, gym_data: GymCreate):
@@ -468,6 +495,7 @@ async def update_gym(request: Request, gym_id: str, gym_data: GymCreate):
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Gym not found")
+    invalidate_gym(gym_id)
     
     return {"message": "Gym updated successfully"}
 
@@ -491,6 +519,7 @@ async def update_gym_subscription(request: Request, gym_id: str, plan: str, dura
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Gym not found")
+    invalidate_gym(gym_id)
     
     return {"message": "Subscription updated successfully", "new_expiry": new_expiry}
 
@@ -506,39 +535,52 @@ async def toggle_gym_status(request: Request, gym_id: str, is_active: bool):
     
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Gym not found")
+    invalidate_gym(gym_id)
     
     status = "activated" if is_active else "suspended"
     return {"message": f"Gym {status} successfully"}
 
 @api_router.delete("/gyms/{gym_id}")
-async def delete_gym(request: Request, gym_id: str):
-    """Permanently delete gym (Head Admin only)"""
+async def delete_gym(request: Request, response: Response, gym_id: str):
+    """
+    Permanently delete gym (Head Admin only).
+    Large gyms are deleted by a background job: 202 with a job_id to poll at
+    /admin/delete-jobs/{job_id}.
+    """
     user = await get_current_head_admin(request, db)
     
+    if not await db.gyms.find_one({"_id": gym_id}, {"_id": 1}):
+        raise HTTPException(status_code=404, detail="Gym not found")
+    invalidate_gym(gym_id)
+    
     # Delete gym and all related data
-    await db.gyms.delete_one({"_id": gym_id})
-    await db.members.delete_many({"gym_id": gym_id})
-    await db.attendance.delete_many({"gym_id": gym_id})
-    await db.workout_plans.delete_many({"gym_id": gym_id})
-    await db.diet_plans.delete_many({"gym_id": gym_id})
-    await db.progress_logs.delete_many({"gym_id": gym_id})
-    await db.payments.delete_many({"gym_id": gym_id})
+    job = await delete_gym_cascade(db, gym_id)
+    if job:
+        response.status_code = 202
+        return {
+            "message": "Gym deletion started",
+            "job_id": job["_id"],
+            "status_url": f"/api/admin/delete-jobs/{job['_id']}"
+        }
     
     return {"message": "Gym and all related data deleted successfully"}
 
+@api_router.get("/admin/delete-jobs/{job_id}")
+async def get_delete_job(request: Request, job_id: str):
+    """Progress of a background gym deletion (Head Admin only)"""
+    user = await get_current_head_admin(request, db)
+    
+    job = await delete_job_status(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Delete job not found")
+    return job
+
 
 # ==================== MEMBER ROUTES ====================
 
 @api_router.post("/members")
-async def add_member(request: Request, member_data: MemberCreate):
+async def add_member(member_data: MemberCreate, gym: dict = Depends(manager_gym)):
     """Add a new member (Gym Manager only)"""
-    user = await get_current_gym_manager(request, db)
-    
-    # Get gym
-    gym = await db.gyms.find_one({"owner_id": user.id})
-    if not gym:
-        raise HTTPException(status_code=404, detail="No gym found for this manager")
-    
     # Check if member already exists
     existing_member = await db.users.find_one({"email": member_data.email})
     
@@ -550,10 +592,18 @@ async def add_member(request: Request, member_data: MemberCreate):
         })
         if existing_membership:
             raise HTTPException(status_code=400, detail="User is already a member")
+
+    # Older clients send the photo inline as base64; keep only a reference
+    # (stored once the request is known to be valid)
+    photo_id = member_data.photo_id
+    if member_data.photo and not photo_id:
+        photo_id = await save_base64(db, member_data.photo)
+
+    if existing_member:
         user_id = existing_member['_id']
     else:
         # Create user account for trainee or trainer
-        user_id = f"user_{datetime.utcnow().timestamp()}"
+        user_id = new_id("user")
         hashed_password = await hash_password(member_data.password)
         
         role = UserRole.TRAINER.value if member_data.is_trainer else UserRole.TRAINEE.value
@@ -564,7 +614,7 @@ async def add_member(request: Request, member_data: MemberCreate):
             "name": member_data.name,
             "phone": member_data.phone,
             "role": role,
-            "picture": member_data.photo,
+            "picture": media_url(photo_id) if photo_id else None,
             "password": hashed_password,
             "created_at": datetime.now(timezone.utc),
             "must_change_password": False
@@ -581,13 +631,13 @@ async def add_member(request: Request, member_data: MemberCreate):
 
     
     # Create member document
-    member_id = f"member_{datetime.utcnow().timestamp()}"
+    member_id = new_id("member")
     member_doc = {
         "_id": member_id,
         "user_id": user_id,
         "gym_id": gym['_id'],
         "role": role,
-        "photo": member_data.photo,
+        "photo_id": photo_id,
         "contact_info": member_data.phone,
         "joining_date": datetime.now(timezone.utc),
         "membership_plan": member_data.membership_plan,
@@ -611,48 +661,63 @@ async def add_member(request: Request, member_data: MemberCreate):
 
 
 
-@api_router.get("/trainers")
-async def get_all_trainers(request: Request):
-    """Get all trainers for gym manager"""
-    user = await get_current_gym_manager(request, db)
+def _member_projection(fields: List[str], *required: str) -> dict:
+    """Projection for member response fields; user_name/user_email are joined in via user_id"""
+    joined = {"user_name", "user_email"} & set(fields)
+    return fields_projection(fields, *required, *(["user_id"] if joined else []))
 
-    gym = await db.gyms.find_one({"owner_id": user.id})
-    if not gym:
-        raise HTTPException(status_code=404, detail="No gym found")
+def _members_transform(fields: List[str]):
+    """NDJSON/page transform attaching user name/email (only if selected) to member documents"""
+    async def transform(members: List[dict]) -> List[dict]:
+        if {"user_name", "user_email"} & set(fields):
+            await attach_user_info(db, members)
+        for member in members:
+            member['id'] = member.pop('_id')
+        return select_fields(members, fields)
+    return transform
 
-    trainers_cursor = db.members.find({"gym_id": gym["_id"], "role": UserRole.TRAINER.value})
+@api_router.get("/trainers", response_model=List[MemberSummary], response_model_exclude_unset=True)
+async def get_all_trainers(fields: Optional[str] = None, gym: dict = Depends(manager_gym)):
+    """Get all trainers for gym manager"""
+    fields = parse_fields(fields, MemberSummary)
+    trainers_cursor = db.members.find(
+        {"gym_id": gym["_id"], "role": UserRole.TRAINER.value}, _member_projection(fields)
+    )
     trainers = await trainers_cursor.to_list(100)
 
-    for t in trainers:
-        user_data = await db.users.find_one({"_id": t["user_id"]})
-        if user_data:
-            t["user_name"] = user_data["name"]
-            t["user_email"] = user_data["email"]
-        t["id"] = t.pop("_id")
-    return trainers
-
+    return await _members_transform(fields)(trainers)
 
 
-@api_router.get("/members")
-async def get_all_members(request: Request):
-    """Get all members for gym manager"""
-    user = await get_current_gym_manager(request, db)
-    
-    gym = await db.gyms.find_one({"owner_id": user.id})
-    if not gym:
-        raise HTTPException(status_code=404, detail="No gym found")
+@api_router.get("/members", response_model=List[MemberSummary], response_model_exclude_unset=True)
+async def get_all_members(
+    response: Response,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    fields: Optional[str] = None,
+    sort: Optional[str] = Query(None, pattern="^churn_risk$"),
+    gym: dict = Depends(manager_gym)
+):
+    """
+    Get all members for gym manager. Paginate with ?after=<X-Next-Cursor>, or ?stream=true for NDJSON.
+    ?fields=user_name,status,membership_expiry returns only those fields.
+    ?sort=churn_risk lists the members most likely to lapse first (unscored members last).
+    """
+    fields = parse_fields(fields, MemberSummary)
+    query = {"gym_id": gym['_id']}
+    order = {"sort_field": "churn_risk", "direction": -1} if sort else {}
+    projection = _member_projection(fields, *([order["sort_field"]] if order else []))
+    if stream:
+        return ndjson_response(
+            find_sorted(db.members, query, after=after, projection=projection, **order), _members_transform(fields)
+        )
     
-    members = await db.members.find({"gym_id": gym['_id']}).to_list(1000)
+    members, next_cursor = await fetch_page(db.members, query, limit=limit, after=after, projection=projection, **order)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     
     # Enrich with user data
-    for member in members:
-        user_data = await db.users.find_one({"_id": member['user_id']})
-        if user_data:
-            member['user_name'] = user_data['name']
-            member['user_email'] = user_data['email']
-        member['id'] = member.pop('_id')
-    
-    return members
+    return await _members_transform(fields)(members)
 
 @api_router.get("/members/my-profile")
 async def get_my_profile(request: Request):
@@ -664,44 +729,33 @@ async def get_my_profile(request: Request):
         return {"message": "No membership found", "member": None}
     
     # Get gym details
-    gym = await db.gyms.find_one({"_id": member['gym_id']})
+    gym = await db.gyms.find_one({"_id": member['gym_id']}, {"name": 1})
     
     member['id'] = member.pop('_id')
     member['gym_name'] = gym['name'] if gym else None
-    member['gym_qr'] = gym['qr_code'] if gym else None
+    member['gym_qr_url'] = gym_qr_url(gym['_id']) if gym else None
     
     return member
 
-@api_router.get("/members/{member_id}")
-async def get_member_details(request: Request, member_id: str):
+@api_router.get("/members/{member_id}", response_model=MemberSummary, response_model_exclude_unset=True)
+async def get_member_details(request: Request, member_id: str, fields: Optional[str] = None):
     """Allow gym managers and trainers"""
     user = await get_current_user(request, db)
 
     if user.role not in [UserRole.GYM_MANAGER, UserRole.TRAINER, UserRole.HEAD_ADMIN]:
         raise HTTPException(status_code=403, detail="Access denied")
 
-    member = await db.members.find_one({"_id": member_id})
+    fields = parse_fields(fields, MemberSummary)
+    member = await db.members.find_one({"_id": member_id}, _member_projection(fields))
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
 
-    user_data = await db.users.find_one({"_id": member['user_id']})
-    if user_data:
-        member['user_name'] = user_data['name']
-        member['user_email'] = user_data['email']
-
-    member['id'] = member.pop('_id')
-    return member
+    return (await _members_transform(fields)([member]))[0]
 
 
 @api_router.put("/members/{member_id}")
-async def update_member(request: Request, member_id: str, member_data: MemberCreate):
+async def update_member(member_id: str, member_data: MemberCreate, gym: dict = Depends(manager_gym)):
     """Update member details"""
-    user = await get_current_gym_manager(request, db)
-    
-    gym = await db.gyms.find_one({"owner_id": user.id})
-    if not gym:
-        raise HTTPException(status_code=404, detail="No gym found")
-    
     # Update member
     result = await db.members.update_one(
         {"_id": member_id, "gym_id": gym['_id']},
@@ -722,14 +776,8 @@ async def update_member(request: Request, member_id: str, member_data: MemberCre
     return {"message": "Member updated successfully"}
 
 @api_router.put("/members/{member_id}/assign-trainer")
-async def assign_trainer(request: Request, member_id: str, trainer_id: str):
+async def assign_trainer(member_id: str, trainer_id: str, gym: dict = Depends(manager_gym)):
     """Assign trainer to member"""
-    user = await get_current_gym_manager(request, db)
-    
-    gym = await db.gyms.find_one({"owner_id": user.id})
-    if not gym:
-        raise HTTPException(status_code=404, detail="No gym found")
-    
     result = await db.members.update_one(
         {"_id": member_id, "gym_id": gym['_id']},
         {"$set": {"assigned_trainer_id": trainer_id}}
@@ -741,33 +789,26 @@ async def assign_trainer(request: Request, member_id: str, trainer_id: str):
     return {"message": "Trainer assigned successfully"}
 
 @api_router.delete("/members/{member_id}")
-async def delete_member(request: Request, member_id: str):
+async def delete_member(member_id: str, gym: dict = Depends(manager_gym)):
     """Delete member"""
-    user = await get_current_gym_manager(request, db)
-    
-    gym = await db.gyms.find_one({"owner_id": user.id})
-    if not gym:
-        raise HTTPException(status_code=404, detail="No gym found")
-    
     # Get member to find user_id
     member = await db.members.find_one({"_id": member_id, "gym_id": gym['_id']})
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
     
-    # Delete member and related data
-    await db.members.delete_one({"_id": member_id})
-    await db.attendance.delete_many({"member_id": member_id})
-    await db.workout_plans.delete_many({"member_id": member_id})
-    await db.diet_plans.delete_many({"member_id": member_id})
-    await db.progress_logs.delete_many({"member_id": member_id})
-    await db.payments.delete_many({"member_id": member_id})
+    # Delete member and related data (one transaction where supported)
+    photos = await member_media_ids(db, member_id)
+    await delete_all(db, member_deletes(member_id))
+    await remove_member_archive(member["gym_id"], member_id)
 
     # 🚨 Also delete user from users collection if not part of another gym
     user_id = member["user_id"]
-    other_memberships = await db.members.count_documents({"user_id": user_id})
+    other_memberships = await db.members.count_documents({"user_id": user_id}, limit=1)
     if other_memberships == 0:
-        await db.users.delete_one({"_id": user_id})
-
+        await delete_all(db, [("users", {"_id": user_id}), ("user_sessions", {"user_id": user_id})])
+    invalidate_user_sessions(user_id)
+    invalidate_membership(user_id)
+    await remove_unreferenced_media(db, photos)
     
     return {"message": "Member deleted successfully"}
 
@@ -780,6 +821,7 @@ async def mark_attendance(request: Request):
     Handles trainee attendance via QR scan.
     Extracts gym_id automatically from QR data (e.g., "fitdesert://gym/gym_12345/attendance").
     Detects check-in or check-out automatically.
+    Retries sent with the same Idempotency-Key header get the original result.
     """
     user = await get_current_user(request, db)
 
@@ -792,7 +834,8 @@ async def mark_attendance(request: Request):
     if not qr_code:
         raise HTTPException(status_code=400, detail="QR code missing")
 
-    # Extract gym_id (works for both "fitdesert://gym/gym_1234/attendance" and old formats)
+    # Extract gym_id (works for both "fitdesert://gym/gym_1234/attendance" and old formats;
+    # id_utils ids keep the same digits-and-dot shape)
     import re
     match = re.search(r"gym_(\d+(?:\.\d+)?)", qr_code)
     gym_id = f"gym_{match.group(1)}" if match else None
@@ -800,68 +843,63 @@ async def mark_attendance(request: Request):
     if not gym_id:
         raise HTTPException(status_code=400, detail="Invalid QR code format")
 
-    # ✅ Rest of your logic remains the same
-    gym = await db.gyms.find_one({"_id": gym_id})
-    if not gym:
-        raise HTTPException(status_code=404, detail="Gym not found")
-
     if user.role == UserRole.TRAINER:
         raise HTTPException(status_code=403, detail="Trainers cannot mark attendance")
 
-    member = await db.members.find_one({"user_id": user.id, "gym_id": gym_id})
-    if not member:
-        raise HTTPException(status_code=403, detail="You are not a member of this gym")
+    # ✅ Gym + membership in one cached lookup
+    member = await resolve_membership(db, user.id, gym_id)
 
-    if member["status"] != MembershipStatus.ACTIVE.value:
+    if member["status"] not in CURRENT_MEMBERSHIP_STATUSES:
         raise HTTPException(status_code=400, detail="Membership inactive")
 
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    existing = await db.attendance.find_one({
-        "member_id": member["_id"],
-        "gym_id": gym_id,
-        "date": today
-    })
-    
-    if not existing:
-        attendance_id = f"att_{datetime.utcnow().timestamp()}"
-        await db.attendance.insert_one({
-            "_id": attendance_id,
-            "member_id": member["_id"],
-            "gym_id": gym_id,
-            "check_in_time": datetime.now(timezone.utc) + IST_OFFSET,
-            "check_out_time": None,
-            "date": today
-        })
-        return {"message": "Checked in successfully", "type": "check_in"}
+    async def scan():
+        now = datetime.now(timezone.utc)
+        return await record_scan(db, member["_id"], gym_id, now.strftime("%Y-%m-%d"), now + IST_OFFSET)
 
-    elif existing.get("check_out_time") is None:
-        await db.attendance.update_one(
-            {"_id": existing["_id"]},
-            {"$set": {"check_out_time": datetime.now(timezone.utc)+ IST_OFFSET }}
-        )
-        return {"message": "Checked out successfully", "type": "check_out"}
+    idempotency_key = request.headers.get("Idempotency-Key")
+    return await run_idempotent(f"{user.id}:{idempotency_key}" if idempotency_key else None, scan)
 
-    else:
-        raise HTTPException(status_code=400, detail="Already checked in and out for today")
 
+@api_router.post("/attendance/bulk")
+async def bulk_attendance(payload: BulkAttendanceRequest, gym: dict = Depends(manager_gym)):
+    """
+    Ingest scans buffered by a front-desk kiosk (Gym Manager only).
+    Returns a check_in / check_out / duplicate / rejected result per event.
+    """
+    if len(payload.events) > MAX_BULK_EVENTS:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_EVENTS} events per batch")
+
+    return await ingest_events(db, gym["_id"], payload.events)
 
-@api_router.get("/attendance/my-history")
-async def get_my_attendance_history(request: Request):
-    """Get attendance history for trainee"""
+
+@api_router.get("/attendance/my-history", response_model=List[AttendanceRecord], response_model_exclude_unset=True)
+async def get_my_attendance_history(
+    request: Request,
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    limit: int = Query(30, ge=1, le=MAX_PAGE_SIZE),
+    fields: Optional[str] = None
+):
+    """
+    Get attendance history for trainee, newest first (optionally ?start=/&end=YYYY-MM-DD).
+    Archived months are read from the attendance archive.
+    """
     user = await get_current_trainee(request, db)
     
-    member = await db.members.find_one({"user_id": user.id})
+    fields = parse_fields(fields, AttendanceRecord)
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must be on or before end")
+    member = await db.members.find_one({"user_id": user.id}, {"_id": 1, "gym_id": 1})
     if not member:
         raise HTTPException(status_code=404, detail="No membership found")
     
-    attendance_records = await db.attendance.find({
-        "member_id": member['_id']
-    }).sort("check_in_time", -1).limit(30).to_list(30)
-    
-    for record in attendance_records:
-        record['id'] = record.pop('_id')
+    attendance_records = await member_history(
+        db, member['_id'], member['gym_id'],
+        start=start.isoformat() if start else None, end=end.isoformat() if end else None,
+        limit=limit, projection=fields_projection(fields, "check_in_time")
+    )
     
-    return attendance_records
+    return await _select_transform(fields)(attendance_records)
 
 # @api_router.get("/gym-stats" ,response_model=None)
 # def gym_stats(date: Optional[str] = None, current_user=Depends(get_current_user)):
@@ -892,61 +930,59 @@ async def get_my_attendance_history(request: Request):
 
 
 @api_router.get("/attendance/gym-stats")
-async def get_gym_attendance_stats(request: Request, date: Optional[str] = None):
+async def get_gym_attendance_stats(
+    date: Optional[str] = None,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    gym: dict = Depends(manager_gym)
+):
     """
-    Get attendance stats for gym manager (supports ?date=YYYY-MM-DD)
+    Get attendance stats for gym manager (supports ?date=YYYY-MM-DD).
+    today_records is paginated by check-in time; pass next_cursor back as ?after=
     """
-    user = await get_current_gym_manager(request, db)
-
-    gym = await db.gyms.find_one({"owner_id": user.id})
-    if not gym:
-        raise HTTPException(status_code=404, detail="No gym found")
-
     # 🗓 Handle date filtering correctly
     try:
         if date:
             # Parse provided date to match DB format
-            target_date_obj = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
-            start_of_day = target_date_obj.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_of_day = start_of_day + timedelta(days=1)
+            selected_day = datetime.strptime(date, "%Y-%m-%d").date()
         else:
-            # Default: today's date range
-            start_of_day = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-            end_of_day = start_of_day + timedelta(days=1)
+            # Default: today
+            selected_day = datetime.now(timezone.utc).date()
     except ValueError:
         raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+    selected_date = selected_day.strftime("%Y-%m-%d")
 
-    # ✅ Filter attendance by datetime range (works even if stored as datetime)
-    today_records = await db.attendance.find({
-        "gym_id": gym["_id"],
-        "check_in_time": {"$gte": start_of_day, "$lt": end_of_day}
-    }).to_list(1000)
+    # 📊 Counts come from the daily rollups; the week is the last 7 days including today
+    today = datetime.now(timezone.utc).date()
+    week_dates = [(today - timedelta(days=i)).strftime("%Y-%m-%d") for i in range(7)]
+    rollups = await attendance_rollups(db, gym["_id"], set(week_dates) | {selected_date})
+    day_rollup = rollups[selected_date]
 
-    # 📆 Weekly stats
-    week_ago = datetime.now(timezone.utc) - timedelta(days=7)
-    week_records = await db.attendance.find({
-        "gym_id": gym["_id"],
-        "check_in_time": {"$gte": week_ago}
-    }).to_list(1000)
+    # ✅ Records for the selected day (same "date" key the rollups use)
+    if selected_date < archive_cutoff(today):
+        today_records, next_cursor = await archived_day_page(db, gym["_id"], selected_date, limit, after)
+    else:
+        today_records, next_cursor = await fetch_page(
+            db.attendance,
+            {"gym_id": gym["_id"], "date": selected_date},
+            sort_field="check_in_time", limit=limit, after=after
+        )
 
-    print(f"📅 Final filter range: {start_of_day} → {end_of_day}")
-    print(f"✅ Found {len(today_records)} records")
+    logger.debug("Stats for %s: %d check-ins", selected_date, day_rollup["check_ins"])
 
     return {
-        "selected_date": date or start_of_day.strftime("%Y-%m-%d"),
-        "today_count": len(today_records),
-        "week_count": len(week_records),
+        "selected_date": selected_date,
+        "today_count": day_rollup["check_ins"],
+        "today_check_outs": day_rollup["check_outs"],
+        "today_unique_members": day_rollup["unique_members"],
+        "today_hourly": day_rollup["hours"],
+        "week_count": sum(rollups[d]["check_ins"] for d in week_dates),
         "today_records": today_records,
+        "next_cursor": next_cursor,
     }
 @api_router.put("/members/{member_id}/extend")
-async def extend_member_subscription(request: Request, member_id: str, extra_days: int = 30):
+async def extend_member_subscription(member_id: str, extra_days: int = 30, gym: dict = Depends(manager_gym)):
     """Extend a member's subscription manually"""
-    user = await get_current_gym_manager(request, db)
-
-    gym = await db.gyms.find_one({"owner_id": user.id})
-    if not gym:
-        raise HTTPException(status_code=404, detail="No gym found")
-
     member = await db.members.find_one({"_id": member_id, "gym_id": gym["_id"]})
     if not member:
         raise HTTPException(status_code=404, detail="Member not found")
@@ -955,50 +991,71 @@ async def extend_member_subscription(request: Request, member_id: str, extra_day
         member.get("membership_expiry", datetime.now(timezone.utc)) + timedelta(days=extra_days)
     )
 
+    update = {"membership_expiry": new_expiry}
+    if member.get("status") != MembershipStatus.FROZEN.value:
+        update["status"] = status_for_expiry(new_expiry)
+
     await db.members.update_one(
         {"_id": member_id},
-        {"$set": {"membership_expiry": new_expiry}}
+        {"$set": update}
     )
+    invalidate_membership(member["user_id"])
+
+    return {"message": "Membership extended", "new_expiry": new_expiry, "status": update.get("status", member.get("status"))}
+
+async def _rename_ids(docs: List[dict]) -> List[dict]:
+    """Expose Mongo _id as id on a batch of documents"""
+    for doc in docs:
+        doc["id"] = doc.pop("_id")
+    return docs
+
+def _select_transform(fields: List[str]):
+    """NDJSON/page transform exposing _id as id and keeping only the selected fields"""
+    async def transform(docs: List[dict]) -> List[dict]:
+        return select_fields(await _rename_ids(docs), fields)
+    return transform
+
+@api_router.get("/payments/gym/all", response_model=List[PaymentSummary], response_model_exclude_unset=True)
+async def get_gym_payments(
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    fields: Optional[str] = None,
+    gym: dict = Depends(manager_gym)
+):
+    """Get all payments for gym manager, newest first. Paginate with ?after=<X-Next-Cursor>, or ?stream=true for NDJSON"""
+    fields = parse_fields(fields, PaymentSummary)
+    query = {"gym_id": gym["_id"]}
+    # the cursor is built from created_at, so it is always read
+    projection = fields_projection(fields, "created_at")
+    if stream:
+        return ndjson_response(
+            find_sorted(db.payments, query, sort_field="created_at", direction=-1, after=after, projection=projection),
+            _select_transform(fields)
+        )
 
-    return {"message": "Membership extended", "new_expiry": new_expiry}
-
-@api_router.get("/payments/gym/all")
-async def get_gym_payments(request: Request):
-    """Get all payments for gym manager"""
-    user = await get_current_gym_manager(request, db)
-
-    gym = await db.gyms.find_one({"owner_id": user.id})
-    if not gym:
-        raise HTTPException(status_code=404, detail="No gym found")
-
-    payments = await db.payments.find({"gym_id": gym["_id"]}).sort("created_at", -1).to_list(100)
-    for p in payments:
-        p["id"] = p.pop("_id")
-    return payments
+    payments, next_cursor = await fetch_page(
+        db.payments, query, sort_field="created_at", direction=-1, limit=limit, after=after, projection=projection
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return await _select_transform(fields)(payments)
 
-@api_router.get("/payments/gym-payments")
-async def get_gym_payments(request: Request):
+@api_router.get("/payments/gym-payments", response_model=List[PaymentSummary], response_model_exclude_unset=True)
+async def get_gym_payments(fields: Optional[str] = None, gym: dict = Depends(manager_gym)):
     """Get all successful payments for the gym manager"""
-    user = await get_current_gym_manager(request, db)
-
-    gym = await db.gyms.find_one({"owner_id": user.id})
-    if not gym:
-        raise HTTPException(status_code=404, detail="No gym found")
-
+    fields = parse_fields(fields, PaymentSummary)
     payments = await db.payments.find({
         "gym_id": gym["_id"],
         "status": PaymentStatus.SUCCESS.value
-    }).sort("created_at", -1).limit(100).to_list(100)
+    }, fields_projection(fields, "member_id")).sort("created_at", -1).limit(100).to_list(100)
 
     # attach member names
-    for p in payments:
-        member = await db.members.find_one({"_id": p["member_id"]})
-        if member:
-            user_doc = await db.users.find_one({"_id": member["user_id"]})
-            p["member_name"] = user_doc["name"] if user_doc else "Unknown"
-        p["id"] = p.pop("_id")
+    if "member_name" in fields:
+        await attach_member_names(db, payments)
 
-    return payments
+    return await _select_transform(fields)(payments)
 
 @api_router.post("/attendance/checkout")
 async def checkout_attendance(request: Request, gym_id: str):
@@ -1009,22 +1066,16 @@ async def checkout_attendance(request: Request, gym_id: str):
     if user.role == UserRole.TRAINER:
         raise HTTPException(status_code=403, detail="Trainers do not mark attendance")
 
-    # Find today's attendance record
-    today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    attendance = await db.attendance.find_one({
-        "gym_id": gym_id,
-        "member_id": f"member_{user.id}",
-        "date": today
-    })
+    member = await resolve_membership(db, user.id, gym_id)
 
-    if not attendance:
-        raise HTTPException(status_code=404, detail="No check-in record found for today")
-
-    # Update with checkout time
-    await db.attendance.update_one(
-        {"_id": attendance["_id"]},
-        {"$set": {"check_out_time": datetime.now(timezone.utc)}}
-    )
+    # Same conditional write as a check-out scan
+    now = datetime.now(timezone.utc)
+    today = now.strftime("%Y-%m-%d")
+    if not await record_member_check_out(db, member["_id"], gym_id, today, now + IST_OFFSET):
+        key = {"member_id": member["_id"], "gym_id": gym_id, "date": today}
+        if not await db.attendance.find_one(key, {"_id": 1}):
+            raise HTTPException(status_code=404, detail="No check-in record found for today")
+        raise HTTPException(status_code=400, detail="Already checked out for today")
 
     return {"message": "Checkout recorded successfully"}
 
@@ -1042,7 +1093,7 @@ async def create_payment_order(request: Request, payment_data: PaymentCreate):
         raise HTTPException(status_code=404, detail="Member not found")
     
     # Create payment record
-    payment_id = f"pay_{datetime.utcnow().timestamp()}"
+    payment_id = new_id("pay")
     payment_doc = {
         "_id": payment_id,
         "member_id": payment_data.member_id,
@@ -1052,13 +1103,17 @@ async def create_payment_order(request: Request, payment_data: PaymentCreate):
         "status": PaymentStatus.SUCCESS.value,
         "created_at": datetime.now(timezone.utc)
     }
+    # plan length at payment time, so MRR can spread the amount over it
+    if payment_doc["payment_type"] in MEMBERSHIP_PAYMENT_TYPES:
+        payment_doc["plan_duration_months"] = member.get("plan_duration_months") or 1
     
     # For testing, we'll create a mock order
     # In production, use: razorpay_client.order.create({...})
-    order_id = f"order_{datetime.utcnow().timestamp()}"
+    order_id = new_id("order")
     payment_doc['razorpay_order_id'] = order_id
     
     await db.payments.insert_one(payment_doc)
+    await record_payment(db, payment_doc)
     
     return {
         "order_id": order_id,
@@ -1077,7 +1132,7 @@ async def verify_payment(
     # In production, verify signature using razorpay_client.utility.verify_payment_signature
     
     # Update payment record
-    await db.payments.update_one(
+    payment = await db.payments.find_one_and_update(
         {"_id": payment_id},
         {
             "$set": {
@@ -1086,41 +1141,77 @@ async def verify_payment(
                 "status": PaymentStatus.SUCCESS.value,
                 "payment_date": datetime.now(timezone.utc)
             }
-        }
+        },
+        return_document=ReturnDocument.BEFORE
     )
+    # Move it to "success" in the revenue rollups only on the first verification
+    if payment:
+        await record_payment_status(db, payment, PaymentStatus.SUCCESS.value)
     
     return {"message": "Payment verified successfully"}
 
-@api_router.get("/payments/my-payments")
-async def get_my_payments(request: Request):
+@api_router.get("/payments/revenue")
+async def get_revenue(
+    period: str = Query("month", pattern="^(day|week|month)$"),
+    start: Optional[date] = None,
+    end: Optional[date] = None,
+    gym: dict = Depends(manager_gym)
+):
+    """
+    Revenue per day / week / month for the gym manager, by payment type and status.
+    Defaults to the last 30 days, 12 weeks or 12 months.
+    """
+    end = end or datetime.now(timezone.utc).date()
+    if not start:
+        start = {
+            "day": end - timedelta(days=29),
+            "week": end - timedelta(weeks=11, days=end.weekday()),
+            "month": date.fromisoformat(f"{add_months(end.strftime('%Y-%m'), -11)}-01")
+        }[period]
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must be on or before end")
+    if (end - start).days > MAX_REVENUE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {MAX_REVENUE_DAYS} days")
+    
+    return {
+        "period": period,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "totals": await revenue_totals(db, gym["_id"], period, start, end)
+    }
+
+@api_router.get("/payments/revenue/mrr")
+async def get_mrr(months: int = Query(12, ge=1, le=60), gym: dict = Depends(manager_gym)):
+    """Monthly recurring revenue and renewal rate for the last n months (gym manager)"""
+    report = await mrr_report(db, gym["_id"], months, datetime.now(timezone.utc).date())
+    return {"current_mrr": report[-1]["mrr"], "months": report}
+
+@api_router.get("/payments/my-payments", response_model=List[PaymentSummary], response_model_exclude_unset=True)
+async def get_my_payments(request: Request, fields: Optional[str] = None):
     """Get payment history for trainee"""
     user = await get_current_trainee(request, db)
     
-    member = await db.members.find_one({"user_id": user.id})
+    fields = parse_fields(fields, PaymentSummary)
+    member = await db.members.find_one({"user_id": user.id}, {"_id": 1})
     if not member:
         raise HTTPException(status_code=404, detail="No membership found")
     
     payments = await db.payments.find({
         "member_id": member['_id']
-    }).sort("created_at", -1).to_list(100)
-    
-    for payment in payments:
-        payment['id'] = payment.pop('_id')
+    }, fields_projection(fields)).sort("created_at", -1).to_list(100)
     
-    return payments
+    return await _select_transform(fields)(payments)
 
 
 # ==================== WORKOUT PLAN ROUTES ====================
 
 @api_router.post("/plans/workout")
-async def create_workout_plan(request: Request, plan_data: WorkoutPlanCreate):
+async def create_workout_plan(
+    plan_data: WorkoutPlanCreate,
+    user: User = Depends(current_gym_manager),
+    gym: dict = Depends(manager_gym)
+):
     """Create workout plan (Gym Manager only for Phase 1)"""
-    user = await get_current_gym_manager(request, db)
-    
-    gym = await db.gyms.find_one({"owner_id": user.id})
-    if not gym:
-        raise HTTPException(status_code=404, detail="No gym found")
-    
     # Verify member belongs to this gym
     member = await db.members.find_one({
         "_id": plan_data.member_id,
@@ -1129,7 +1220,7 @@ async def create_workout_plan(request: Request, plan_data: WorkoutPlanCreate):
     if not member:
         raise HTTPException(status_code=404, detail="Member not found in your gym")
     
-    plan_id = f"workout_{datetime.utcnow().timestamp()}"
+    plan_id = new_id("workout")
     plan_doc = {
         "_id": plan_id,
         "member_id": plan_data.member_id,
@@ -1168,14 +1259,12 @@ async def get_my_workout_plan(request: Request):
 # ==================== DIET PLAN ROUTES ====================
 
 @api_router.post("/plans/diet")
-async def create_diet_plan(request: Request, plan_data: DietPlanCreate):
+async def create_diet_plan(
+    plan_data: DietPlanCreate,
+    user: User = Depends(current_gym_manager),
+    gym: dict = Depends(manager_gym)
+):
     """Create diet plan (Gym Manager only for Phase 1)"""
-    user = await get_current_gym_manager(request, db)
-    
-    gym = await db.gyms.find_one({"owner_id": user.id})
-    if not gym:
-        raise HTTPException(status_code=404, detail="No gym found")
-    
     # Verify member belongs to this gym
     member = await db.members.find_one({
         "_id": plan_data.member_id,
@@ -1184,7 +1273,7 @@ async def create_diet_plan(request: Request, plan_data: DietPlanCreate):
     if not member:
         raise HTTPException(status_code=404, detail="Member not found in your gym")
     
-    plan_id = f"diet_{datetime.utcnow().timestamp()}"
+    plan_id = new_id("diet")
     plan_doc = {
         "_id": plan_id,
         "member_id": plan_data.member_id,
@@ -1232,7 +1321,7 @@ async def log_progress(request: Request, progress_data: ProgressLogCreate):
     if not member:
         raise HTTPException(status_code=404, detail="No membership found")
     
-    progress_id = f"prog_{datetime.utcnow().timestamp()}"
+    progress_id = new_id("prog")
     progress_doc = {
         "_id": progress_id,
         "member_id": member['_id'],
@@ -1240,41 +1329,108 @@ async def log_progress(request: Request, progress_data: ProgressLogCreate):
         "weight": progress_data.weight,
         "body_fat_percentage": progress_data.body_fat_percentage,
         "measurements": progress_data.measurements,
-        "photos": progress_data.photos,
+        "photo_ids": (progress_data.photo_ids or []) + await save_base64_list(db, progress_data.photos),
         "notes": progress_data.notes,
         "logged_date": datetime.now(timezone.utc)
     }
     
     await db.progress_logs.insert_one(progress_doc)
+    invalidate_trends(member['_id'])
     
     return {
         "message": "Progress logged successfully",
         "progress_id": progress_id
     }
 
-@api_router.get("/progress/my-history")
-async def get_my_progress(request: Request):
+@api_router.get("/progress/my-history", response_model=List[ProgressLogSummary], response_model_exclude_unset=True)
+async def get_my_progress(request: Request, fields: Optional[str] = None):
     """Get progress history for trainee"""
     user = await get_current_trainee(request, db)
     
-    member = await db.members.find_one({"user_id": user.id})
+    fields = parse_fields(fields, ProgressLogSummary)
+    member = await db.members.find_one({"user_id": user.id}, {"_id": 1})
     if not member:
         raise HTTPException(status_code=404, detail="No membership found")
     
     progress_logs = await db.progress_logs.find({
         "member_id": member['_id']
-    }).sort("logged_date", -1).limit(50).to_list(50)
-    
-    for log in progress_logs:
-        log['id'] = log.pop('_id')
+    }, fields_projection(fields)).sort("logged_date", -1).limit(50).to_list(50)
     
-    return progress_logs
+    return await _select_transform(fields)(progress_logs)
 
+@api_router.get("/progress/trends")
+async def get_my_progress_trends(
+    request: Request,
+    max_points: int = Query(TREND_MAX_POINTS, ge=3, le=1000),
+    target_weight: Optional[float] = Query(None, gt=0),
+    target_body_fat: Optional[float] = Query(None, gt=0, lt=100)
+):
+    """
+    Weight and body-fat trends for trainee: moving average, rate of change and
+    projection (toward ?target_weight= / ?target_body_fat= if given), with the
+    series downsampled to at most max_points.
+    """
+    user = await get_current_trainee(request, db)
+
+    member = await db.members.find_one({"user_id": user.id}, {"_id": 1, "goal": 1})
+    if not member:
+        raise HTTPException(status_code=404, detail="No membership found")
+
+    targets = {"weight": target_weight, "body_fat_percentage": target_body_fat}
+    trends = await member_trends(
+        db, member['_id'], max_points, {k: v for k, v in targets.items() if v is not None}
+    )
+    return {"member_id": member['_id'], "goal": member.get("goal"), **trends}
+
+
+# ==================== MEDIA ROUTES ====================
+
+@api_router.post("/media")
+async def upload_media(request: Request, file: UploadFile = File(...)):
+    """Upload an image (streamed to the media store); returns its id and URLs"""
+    user = await get_current_user(request, db)
+    return await save_upload(db, file)
+
+@api_router.get("/media/{media_id}")
+async def get_media(request: Request, media_id: str, size: Optional[str] = None):
+    """Download a stored image, or its thumbnail with ?size=thumb"""
+    user = await get_current_user(request, db)
+
+    thumbnail = size == "thumb"
+    # media ids are content hashes, so a file never changes
+    etag = f'"{media_id}{"-thumb" if thumbnail else ""}"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    path, content_type = await media_file(db, media_id, thumbnail=thumbnail)
+    return FileResponse(path, media_type=content_type, headers=headers)
 
-# ==================== AI ASSISTANT ROUTES ====================
 
 # ==================== AI ASSISTANT ROUTES ====================
 
+async def _save_chat_exchange(user_id: str, message: str, response: str, truncated: bool = False):
+    """Store a user message and the assistant's reply (flagged if the reply was cut off)"""
+    reply = {
+        "_id": new_id("chat"),
+        "user_id": user_id,
+        "role": "assistant",
+        "message": response,
+        "timestamp": datetime.now(timezone.utc)
+    }
+    if truncated:
+        reply["truncated"] = True
+    await db.chat_messages.insert_many([
+        {
+            "_id": new_id("chat"),
+            "user_id": user_id,
+            "role": "user",
+            "message": message,
+            "timestamp": datetime.now(timezone.utc)
+        },
+        reply
+    ])
+
 @api_router.post("/ai/chat")
 async def ai_chat(request: Request, chat_request: ChatRequest):
     """Chat with AI fitness assistant"""
@@ -1282,45 +1438,81 @@ async def ai_chat(request: Request, chat_request: ChatRequest):
 
     try:
         chat = GPTChat()
-        response = await chat.send_message(chat_request.message)
+        # Replies to personal context aren't shared through the response cache
+        response = await chat.send_message(chat_request.message, use_cache=not chat_request.user_context)
 
         # Save chat to DB (optional)
-        await db.chat_messages.insert_many([
-            {
-                "_id": f"chat_{datetime.utcnow().timestamp()}",
-                "user_id": user.id,
-                "role": "user",
-                "message": chat_request.message,
-                "timestamp": datetime.now(timezone.utc)
-            },
-            {
-                "_id": f"chat_{datetime.utcnow().timestamp()}_ai",
-                "user_id": user.id,
-                "role": "assistant",
-                "message": response,
-                "timestamp": datetime.now(timezone.utc)
-            }
-        ])
+        await _save_chat_exchange(user.id, chat_request.message, response)
 
         return {"response": response, "timestamp": datetime.now(timezone.utc)}
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
 
+@api_router.post("/ai/chat/stream")
+async def ai_chat_stream(request: Request, chat_request: ChatRequest):
+    """
+    Chat with AI fitness assistant over Server-Sent Events.
+    Emits a `data: {"token": ...}` event per token, then `event: done` with the full reply.
+    If the AI service fails mid-reply, `event: error` carries the partial reply instead,
+    which is saved to the history marked truncated.
+    """
+    user = await get_current_user(request, db)
+    chat = GPTChat()
+
+    async def event_stream():
+        tokens = []
+        try:
+            async for token in chat.stream_message(chat_request.message, use_cache=not chat_request.user_context):
+                tokens.append(token)
+                yield f"data: {json.dumps({'token': token})}\n\n"
+        except ChatStreamInterrupted:
+            partial = "".join(tokens).strip()
+            await _save_chat_exchange(user.id, chat_request.message, partial, truncated=True)
+            error = {"detail": "AI reply was interrupted", "response": partial, "truncated": True}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+            return
+
+        response = "".join(tokens).strip()
+        await _save_chat_exchange(user.id, chat_request.message, response)
+        done = {"response": response, "timestamp": datetime.now(timezone.utc).isoformat()}
+        yield f"event: done\ndata: {json.dumps(done)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
-@api_router.get("/ai/chat-history")
-async def get_chat_history(request: Request):
-    """Get chat history for user"""
+
+@api_router.get("/ai/chat-history", response_model=List[ChatMessageSummary], response_model_exclude_unset=True)
+async def get_chat_history(
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    stream: bool = False,
+    fields: Optional[str] = None
+):
+    """Get chat history for user, oldest first. Paginate with ?after=<X-Next-Cursor>, or ?stream=true for NDJSON"""
     user = await get_current_user(request, db)
     
-    messages = await db.chat_messages.find({
-        "user_id": user.id
-    }).sort("timestamp", 1).limit(100).to_list(100)
+    fields = parse_fields(fields, ChatMessageSummary)
+    query = {"user_id": user.id}
+    projection = fields_projection(fields, "timestamp")
+    if stream:
+        return ndjson_response(
+            find_sorted(db.chat_messages, query, sort_field="timestamp", after=after, projection=projection),
+            _select_transform(fields)
+        )
     
-    for msg in messages:
-        msg['id'] = msg.pop('_id')
+    messages, next_cursor = await fetch_page(
+        db.chat_messages, query, sort_field="timestamp", limit=limit, after=after, projection=projection
+    )
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
     
-    return messages
+    return await _select_transform(fields)(messages)
 
 
 # ==================== ROOT ROUTES ====================
@@ -1337,6 +1529,13 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@api_router.get("/metrics")
+async def metrics(authorization: Optional[str] = Header(None)):
+    """Request latency, DB and LLM histograms in Prometheus text format"""
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return Response(render_metrics(), media_type="text/plain; version=0.0.4")
+
 
 # Include router
 app.include_router(api_router)
@@ -1348,11 +1547,51 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER],
 )
 
+# Outermost, so its timings cover every other middleware
+app.add_middleware(MetricsMiddleware)
+
+@app.on_event("startup")
+async def startup_ensure_indexes():
+    try:
+        await ensure_indexes(db)
+    except Exception as e:
+        logger.error(f"Index bootstrap failed: {str(e)}")
+
+membership_worker: Optional[asyncio.Task] = None
+churn_worker: Optional[asyncio.Task] = None
+archive_worker: Optional[asyncio.Task] = None
+
+@app.on_event("startup")
+async def startup_membership_worker():
+    global membership_worker
+    if MEMBERSHIP_SWEEP_INTERVAL > 0:
+        membership_worker = asyncio.create_task(run_membership_worker(db, MEMBERSHIP_SWEEP_INTERVAL))
+
+@app.on_event("startup")
+async def startup_churn_worker():
+    global churn_worker
+    if CHURN_SCORE_INTERVAL > 0:
+        churn_worker = asyncio.create_task(run_churn_worker(db, CHURN_SCORE_INTERVAL))
+
+@app.on_event("startup")
+async def startup_archive_worker():
+    global archive_worker
+    if ARCHIVE_INTERVAL > 0:
+        archive_worker = asyncio.create_task(run_archive_worker(db, ARCHIVE_INTERVAL))
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    for worker in (membership_worker, churn_worker, archive_worker):
+        if worker:
+            worker.cancel()
     client.close()
+    shutdown_password_pool()
+    shutdown_media_pool()
+    await close_ai_client()
+    await close_http_client()
 
 
 @app.get("/")
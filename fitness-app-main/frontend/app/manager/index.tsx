@@ -29,11 +29,13 @@ export default function ManagerDashboard() {
   const [loading, setLoading] = useState(true);
   const [refreshing, setRefreshing] = useState(false);
   const [showQR, setShowQR] = useState(false);
+  const [qrSource, setQrSource] = useState<any>(null);
 
   const loadGymData = async () => {
     try {
       const response = await gymAPI.getMyGym();
       setGym(response.data);
+      setQrSource(await gymAPI.getQrImageSource(response.data.id));
     } catch (error: any) {
       if (error.response?.status === 404) {
         // No gym registered yet
@@ -130,7 +132,7 @@ export default function ManagerDashboard() {
       </View>
 
       {/* QR Code Modal */}
-      {showQR && gym.qr_code && (
+      {showQR && qrSource && (
   <View style={styles.qrModal}>
     <View style={styles.qrModalContent}>
       <TouchableOpacity style={styles.closeButton} onPress={() => setShowQR(false)}>
@@ -146,7 +148,7 @@ export default function ManagerDashboard() {
         <Text style={styles.qrCardTitle}>{gym.name}</Text>
         <View style={styles.qrCardFrame}>
           <Image
-            source={{ uri: `data:image/png;base64,${gym.qr_code}` }}
+            source={qrSource}
             style={styles.qrImage}
             resizeMode="contain"
           />
@@ -62,6 +62,14 @@ export const gymAPI = {
   toggleStatus: (gymId: string, isActive: boolean) => 
     api.put(`/gyms/${gymId}/status?is_active=${isActive}`),
   deleteGym: (gymId: string) => api.delete(`/gyms/${gymId}`),
+  // Image source for the gym's QR code (served as a cacheable PNG)
+  getQrImageSource: async (gymId: string) => {
+    const token = await SecureStore.getItemAsync('session_token');
+    return {
+      uri: `${API_URL}/api/gyms/${gymId}/qr.png`,
+      headers: token ? { Authorization: `Bearer ${token}` } : undefined,
+    };
+  },
 };
 
 // Member API
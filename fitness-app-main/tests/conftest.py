@@ -0,0 +1,8 @@
+import os
+import sys
+
+# backend modules import each other by flat name (import server, from db_utils import ...)
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "backend"))
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
@@ -0,0 +1,58 @@
+"""
+A minimal OpenAI-compatible chat completions server for local testing.
+
+Replies "Eat protein. <prompt>", streamed word by word when stream=true. A
+prompt containing "[interrupt]" streams a few words and then drops the
+connection, like an upstream failure mid-reply. Point the API at it with:
+
+    python tests/fake_openai.py --port 8799
+    OPENAI_BASE_URL=http://127.0.0.1:8799/v1 OPENAI_API_KEY=test uvicorn server:app
+"""
+import argparse
+import json
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+INTERRUPT = "[interrupt]"
+
+
+def _chunk(content: str) -> str:
+    chunk = {
+        "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": 0, "model": "fake",
+        "choices": [{"index": 0, "delta": {"content": content}, "finish_reason": None}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+async def completions(request):
+    body = await request.json()
+    prompt = body["messages"][-1]["content"]
+    reply = f"Eat protein. {prompt}"
+    if not body.get("stream"):
+        return JSONResponse({
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": 0, "model": "fake",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2},
+        })
+
+    async def stream():
+        for i, word in enumerate(reply.split(" ")):
+            if INTERRUPT in prompt and i == 2:
+                raise ConnectionError("upstream dropped the stream")
+            yield _chunk(word + " ")
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+
+app = Starlette(routes=[Route("/v1/chat/completions", completions, methods=["POST"])])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8799)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,87 @@
+"""
+Streaming AI chat against the fake OpenAI server in tests/fake_openai.py:
+a complete reply ends with `event: done`, and an upstream failure mid-reply
+ends with `event: error` and is saved to the chat history marked truncated.
+"""
+import json
+import socket
+import threading
+import time
+
+import pytest
+import uvicorn
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+from openai import AsyncOpenAI
+
+import ai_utils
+import server
+from tests.fake_openai import INTERRUPT, app as fake_openai_app
+
+
+@pytest.fixture(scope="module")
+def fake_openai_url():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    fake = uvicorn.Server(uvicorn.Config(fake_openai_app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=fake.run, daemon=True)
+    thread.start()
+    while not fake.started:
+        time.sleep(0.01)
+    yield f"http://127.0.0.1:{port}/v1"
+    fake.should_exit = True
+    thread.join()
+
+
+@pytest.fixture
+def trainee(monkeypatch, fake_openai_url):
+    monkeypatch.setattr(ai_utils, "client", AsyncOpenAI(api_key="test", base_url=fake_openai_url, max_retries=0))
+    server.db = AsyncMongoMockClient()["fitdesert_test"]
+    client = TestClient(server.app)
+    token = client.post("/api/auth/register", json={
+        "email": "trainee@fitdesert.test", "password": "password123", "name": "Trainee", "role": "trainee",
+    }).json()["session_token"]
+    return client, {"Authorization": f"Bearer {token}"}
+
+
+def events(body: str):
+    """(event name, data) pairs from an SSE body"""
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        parsed.append((lines.get("event", "message"), json.loads(lines["data"])))
+    return parsed
+
+
+def last_reply(client, headers):
+    messages = client.get("/api/ai/chat-history", headers=headers).json()
+    return [m for m in messages if m["role"] == "assistant"][-1]
+
+
+def test_stream_completes_with_done(trainee):
+    client, headers = trainee
+    # user_context skips the shared response cache
+    response = client.post("/api/ai/chat/stream", headers=headers,
+                           json={"message": "how much protein", "user_context": {"goal": "bulk"}})
+    parsed = events(response.text)
+
+    assert [name for name, _ in parsed[:-1]] == ["message"] * len(parsed[:-1])
+    assert parsed[-1][0] == "done"
+    assert parsed[-1][1]["response"] == "Eat protein. how much protein"
+    reply = last_reply(client, headers)
+    assert reply["message"] == "Eat protein. how much protein"
+    assert "truncated" not in reply
+
+
+def test_stream_interrupted_sends_error_and_saves_truncated(trainee):
+    client, headers = trainee
+    response = client.post("/api/ai/chat/stream", headers=headers,
+                           json={"message": f"{INTERRUPT} plan", "user_context": {"goal": "bulk"}})
+    parsed = events(response.text)
+
+    assert [name for name, _ in parsed] == ["message", "message", "error"]
+    assert parsed[-1][1] == {"detail": "AI reply was interrupted", "response": "Eat protein.", "truncated": True}
+    reply = last_reply(client, headers)
+    assert reply["message"] == "Eat protein."
+    assert reply["truncated"] is True
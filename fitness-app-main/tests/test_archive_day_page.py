@@ -0,0 +1,79 @@
+"""
+/attendance/gym-stats records for days before the archive cutoff: rows still
+in MongoDB (not compacted yet) are listed together with archived ones, once
+each and in check-in order across pages.
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import archive_utils
+import server
+
+MANAGER = "archive.manager@fitdesert.test"
+
+
+@pytest.fixture
+def manager(monkeypatch, tmp_path):
+    monkeypatch.setattr(archive_utils, "ARCHIVE_DIR", tmp_path)
+    server.db = AsyncMongoMockClient()["fitdesert_test"]
+    client = TestClient(server.app)
+    token = client.post("/api/auth/register", json={
+        "email": MANAGER, "password": "password123", "name": "Manager", "role": "gym_manager",
+    }).json()["session_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/api/gyms/register", headers=headers, json={
+        "name": "Gym", "address": "1 Test St", "city": "Pune", "state": "MH", "phone": "1", "email": MANAGER,
+    })
+    gym_id = client.get("/api/gyms/my-gym", headers=headers).json()["id"]
+    return client, headers, gym_id
+
+
+def old_day() -> str:
+    """A day in the month before the archive cutoff"""
+    cutoff = datetime.strptime(archive_utils.archive_cutoff(), "%Y-%m-%d")
+    return (cutoff - timedelta(days=20)).strftime("%Y-%m-%d")
+
+
+def rows(gym_id: str, day: str, ids_and_minutes):
+    start = datetime.strptime(day, "%Y-%m-%d") + timedelta(hours=6)
+    return [
+        {"_id": doc_id, "member_id": f"member_{doc_id}", "gym_id": gym_id, "date": day,
+         "check_in_time": start + timedelta(minutes=minute), "check_out_time": None}
+        for doc_id, minute in ids_and_minutes
+    ]
+
+
+def all_records(client, headers, day, limit):
+    ids, after = [], None
+    while True:
+        params = {"date": day, "limit": limit, **({"after": after} if after else {})}
+        response = client.get("/api/attendance/gym-stats", headers=headers, params=params)
+        assert response.status_code == 200
+        body = response.json()
+        ids += [record["_id"] for record in body["today_records"]]
+        after = body["next_cursor"]
+        if not after:
+            return ids
+
+
+def test_uncompacted_old_day_is_read_from_mongodb(manager):
+    client, headers, gym_id = manager
+    day = old_day()
+    asyncio.run(server.db.attendance.insert_many(rows(gym_id, day, [("att_b", 2), ("att_a", 1), ("att_c", 3)])))
+
+    assert all_records(client, headers, day, limit=100) == ["att_a", "att_b", "att_c"]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 100])
+def test_partly_compacted_day_merges_both_sources(manager, limit):
+    client, headers, gym_id = manager
+    day = old_day()
+    # att_b was archived but not yet deleted from MongoDB (a compaction cut short)
+    archive_utils._write_month(gym_id, day[:7], rows(gym_id, day, [("att_a", 1), ("att_b", 2), ("att_d", 4)]))
+    asyncio.run(server.db.attendance.insert_many(rows(gym_id, day, [("att_b", 2), ("att_c", 3), ("att_e", 5)])))
+
+    assert all_records(client, headers, day, limit) == ["att_a", "att_b", "att_c", "att_d", "att_e"]
@@ -0,0 +1,120 @@
+"""
+Attendance check-in / check-out through the API: the attendance record and
+the gym's daily rollup must agree, also when a member's scans race each other
+(turnstile double scans, retries with the same Idempotency-Key).
+"""
+import asyncio
+from collections import Counter
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import server
+from db_utils import ensure_indexes
+
+MANAGER = "attendance.manager@fitdesert.test"
+TRAINEE = "attendance.trainee@fitdesert.test"
+
+
+@pytest.fixture
+def gym():
+    """(client, manager headers, trainee headers, gym_id) for a gym with one trainee"""
+    server.db = AsyncMongoMockClient()["fitdesert_test"]
+    # the unique (member_id, gym_id, date) index the scan upsert relies on
+    asyncio.run(ensure_indexes(server.db))
+    client = TestClient(server.app)
+    token = client.post("/api/auth/register", json={
+        "email": MANAGER, "password": "password123", "name": "Manager", "role": "gym_manager",
+    }).json()["session_token"]
+    manager = {"Authorization": f"Bearer {token}"}
+    client.post("/api/gyms/register", headers=manager, json={
+        "name": "Gym", "address": "1 Test St", "city": "Pune", "state": "MH", "phone": "1", "email": MANAGER,
+    })
+    gym_id = client.get("/api/gyms/my-gym", headers=manager).json()["id"]
+    assert client.post("/api/members", headers=manager, json={
+        "name": "Trainee", "email": TRAINEE, "phone": "1", "password": "password123",
+    }).status_code == 200
+    token = client.post("/api/auth/login", json={"email": TRAINEE, "password": "password123"}).json()["session_token"]
+    return client, manager, {"Authorization": f"Bearer {token}"}, gym_id
+
+
+def attendance_docs():
+    return asyncio.run(server.db.attendance.find().to_list(None))
+
+
+def day_stats(client, manager):
+    return client.get("/api/attendance/gym-stats", headers=manager).json()
+
+
+def test_checkout_after_scan_updates_record_and_rollup(gym):
+    client, manager, trainee, gym_id = gym
+    scan = client.post("/api/attendance/scan", headers=trainee,
+                       json={"qr_code": f"fitdesert://gym/{gym_id}/attendance"})
+    assert scan.json()["type"] == "check_in"
+    assert day_stats(client, manager)["today_check_outs"] == 0
+
+    response = client.post("/api/attendance/checkout", headers=trainee, params={"gym_id": gym_id})
+    assert response.status_code == 200
+
+    [record] = attendance_docs()
+    assert record["check_out_time"] is not None
+    stats = day_stats(client, manager)
+    assert (stats["today_count"], stats["today_check_outs"]) == (1, 1)
+
+    again = client.post("/api/attendance/checkout", headers=trainee, params={"gym_id": gym_id})
+    assert again.status_code == 400
+    assert day_stats(client, manager)["today_check_outs"] == 1
+
+
+def test_checkout_without_check_in(gym):
+    client, manager, trainee, gym_id = gym
+    response = client.post("/api/attendance/checkout", headers=trainee, params={"gym_id": gym_id})
+    assert response.status_code == 404
+    assert day_stats(client, manager)["today_check_outs"] == 0
+
+
+def concurrent_scans(headers_list, gym_id):
+    """Send one scan per headers dict at once; returns the outcome of each"""
+    async def run():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            responses = await asyncio.gather(*[
+                client.post("/api/attendance/scan", headers=headers,
+                            json={"qr_code": f"fitdesert://gym/{gym_id}/attendance"})
+                for headers in headers_list
+            ])
+        return [r.json().get("type") or r.status_code for r in responses]
+    return asyncio.run(run())
+
+
+def test_concurrent_scans_create_one_record(gym):
+    client, manager, trainee, gym_id = gym
+    outcomes = Counter(concurrent_scans([trainee] * 40, gym_id))
+
+    assert outcomes["check_in"] == 1
+    assert outcomes["check_out"] <= 1
+    assert outcomes[400] == 40 - outcomes["check_in"] - outcomes["check_out"]
+
+    [record] = attendance_docs()
+    assert (record["check_out_time"] is not None) == (outcomes["check_out"] == 1)
+    stats = day_stats(client, manager)
+    assert (stats["today_count"], stats["today_check_outs"]) == (1, outcomes["check_out"])
+
+
+def test_scans_with_the_same_idempotency_key_replay_the_first_result(gym):
+    client, manager, trainee, gym_id = gym
+    retry = {**trainee, "Idempotency-Key": "scan-1"}
+    assert set(concurrent_scans([retry] * 20, gym_id)) == {"check_in"}
+    # a later replay still gets the stored check-in instead of checking out
+    assert concurrent_scans([retry], gym_id) == ["check_in"]
+
+    [record] = attendance_docs()
+    assert record["check_out_time"] is None
+    stats = day_stats(client, manager)
+    assert (stats["today_count"], stats["today_check_outs"]) == (1, 0)
+
+    # a new key is a new scan
+    assert concurrent_scans([{**trainee, "Idempotency-Key": "scan-2"}], gym_id) == ["check_out"]
+    assert day_stats(client, manager)["today_check_outs"] == 1
@@ -0,0 +1,103 @@
+"""
+Unit tests for progress_utils: LTTB downsampling, the trailing moving average
+and the weekly rate / goal projection, including logs too close together to
+fit a trend.
+"""
+import numpy as np
+import pytest
+
+from progress_utils import DAY, MOVING_AVERAGE_DAYS, PROJECTION_DAYS, _moving_average, lttb, metric_trend
+
+START = 1_700_006_400.0  # a UTC midnight
+
+
+def days(*offsets):
+    return START + np.array(offsets, dtype=float) * DAY
+
+
+# ==================== LTTB ====================
+
+def test_lttb_keeps_everything_below_threshold():
+    x = np.arange(10, dtype=float)
+    assert lttb(x, x, 10).tolist() == list(range(10))
+    assert lttb(x, x, 50).tolist() == list(range(10))
+    assert lttb(x, x, 2).tolist() == list(range(10))
+
+
+def test_lttb_downsamples_to_threshold_keeping_ends_and_spikes():
+    x = np.arange(1000, dtype=float)
+    y = np.sin(x / 50)
+    y[500] = 10.0
+    keep = lttb(x, y, 100)
+    assert len(keep) == 100
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+    assert 500 in keep
+
+
+# ==================== MOVING AVERAGE ====================
+
+def test_moving_average_is_trailing_over_the_window():
+    t = days(0, 1, 2, MOVING_AVERAGE_DAYS + 2)
+    y = np.array([1.0, 2.0, 3.0, 10.0])
+    # the last point's window (inclusive) reaches back to day 2
+    assert _moving_average(t, y, MOVING_AVERAGE_DAYS).tolist() == [1.0, 1.5, 2.0, 6.5]
+
+
+def test_moving_average_of_irregular_logs():
+    t = days(0, 0.5, 10)
+    y = np.array([80.0, 82.0, 78.0])
+    assert _moving_average(t, y, 1).tolist() == [80.0, 81.0, 78.0]
+
+
+# ==================== RATE AND PROJECTION ====================
+
+def test_steady_loss_projects_rate_and_eta():
+    t = days(*range(0, 29, 7))
+    y = 90.0 - np.arange(len(t))  # 1 kg a week
+    trend = metric_trend(t, y, 200, target=80.0)
+    assert trend["rate_per_week"] == pytest.approx(-1.0)
+    projection = trend["projection"]
+    assert projection["value"] == pytest.approx(trend["moving_average"] - PROJECTION_DAYS / 7, abs=0.01)
+    assert projection["on_track"] is True and projection["reached"] is False
+    assert projection["eta"] > "2023-12-13"  # after the last log
+
+
+def test_moving_away_from_target_is_not_on_track():
+    t = days(0, 7, 14)
+    trend = metric_trend(t, np.array([80.0, 81.0, 82.0]), 200, target=75.0)
+    assert trend["projection"]["on_track"] is False
+    assert trend["projection"]["eta"] is None
+
+
+@pytest.mark.parametrize("offsets", [(0,), (0, 300 / DAY), (0, 0.2, 0.4, 0.6)])
+def test_logs_on_a_single_day_have_no_rate(offsets):
+    """Logs minutes apart used to fit slopes of hundreds of kg a week"""
+    t = days(*offsets)
+    y = np.linspace(80.0, 79.0, len(t))
+    trend = metric_trend(t, y, 200, target=70.0)
+    assert trend["rate_per_week"] is None
+    assert trend["projection"]["value"] is None
+    assert trend["projection"]["eta"] is None
+    assert trend["projection"]["on_track"] is None
+
+
+def test_same_day_correction_does_not_skew_the_rate():
+    t = days(0, 7, 14, 14.01)
+    y = np.array([82.0, 81.0, 85.0, 80.0])  # a typo corrected minutes later
+    # fitted on the daily means 82, 81, 82.5
+    daily = metric_trend(days(0, 7, 14), np.array([82.0, 81.0, 82.5]), 200)
+    assert metric_trend(t, y, 200)["rate_per_week"] == daily["rate_per_week"]
+
+
+def test_reached_target_has_no_eta():
+    t = days(0, 7, 14, 21)
+    # the moving average (73) has crossed the target coming from above
+    trend = metric_trend(t, np.array([80.0, 74.0, 70.0, 68.0]), 200, target=75.0)
+    assert trend["projection"]["reached"] is True
+    assert trend["projection"]["eta"] is None
+
+
+def test_no_logs():
+    empty = np.array([], dtype=float)
+    assert metric_trend(empty, empty, 200) == {"count": 0, "points": []}
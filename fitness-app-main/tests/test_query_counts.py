@@ -0,0 +1,108 @@
+"""
+Query-count regression tests for the manager listing endpoints.
+
+Every read a request makes is reported to a MongoCommandListener (mongomock
+doesn't emit pymongo command events, so the mock collection's read methods
+report them), and each listing must issue the same fixed number of commands
+no matter how many rows it returns: one more per row is an N+1.
+"""
+import asyncio
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient, AsyncMongoMockCollection
+
+import server
+from metrics_utils import MongoCommandListener, _request_stats
+
+# mock collection method -> the MongoDB command it stands for
+READ_COMMANDS = {
+    "find": "find", "find_one": "find", "aggregate": "aggregate", "count_documents": "aggregate",
+    "distinct": "distinct",
+}
+
+
+class CountingListener(MongoCommandListener):
+    """MongoCommandListener that also tallies the commands issued inside requests"""
+
+    def __init__(self):
+        self.commands = Counter()
+
+    def _finished(self, event, outcome: str) -> None:
+        super()._finished(event, outcome)
+        if _request_stats.get() is not None:
+            self.commands[event.command_name] += 1
+
+
+@pytest.fixture
+def listener(monkeypatch):
+    listener = CountingListener()
+    for method, command in READ_COMMANDS.items():
+        original = getattr(AsyncMongoMockCollection, method)
+
+        def reporting(self, *args, _original=original, _command=command, **kwargs):
+            listener.succeeded(SimpleNamespace(command_name=_command, duration_micros=0))
+            return _original(self, *args, **kwargs)
+
+        monkeypatch.setattr(AsyncMongoMockCollection, method, reporting)
+    return listener
+
+
+def seed(rows: int):
+    """A fresh database with one gym holding `rows` members, trainers and payments; returns (client, manager headers)"""
+    server.db = AsyncMongoMockClient()["fitdesert_test"]
+    client = TestClient(server.app)
+    email = f"manager.{rows}@fitdesert.test"
+    token = client.post("/api/auth/register", json={
+        "email": email, "password": "password123", "name": "Manager", "role": "gym_manager",
+    }).json()["session_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    client.post("/api/gyms/register", headers=headers, json={
+        "name": "Gym", "address": "1 Test St", "city": "Pune", "state": "MH", "phone": "1", "email": email,
+    })
+    gym_id = client.get("/api/gyms/my-gym", headers=headers).json()["id"]
+
+    now = datetime.now(timezone.utc)
+    users, members, payments = [], [], []
+    for i in range(rows):
+        users.append({"_id": f"user_{i}", "email": f"member.{i}@fitdesert.test", "name": f"Member {i}",
+                      "role": "trainee", "created_at": now})
+        for role in ("trainee", "trainer"):
+            members.append({"_id": f"member_{role}_{i}", "user_id": f"user_{i}", "gym_id": gym_id, "role": role,
+                            "status": "active", "joining_date": now, "membership_expiry": now + timedelta(days=30)})
+        payments.append({"_id": f"pay_{i}", "member_id": f"member_trainee_{i}", "gym_id": gym_id,
+                         "amount": 1500.0, "payment_type": "renewal", "status": "success", "created_at": now})
+
+    async def insert():
+        await server.db.users.insert_many(users)
+        await server.db.members.insert_many(members)
+        await server.db.payments.insert_many(payments)
+    asyncio.run(insert())
+    return client, headers
+
+
+# endpoint -> (commands per request once the session and manager gym are cached, rows returned per seeded row)
+EXPECTED = {
+    "/api/members": ({"find": 2}, 2),                   # members, their users
+    "/api/trainers": ({"find": 2}, 1),                  # trainers, their users
+    "/api/payments/gym/all": ({"find": 1}, 1),          # payments
+    "/api/payments/gym-payments": ({"find": 1, "aggregate": 1}, 1),  # payments, member names via $lookup
+}
+
+
+@pytest.mark.parametrize("rows", [5, 50])
+@pytest.mark.parametrize("path", list(EXPECTED))
+def test_listing_query_count_is_constant(listener, path, rows):
+    client, headers = seed(rows)
+    # warm the session and manager-gym caches
+    assert client.get(path, headers=headers).status_code == 200
+
+    listener.commands.clear()
+    response = client.get(path, headers=headers)
+    assert response.status_code == 200
+    commands, per_row = EXPECTED[path]
+    assert len(response.json()) == min(rows * per_row, 100)
+    assert dict(listener.commands) == commands